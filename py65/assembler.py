@@ -1,3 +1,5 @@
+import io
+import os
 import re
 
 from py65.utils.addressing import AddressParser
@@ -8,6 +10,9 @@ class Assembler:
         r"^([A-z]{3}[0-7]?\s+" r"\(?\s*)([^,\s\)]+)(\s*[,xXyY\s]*\)?" r"[,xXyY\s]*)$"
     )
 
+    # a normalized operand: the text around its hex digits, and the digits
+    Operand = re.compile(r"^([^$]*)\$([0-9A-F]*)(.*)$")
+
     Addressing = (
         ("zpi", "($00FF)"),
         ("zpx", "$00FF,X"),
@@ -27,6 +32,9 @@ class Assembler:
         ("imm", "#$FF"),
     )
 
+    # (mnemonic, mode) -> opcode for each MPU class, built on first use
+    _opcode_maps = {}
+
     def __init__(self, mpu, address_parser=None):
         """If a configured AddressParser is passed, symbolic addresses
         may be used in the assembly statements.
@@ -37,52 +45,86 @@ class Assembler:
             address_parser = AddressParser()
         self._address_parser = address_parser
 
-        self._addressing = []
-        numchars = mpu.BYTE_WIDTH / 4  # 1 byte = 2 chars in hex
+        self._opcodes = self._opcode_map(mpu)
+
+        # operand forms keyed by the text around the digits, each with its
+        # candidate modes in order of preference as (mode, digits), where
+        # digits is the format's digit pattern: "00FF" for a zero page
+        # address, "FFFF" for an absolute one and "FF" for a single byte
+        self._forms = {}
         for mode, format in self.Addressing:
-            pat = "^" + re.escape(format) + "$"
-            pat = pat.replace("00", "0{%d}" % numchars)
-            pat = pat.replace("FF", "([0-9A-F]{%d})" % numchars)
-            self._addressing.append([mode, re.compile(pat)])
+            if "$" in format:
+                prefix, rest = format.split("$")
+                digits = rest.rstrip(",XY)")
+                key = (prefix, rest[len(digits) :])
+            else:
+                digits = None
+                key = format
+            self._forms.setdefault(key, []).append((mode, digits))
 
-    def assemble(self, statement, pc=0000):
+    @classmethod
+    def _opcode_map(cls, mpu):
+        klass = mpu.__class__
+        opcodes = cls._opcode_maps.get(klass)
+        if opcodes is None:
+            opcodes = {}
+            for opcode, instruction in enumerate(mpu.disassemble):
+                opcodes.setdefault(instruction, opcode)
+            cls._opcode_maps[klass] = opcodes
+        return opcodes
+
+    def assemble(self, statement, pc=0000, zero_page=True):
         """Assemble the given assembly language statement.  If the statement
         uses relative addressing, the program counter (pc) must also be given.
-        The result is a list of bytes.  Raises when assembly fails.
+        If zero_page is false, absolute addressing is used even for zero page
+        addresses.  The result is a list of bytes.  Raises when assembly fails.
         """
         opcode, operand = self.normalize_and_split(statement)
 
-        for mode, pattern in self._addressing:
-            match = pattern.match(operand)
-
-            if match:
-                # check if opcode supports this addressing mode
-                try:
-                    bytes = [self._mpu.disassemble.index((opcode, mode))]
-                except ValueError:
-                    continue
-
-                operands = match.groups()
+        match = self.Operand.match(operand)
+        if match:
+            prefix, hexdigits, suffix = match.groups()
+            candidates = self._forms.get((prefix, suffix), ())
+        else:
+            hexdigits = ""
+            candidates = self._forms.get(operand, ())
 
-                if mode == "rel":
-                    # relative branch
-                    absolute = int("".join(operands), 16)
-                    relative = (absolute - pc) - 2
-                    relative = relative & self._mpu.byteMask
-                    operands = [self._mpu.BYTE_FORMAT % relative]
+        numchars = self._mpu.BYTE_WIDTH // 4  # 1 byte = 2 chars in hex
+        for mode, digits in candidates:
+            # check if opcode supports this addressing mode
+            code = self._opcodes.get((opcode, mode))
+            if code is None:
+                continue
 
-                elif len(operands) == 2:
-                    # swap bytes
-                    operands = (operands[1], operands[0])
+            if digits is None:
+                operands = []
+            elif len(hexdigits) != len(digits) // 2 * numchars:
+                continue
+            elif digits == "FF":
+                operands = [int(hexdigits, 16)]
+            elif digits == "00FF":
+                if not zero_page or hexdigits[:numchars] != "0" * numchars:
+                    continue
+                operands = [int(hexdigits[numchars:], 16)]
+            elif mode == "rel":
+                # relative branch
+                absolute = int(hexdigits, 16)
+                relative = (absolute - pc) - 2
+                operands = [relative & self._mpu.byteMask]
+            else:
+                # low byte first
+                operands = [
+                    int(hexdigits[numchars:], 16),
+                    int(hexdigits[:numchars], 16),
+                ]
 
-                operands = [int(hex, 16) for hex in operands]
-                bytes.extend(operands)
+            bytes = [code] + operands
 
-                # raise if the assembled bytes would exceed top of memory
-                if (pc + len(bytes)) > (2**self._mpu.ADDR_WIDTH):
-                    raise OverflowError
+            # raise if the assembled bytes would exceed top of memory
+            if (pc + len(bytes)) > (2**self._mpu.ADDR_WIDTH):
+                raise OverflowError
 
-                return bytes
+            return bytes
 
         # assembly failed
         raise SyntaxError(statement)
@@ -131,3 +173,512 @@ class Assembler:
         else:
             operand = ""
         return (opcode, operand)
+
+
+# FileAssembler
+
+# NAME = expr, NAME equ expr, *= expr
+_ASSIGNMENT = re.compile(r"^\s*(\*|[A-Za-z_]\w*)\s*(?:=|\.?[eE][qQ][uU]\b)\s*(.*)$")
+
+# a label in the first column, or an indented label ending with a colon
+_LABEL = re.compile(r"^(?:([A-Za-z_]\w*):?|\s+([A-Za-z_]\w*):)(?=\s|$)")
+
+# arguments of a data directive, split at commas outside of quotes
+_ARGUMENT = re.compile(r"""(?:"[^"]*"|'[^']*'|[^,])+""")
+
+_TOKEN = re.compile(r"\s*(\$[0-9A-Fa-f]+|%[01]+|\d+|'.'?|[A-Za-z_]\w*|\S)")
+
+# operand syntax -> normalized operand for Assembler
+_OPERANDS = (
+    (re.compile(r"^\((.+),\s*[xX]\s*\)$"), "($%x,X)"),
+    (re.compile(r"^\((.+)\)\s*,\s*[yY]$"), "($%x),Y"),
+    (re.compile(r"^\((.+)\)$"), "($%x)"),
+    (re.compile(r"^(.+),\s*[xX]$"), "$%x,X"),
+    (re.compile(r"^(.+),\s*[yY]$"), "$%x,Y"),
+    (re.compile(r"^(.+)$"), "$%x"),
+)
+
+
+class _Undefined(Exception):
+    pass
+
+
+class FileAssembler:
+    """Assemble a whole source file, or any sequence of lines, in two
+    passes so that labels may be used before they are defined.
+
+    Each line holds an optional label, then an instruction or directive,
+    then an optional comment starting with a semicolon.  A label starts
+    in the first column or ends with a colon, but a mnemonic in the first
+    column without a colon is an instruction.  Constants are defined with
+    "NAME = expression" or "NAME equ expression", and "*= expression"
+    sets the program counter.  Expressions combine labels, decimal,
+    $hex, %binary and 'c' character numbers and * for the program
+    counter with + - * / and parentheses; <expr or LO(expr) takes the low
+    eight bits and >expr or HI(expr) the next eight, even on the 65Org16.
+    The directives are:
+
+    .org expr                  set the program counter
+    .byte/.db/.text args       emit bytes or the characters of "strings"
+    .word/.dw args             emit words, low byte first
+    .res/.ds count[, fill]     reserve count bytes of fill (default 0)
+    .include "filename"        assemble another file
+    .end                       stop assembling
+
+    The listing directives .list, .nolist, .page and .title are ignored,
+    as are the HXA directives .hexfile, .cpu and .assume and an include
+    of HXA's instruction set macro file i6502.a, so that sources written
+    for HXA like examples/swapcase.asm assemble unchanged.
+
+    Addresses of operands that are not yet defined in the first pass are
+    assembled as absolute, so zero page addresses should be defined
+    before they are used.  Labels defined by the source are added to the
+    labels of the AddressParser.
+    """
+
+    IgnoredDirectives = ("list", "nolist", "page", "title", "hexfile", "cpu", "assume")
+    IgnoredIncludes = ("i6502.a",)
+
+    def __init__(self, mpu, address_parser=None):
+        """If a configured AddressParser is passed, its labels may be used
+        in the source and the labels defined by the source are added to it.
+        """
+        self._mpu = mpu
+
+        if address_parser is None:
+            address_parser = AddressParser(maxwidth=mpu.ADDR_WIDTH)
+        self._address_parser = address_parser
+
+        # operands are handed over as hex numbers, which need no labels
+        self._assembler = Assembler(mpu, AddressParser(maxwidth=mpu.ADDR_WIDTH))
+        self._opcodes = self._assembler._opcodes
+        self._mnemonics = set(mnemonic for mnemonic, mode in self._opcodes)
+
+        self.labels = {}
+        self.segments = []
+
+    def assemble_file(self, filename, origin=0):
+        """Assemble the source file filename.  See assemble()."""
+        return self.assemble(self._read(filename), filename, origin)
+
+    def assemble(self, lines, filename="<source>", origin=0):
+        """Assemble the lines of source, starting at the address origin
+        unless the source sets one.  The result is a list of segments of
+        contiguous code and data as (start address, list of bytes) tuples,
+        which is also kept in the segments attribute.  Raises SyntaxError
+        with the filename and line number when assembly fails.
+        """
+        statements = []
+        self._parse(lines, filename, statements, ())
+
+        self.labels = {}
+        self._zero_page = {}
+        for final in (False, True):
+            self._final = final
+            self._pc = origin
+            self.segments = []
+            for index, statement in enumerate(statements):
+                try:
+                    if not self._statement(index, *statement[3:]):
+                        break
+                except (_Undefined, KeyError, OverflowError, SyntaxError) as exc:
+                    raise self._error(exc, statement)
+
+        self._address_parser.labels.update(self.labels)
+        return self.segments
+
+    def image(self, fill=0):
+        """Return the assembled segments as a single (start address, list
+        of bytes) tuple, with any gaps between them filled with fill.
+        """
+        if not self.segments:
+            return (0, [])
+        start = min(address for address, values in self.segments)
+        end = max(address + len(values) for address, values in self.segments)
+        image = [fill] * (end - start)
+        for address, values in self.segments:
+            offset = address - start
+            image[offset : offset + len(values)] = values
+        return (start, image)
+
+    def binary(self, fill=0):
+        """Return the image as a bytearray.  Bytes wider than eight bits
+        are written with their most significant octet first, as the
+        monitor's load and save commands expect.
+        """
+        start, image = self.image(fill)
+        width = self._mpu.BYTE_WIDTH
+        if width == 8:
+            return bytearray(image)
+        shifts = range(width - 8, -1, -8)
+        return bytearray((value >> shift) & 0xFF for value in image for shift in shifts)
+
+    def intel_hex(self, record_size=16):
+        """Return the segments as a list of Intel HEX records.  Addresses
+        wider than 16 bits get extended linear address records.  Bytes
+        wider than eight bits are written most significant octet first
+        with ";" as the record mark, the variant read by the 65Org16 boot
+        ROM in the examples directory.
+        """
+        width = self._mpu.BYTE_WIDTH
+        mark = ":" if width == 8 else ";"
+        shifts = range(width - 8, -1, -8)
+
+        def record(address, kind, octets):
+            data = bytearray([len(octets), address >> 8, address & 0xFF, kind])
+            data += octets
+            checksum = -sum(data) & 0xFF
+            return mark + "".join("%02X" % octet for octet in data) + "%02X" % checksum
+
+        records = []
+        upper = 0 if self._mpu.ADDR_WIDTH <= 16 else None
+        for start, values in sorted(self.segments):
+            offset = 0
+            while offset < len(values):
+                address = start + offset
+                if address >> 16 != upper:
+                    upper = address >> 16
+                    octets = bytearray([(upper >> 8) & 0xFF, upper & 0xFF])
+                    records.append(record(0, 0x04, octets))
+                count = min(
+                    record_size, len(values) - offset, 0x10000 - address % 0x10000
+                )
+                octets = bytearray(
+                    (value >> shift) & 0xFF
+                    for value in values[offset : offset + count]
+                    for shift in shifts
+                )
+                records.append(record(address & 0xFFFF, 0x00, octets))
+                offset += count
+        records.append(record(0, 0x01, bytearray()))
+        return records
+
+    # Parsing
+
+    def _read(self, filename):
+        with io.open(filename, encoding="latin-1") as f:
+            return f.readlines()
+
+    def _parse(self, lines, filename, statements, including):
+        """Append a (filename, line number, line, label, operation, operand)
+        tuple to statements for each statement in lines, reading included
+        files in place.  The operation is an uppercase mnemonic, a
+        lowercase directive with its dot, "=" or None for a lone label.
+        """
+        for lineno, line in enumerate(lines, 1):
+            text = _strip_comment(line).rstrip()
+            if not text.strip():
+                continue
+            location = (filename, lineno, line.rstrip("\r\n"))
+
+            match = _ASSIGNMENT.match(text)
+            if match:
+                name, expression = match.groups()
+                if name == "*":
+                    statements.append(location + (None, ".org", expression))
+                else:
+                    statements.append(location + (name, "=", expression))
+                continue
+
+            label = None
+            match = _LABEL.match(text)
+            if (
+                match
+                and match.group(1)
+                and not match.group(0).endswith(":")
+                and match.group(1).upper() in self._mnemonics
+            ):
+                match = None  # an instruction written in the first column
+            if match:
+                label = match.group(1) or match.group(2)
+                text = text[match.end() :]
+
+            fields = text.split(None, 1)
+            if not fields:
+                statements.append(location + (label, None, ""))
+                continue
+            operation = fields[0]
+            operand = fields[1].strip() if len(fields) > 1 else ""
+
+            if operation.startswith("."):
+                operation = operation.lower()
+                if operation[1:] in self.IgnoredDirectives:
+                    operation = None
+                elif (
+                    operation == ".include"
+                    and operand.strip("\"'").lower() in self.IgnoredIncludes
+                ):
+                    operation = None
+                elif operation == ".include":
+                    if label is not None:
+                        statements.append(location + (label, None, ""))
+                    try:
+                        included = os.path.join(
+                            os.path.dirname(filename), operand.strip("\"'")
+                        )
+                        if included in including:
+                            raise SyntaxError("Recursive include: %s" % operand)
+                        self._parse(
+                            self._read(included),
+                            included,
+                            statements,
+                            including + (filename,),
+                        )
+                    except (OSError, IOError) as exc:
+                        msg = "Cannot include file: [%d] %s" % (
+                            exc.errno,
+                            exc.strerror,
+                        )
+                        raise self._error(SyntaxError(msg), location)
+                    except SyntaxError as exc:
+                        if exc.filename is None:
+                            exc = self._error(exc, location)
+                        raise exc
+                    continue
+            else:
+                operation = operation.upper()
+            statements.append(location + (label, operation, operand))
+
+    def _error(self, exc, statement):
+        filename, lineno, line = statement[:3]
+        if isinstance(exc, _Undefined):
+            msg = "Label not found: %s" % exc.args[0]
+        elif isinstance(exc, OverflowError):
+            msg = "Overflow error: %s" % line.strip()
+        elif isinstance(exc, KeyError) or exc.args:
+            msg = exc.args[0]  # "Label not found: foo"
+        else:
+            msg = "Syntax error: %s" % line.strip()
+        return SyntaxError(msg, (filename, lineno, None, line))
+
+    # Passes
+
+    def _statement(self, index, label, operation, operand):
+        """Assemble a statement in the current pass.  Returns False when
+        assembly should stop.
+        """
+        if operation == "=":
+            try:
+                self._define(label, self._evaluate(operand))
+            except _Undefined:
+                if self._final:
+                    raise
+            return True
+
+        if label is not None:
+            self._define(label, self._pc)
+
+        if operation is None:
+            pass
+        elif not operation.startswith("."):
+            self._emit(self._instruction(index, operation, operand))
+        elif operation == ".org":
+            self._pc = self._evaluate(operand)
+        elif operation in (".byte", ".db", ".text"):
+            self._emit(self._data(operand, 1))
+        elif operation in (".word", ".dw"):
+            self._emit(self._data(operand, 2))
+        elif operation in (".res", ".ds"):
+            args = _arguments(operand)
+            if len(args) not in (1, 2):
+                raise SyntaxError()
+            count = self._evaluate(args[0])
+            fill = self._evaluate(args[1]) if len(args) == 2 else 0
+            self._emit([fill & self._mpu.byteMask] * count)
+        elif operation == ".end":
+            return False
+        else:
+            raise SyntaxError("Unknown directive: %s" % operation)
+        return True
+
+    def _define(self, label, value):
+        if self._final:
+            self.labels[label] = value
+        elif label in self.labels:
+            raise SyntaxError("Label already defined: %s" % label)
+        else:
+            self.labels[label] = value
+
+    def _instruction(self, index, mnemonic, operand):
+        mpu = self._mpu
+        pc = self._pc
+        forward = False
+
+        if operand in ("", "a", "A"):
+            statement = mnemonic + " " + operand
+
+        elif operand.startswith("#"):
+            value, forward = self._value(operand[1:], 0)
+            if -(mpu.byteMask + 1) <= value < 0:
+                value &= mpu.byteMask
+            statement = "%s #$%x" % (mnemonic, value)
+
+        else:
+            for pattern, format in _OPERANDS:
+                match = pattern.match(operand)
+                if match:
+                    break
+            value, forward = self._value(match.group(1), pc)
+            if value < 0:
+                raise OverflowError(value)
+            statement = mnemonic + " " + format % value
+
+            if self._final and (mnemonic, "rel") in self._opcodes:
+                offset = value - (pc + 2)
+                limit = (mpu.byteMask + 1) // 2
+                if not -limit <= offset < limit:
+                    raise SyntaxError("Branch out of range: %s" % operand)
+
+        try:
+            if self._final:
+                zero_page = self._zero_page.get(index, True)
+                return self._assembler.assemble(statement, pc, zero_page)
+
+            if forward:
+                # size the instruction for an absolute address unless the
+                # opcode only has a zero page mode
+                try:
+                    bytes = self._assembler.assemble(statement, pc, False)
+                    self._zero_page[index] = False
+                    return bytes
+                except SyntaxError:
+                    pass
+            return self._assembler.assemble(statement, pc)
+        except SyntaxError:
+            raise SyntaxError()
+
+    def _data(self, operand, size):
+        values = []
+        mask = self._mpu.byteMask
+        for arg in _arguments(operand):
+            if size == 1 and len(arg) > 1 and arg[0] == arg[-1] == '"':
+                values.extend(ord(char) for char in arg[1:-1])
+                continue
+            value = self._value(arg, 0)[0]
+            if -((mask + 1) ** size) <= value < 0:
+                value &= (mask + 1) ** size - 1
+            for _ in range(size):
+                values.append(value & mask)
+                value >>= self._mpu.BYTE_WIDTH
+            if value:
+                raise OverflowError(arg)
+        return values
+
+    def _emit(self, values):
+        if not values:
+            return
+        end = self._pc + len(values)
+        if end > 2**self._mpu.ADDR_WIDTH:
+            raise OverflowError(end)
+        if self._final:
+            segment = self.segments[-1] if self.segments else None
+            if segment is not None and segment[0] + len(segment[1]) == self._pc:
+                segment[1].extend(values)
+            else:
+                self.segments.append((self._pc, list(values)))
+        self._pc = end
+
+    # Expressions
+
+    def _value(self, text, default):
+        """Evaluate text and return (value, forward), where forward is true
+        if the value is not known yet in the first pass and default was
+        returned instead.
+        """
+        try:
+            return (self._evaluate(text), False)
+        except _Undefined:
+            if self._final:
+                raise
+            return (default, True)
+
+    def _evaluate(self, text):
+        tokens = _TOKEN.findall(text)
+        tokens.reverse()
+        value = self._sum(tokens)
+        if tokens:
+            raise SyntaxError("Bad expression: %s" % text.strip())
+        return value
+
+    def _sum(self, tokens):
+        value = self._product(tokens)
+        while tokens and tokens[-1] in ("+", "-"):
+            if tokens.pop() == "+":
+                value += self._product(tokens)
+            else:
+                value -= self._product(tokens)
+        return value
+
+    def _product(self, tokens):
+        value = self._factor(tokens)
+        while tokens and tokens[-1] in ("*", "/"):
+            if tokens.pop() == "*":
+                value *= self._factor(tokens)
+            else:
+                divisor = self._factor(tokens)
+                if divisor == 0:
+                    raise SyntaxError("Division by zero")
+                value //= divisor
+        return value
+
+    def _factor(self, tokens):
+        if not tokens:
+            raise SyntaxError()
+        token = tokens.pop()
+
+        if token == "-":
+            return -self._factor(tokens)
+        if token == "<":
+            return self._factor(tokens) & 0xFF
+        if token == ">":
+            return (self._factor(tokens) >> 8) & 0xFF
+        if token == "(":
+            value = self._sum(tokens)
+            if not tokens or tokens.pop() != ")":
+                raise SyntaxError()
+            return value
+        if token == "*":
+            return self._pc
+        if token[0] == "$" and len(token) > 1:
+            return int(token[1:], 16)
+        if token[0] == "%" and len(token) > 1:
+            return int(token[1:], 2)
+        if token.isdigit():
+            return int(token)
+        if token[0] == "'" and len(token) > 1:
+            return ord(token[1])
+
+        if token[0].isalpha() or token[0] == "_":
+            if tokens and tokens[-1] == "(" and token.upper() in ("LO", "HI"):
+                value = self._factor(tokens)
+                if token.upper() == "HI":
+                    value >>= 8
+                return value & 0xFF
+            if token in self.labels:
+                return self.labels[token]
+            if token in self._address_parser.labels:
+                return self._address_parser.labels[token]
+            raise _Undefined(token)
+
+        raise SyntaxError()
+
+
+def _strip_comment(line):
+    if ";" not in line:
+        return line
+    if "'" not in line and '"' not in line:
+        return line[: line.index(";")]
+    quote = None
+    for i, char in enumerate(line):
+        if quote is not None:
+            if char == quote:
+                quote = None
+        elif char in "'\"":
+            quote = char
+        elif char == ";":
+            return line[:i]
+    return line
+
+
+def _arguments(operand):
+    return [arg.strip() for arg in _ARGUMENT.findall(operand)]
@@ -0,0 +1,154 @@
+"""Run many independent programs, each on its own MPU, across a pool of
+worker processes.
+
+A Job describes a program: the image to load, where to load and start
+it, when to stop it, and which memory to return.  run_jobs() runs a list
+of jobs and returns one result per job, in order.  Jobs and results are
+plain picklable objects so that they can cross process boundaries.
+"""
+
+import multiprocessing
+import sys
+import traceback
+
+from py65.devices import fastcore
+from py65.devices.mpu65c02 import MPU as CMOS65C02
+from py65.devices.mpu65org16 import MPU as V65Org16
+from py65.devices.mpu6502 import MPU as NMOS6502
+from py65.memory import ObservableMemory
+
+MPUS = {"6502": NMOS6502, "65C02": CMOS65C02, "65Org16": V65Org16}
+
+
+class Job:
+    """A program to run.  image is a sequence of values loaded at address;
+    execution starts at entry, or at the reset vector if entry is None.
+    The program runs until the next instruction is one of stopcodes or is
+    at one of breakpoints, or until max_cycles cycles or max_instructions
+    instructions have run.  With neither budget a program that never
+    stops never returns.
+
+    Values written to putc_addr are captured as output and reads from
+    getc_addr return the values of input in turn, then 0.  dumps is a
+    list of (start, end) address ranges, inclusive, to return from memory
+    when the program stops.
+    """
+
+    def __init__(
+        self,
+        image,
+        address=0x0000,
+        entry=None,
+        mpu="6502",
+        stopcodes=(0x00,),
+        breakpoints=(),
+        max_cycles=None,
+        max_instructions=None,
+        dumps=(),
+        input=b"",
+        putc_addr=0xF001,
+        getc_addr=0xF004,
+        name=None,
+    ):
+        if mpu not in MPUS:
+            raise ValueError("Unknown MPU: %s" % mpu)
+        self.image = image
+        self.address = address
+        self.entry = entry
+        self.mpu = mpu
+        self.stopcodes = tuple(stopcodes)
+        self.breakpoints = tuple(breakpoints)
+        self.max_cycles = max_cycles
+        self.max_instructions = max_instructions
+        self.dumps = list(dumps)
+        self.input = input
+        self.putc_addr = putc_addr
+        self.getc_addr = getc_addr
+        self.name = name
+
+
+def run_job(job):
+    """Run job on a new MPU and return a dict with its name, the final
+    registers, cycles and waiting flag, why it stopped ("stopcode",
+    "breakpoint", "waiting" or "budget"), the output it wrote and a list
+    of the values in each range of job.dumps.  If the job raises an
+    exception, the dict has the formatted traceback as "error" instead.
+    """
+    try:
+        return _run_job(job)
+    except Exception:
+        error = "".join(traceback.format_exception(*sys.exc_info()))
+        return {"name": job.name, "error": error}
+
+
+def run_jobs(jobs, processes=None, chunksize=1):
+    """Run a list of jobs and return their results from run_job(), in the
+    same order.  Jobs are spread over a pool of processes worker
+    processes, one per CPU by default.  With processes=1 the jobs run in
+    this process without a pool.
+    """
+    jobs = list(jobs)
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = min(processes, len(jobs))
+    if processes <= 1:
+        return [run_job(job) for job in jobs]
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        return pool.map(run_job, jobs, chunksize)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _run_job(job):
+    klass = fastcore.make_translating_mpu(MPUS[job.mpu])
+    memory = ObservableMemory(addrWidth=klass.ADDR_WIDTH)
+    memory.write(job.address, job.image)
+
+    output = bytearray()
+    keys = list(bytearray(job.input))
+    byteMask = (1 << klass.BYTE_WIDTH) - 1
+
+    def putc(address, value):
+        output.append(value & 0xFF)
+
+    def getc(address):
+        if keys:
+            return keys.pop(0) & byteMask
+        return 0
+
+    memory.subscribe_to_write([job.putc_addr], putc)
+    memory.subscribe_to_read([job.getc_addr], getc)
+
+    mpu = klass(memory=memory, pc=job.entry)
+    mpu.run(
+        max_cycles=job.max_cycles,
+        max_instructions=job.max_instructions,
+        stopcodes=job.stopcodes,
+        breakpoints=job.breakpoints,
+    )
+
+    if mpu.waiting:
+        stopped = "waiting"
+    elif mpu.pc in job.breakpoints:
+        stopped = "breakpoint"
+    elif memory.peek(mpu.pc) in job.stopcodes:
+        stopped = "stopcode"
+    else:
+        stopped = "budget"
+
+    return {
+        "name": job.name,
+        "mpu": mpu.name,
+        "registers": dict(pc=mpu.pc, a=mpu.a, x=mpu.x, y=mpu.y, sp=mpu.sp, p=mpu.p),
+        "cycles": mpu.processorCycles,
+        "waiting": mpu.waiting,
+        "stopped": stopped,
+        "output": bytes(output),
+        "memory": [
+            [memory.peek(address) for address in range(start, end + 1)]
+            for start, end in job.dumps
+        ],
+    }
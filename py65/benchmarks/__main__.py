@@ -0,0 +1,5 @@
+import sys
+
+from py65.benchmarks.runner import main
+
+sys.exit(main())
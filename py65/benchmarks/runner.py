@@ -0,0 +1,274 @@
+"""Usage: python -m py65.benchmarks [options]
+
+Times the simulated microprocessors running fixed workloads and reports
+instructions and cycles per second.
+
+Options:
+-h, --help                : Show this message
+-m, --mpu <device>        : Benchmark this MPU (default is all)
+-w, --workload <name>     : Run this workload (default is all)
+-e, --engine <name>       : Run on this engine (default is interpreter)
+-n, --instructions <n>    : Instructions per run (default is 200000)
+-r, --repeat <n>          : Runs of each benchmark, the fastest is kept
+                            (default is 3)
+-j, --json                : Print the results as JSON
+-c, --compare <file>      : Compare with results saved from --json
+    --ehbasic <file>      : EhBASIC image (default is examples/ehbasic.bin)
+
+The mpu, workload and engine options may be given more than once.
+
+Workloads: %(workloads)s
+Engines:   %(engines)s
+MPUs:      %(mpus)s
+"""
+
+import functools
+import getopt
+import json
+import platform
+import sys
+import time
+
+from py65.benchmarks import workloads
+from py65.devices import fastcore
+from py65.devices.mpu65c02 import MPU as CMOS65C02
+from py65.devices.mpu65org16 import MPU as V65Org16
+from py65.devices.mpu6502 import MPU as NMOS6502
+from py65.devices.mpu6502 import decimal_adc, decimal_sbc, decimal_table
+
+MPUS = [("6502", NMOS6502), ("65C02", CMOS65C02), ("65Org16", V65Org16)]
+
+ENGINES = [
+    ("interpreter", lambda mpu_type: mpu_type),
+    ("fast", fastcore.make_fast_mpu),
+    ("translating", fastcore.make_translating_mpu),
+]
+
+timer = getattr(time, "perf_counter", time.time)
+
+
+def run_benchmark(workload, mpu_type, instructions, repeat=1):
+    """Run the workload function on a fresh mpu_type repeat times for the
+    given number of instructions.  Returns a dict with the cycles executed
+    and the fastest time in seconds, or None if the workload cannot run on
+    mpu_type.
+    """
+    if mpu_type.BYTE_WIDTH == 8:
+        # the decimal mode tables are built on first use, not while timed
+        decimal_table(decimal_adc)
+        decimal_table(decimal_sbc)
+
+    best = None
+    cycles = None
+    for _ in range(repeat):
+        mpu = workload(mpu_type)
+        if mpu is None:
+            return None
+        start = timer()
+        mpu.run(max_instructions=instructions)
+        elapsed = timer() - start
+        if best is None or elapsed < best:
+            best = elapsed
+        cycles = mpu.processorCycles
+
+    return {
+        "instructions": instructions,
+        "cycles": cycles,
+        "seconds": best,
+        "instructions_per_second": instructions / best,
+        "cycles_per_second": cycles / best,
+    }
+
+
+def run_benchmarks(workload_list, mpu_list, engine_list, instructions, repeat):
+    """Run every combination of the workloads, MPUs and engines, each
+    given as a list of (name, object) pairs like WORKLOADS.  Returns the
+    results for JSON output.
+    """
+    results = []
+    skipped = []
+    for workload_name, workload in workload_list:
+        for mpu_name, mpu_type in mpu_list:
+            for engine_name, make in engine_list:
+                result = run_benchmark(workload, make(mpu_type), instructions, repeat)
+                names = dict(workload=workload_name, mpu=mpu_name, engine=engine_name)
+                if result is None:
+                    skipped.append(names)
+                else:
+                    result.update(names)
+                    results.append(result)
+
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "results": results,
+        "skipped": skipped,
+    }
+
+
+def format_results(report, baseline=None):
+    """Return the results as a table.  With a baseline report, the change
+    in instructions per second from the same benchmark in the baseline is
+    added.
+    """
+    previous = {}
+    if baseline is not None:
+        for result in baseline["results"]:
+            previous[_key(result)] = result["instructions_per_second"]
+
+    header = "%-8s %-8s %-12s %10s %10s %8s %10s" % (
+        "workload",
+        "mpu",
+        "engine",
+        "cycles",
+        "seconds",
+        "MIPS",
+        "Mcycles/s",
+    )
+    if baseline is not None:
+        header += " %8s" % "change"
+    lines = [header]
+
+    for result in report["results"]:
+        line = "%-8s %-8s %-12s %10d %10.3f %8.3f %10.3f" % (
+            result["workload"],
+            result["mpu"],
+            result["engine"],
+            result["cycles"],
+            result["seconds"],
+            result["instructions_per_second"] / 1e6,
+            result["cycles_per_second"] / 1e6,
+        )
+        if baseline is not None:
+            before = previous.get(_key(result))
+            if before is None:
+                line += " %8s" % "new"
+            else:
+                change = result["instructions_per_second"] / before - 1
+                line += " %+7.1f%%" % (change * 100)
+        lines.append(line)
+
+    for result in report.get("skipped", ()):
+        line = "%-8s %-8s %-12s %10s" % (
+            result["workload"],
+            result["mpu"],
+            result["engine"],
+            "skipped",
+        )
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def _key(result):
+    return (result["workload"], result["mpu"], result["engine"])
+
+
+def _usage(stream):
+    stream.write(
+        __doc__
+        % {
+            "workloads": ", ".join(name for name, _ in workloads.WORKLOADS),
+            "engines": ", ".join(name for name, _ in ENGINES),
+            "mpus": ", ".join(name for name, _ in MPUS),
+        }
+    )
+
+
+def main(argv=None, stdout=None):
+    if argv is None:
+        argv = sys.argv
+    if stdout is None:
+        stdout = sys.stdout
+
+    try:
+        shortopts = "hm:w:e:n:r:jc:"
+        longopts = [
+            "help",
+            "mpu=",
+            "workload=",
+            "engine=",
+            "instructions=",
+            "repeat=",
+            "json",
+            "compare=",
+            "ehbasic=",
+        ]
+        options, args = getopt.getopt(argv[1:], shortopts, longopts)
+    except getopt.GetoptError as exc:
+        stdout.write(exc.args[0] + "\n")
+        _usage(stdout)
+        return 1
+
+    available = list(workloads.WORKLOADS)
+    mpu_names, workload_names, engine_names = [], [], []
+    instructions, repeat = 200000, 3
+    as_json, compare = False, None
+
+    for opt, value in options:
+        if opt in ("-h", "--help"):
+            _usage(stdout)
+            return 0
+
+        if opt in ("-m", "--mpu"):
+            mpu_names.append(value)
+
+        if opt in ("-w", "--workload"):
+            workload_names.append(value)
+
+        if opt in ("-e", "--engine"):
+            engine_names.append(value)
+
+        if opt in ("-n", "--instructions"):
+            instructions = int(value)
+
+        if opt in ("-r", "--repeat"):
+            repeat = int(value)
+
+        if opt in ("-j", "--json"):
+            as_json = True
+
+        if opt in ("-c", "--compare"):
+            compare = value
+
+        if opt == "--ehbasic":
+            ehbasic = functools.partial(workloads.ehbasic, path=value)
+            available = [
+                (name, ehbasic if name == "ehbasic" else workload)
+                for name, workload in available
+            ]
+
+    try:
+        workload_list = _select("workload", workload_names, available)
+        mpu_list = _select("MPU", mpu_names, MPUS)
+        engine_list = _select("engine", engine_names or ["interpreter"], ENGINES)
+    except ValueError as exc:
+        stdout.write("Fatal: %s\n" % exc.args[0])
+        return 1
+
+    baseline = None
+    if compare is not None:
+        with open(compare) as f:
+            baseline = json.load(f)
+
+    report = run_benchmarks(workload_list, mpu_list, engine_list, instructions, repeat)
+    if as_json:
+        json.dump(report, stdout, indent=2, sort_keys=True)
+        stdout.write("\n")
+    else:
+        stdout.write(format_results(report, baseline) + "\n")
+    return 0
+
+
+def _select(kind, names, available):
+    # the (name, object) pairs for names, or all of them if none are given
+    if not names:
+        return list(available)
+    selected = []
+    for name in names:
+        if name not in dict(available):
+            msg = "no such %s. Available: %s"
+            choices = ", ".join(choice for choice, _ in available)
+            raise ValueError(msg % (kind, choices))
+        selected.append((name, dict(available)[name]))
+    return selected
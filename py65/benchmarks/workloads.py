@@ -0,0 +1,253 @@
+"""Programs for the benchmarks.  Each workload function takes an MPU class
+and returns an instance ready to run a program that loops forever, so it
+can be timed for any number of instructions.  It returns None if the
+workload cannot run on that MPU.
+
+Every workload runs on an ObservableMemory, which the translating engine
+of py65.devices.fastcore needs; on any other memory it falls back to the
+fast engine.
+"""
+
+import os
+
+import py65
+from py65.assembler import Assembler
+from py65.memory import ObservableMemory
+from py65.utils.addressing import AddressParser
+
+ORIGIN = 0x0200
+
+EHBASIC = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(py65.__file__))),
+    "examples",
+    "ehbasic.bin",
+)
+
+# EhBASIC answers its cold start prompts and runs this forever
+EHBASIC_INPUT = "C\r\r10 FOR I=1 TO 100:A=I*I+SQR(I):B$=STR$(A):NEXT:GOTO 10\rRUN\r"
+
+
+def assemble(mpu, source, origin=ORIGIN, symbols=None):
+    """Assemble source, one statement per line with optional "label:"
+    prefixes and ";" comments, into mpu.memory at origin.  Labels may be
+    used before they are defined.  Returns the labels.
+    """
+    statements = []
+    for line in source.splitlines():
+        line = line.split(";")[0].strip()
+        if not line:
+            continue
+        label = None
+        if ":" in line:
+            label, line = [part.strip() for part in line.split(":", 1)]
+        statements.append((label, line))
+
+    labels = dict(symbols or {})
+    for label, statement in statements:
+        if label is not None:
+            labels.setdefault(label, origin)
+
+    parser = AddressParser(maxwidth=mpu.ADDR_WIDTH)
+    assembler = Assembler(mpu, parser)
+    while True:
+        parser.labels = dict(labels)
+        pc = origin
+        code = []
+        for label, statement in statements:
+            if label is not None:
+                labels[label] = pc
+            if statement:
+                bytes = assembler.assemble(statement, pc)
+                code.extend(bytes)
+                pc += len(bytes)
+        if labels == parser.labels:
+            break
+
+    for offset, value in enumerate(code):
+        mpu.memory[origin + offset] = value
+    return labels
+
+
+def alu(mpu_type):
+    """Arithmetic, logic and shifts on zero page and registers."""
+    mpu = _make_mpu(mpu_type)
+    assemble(
+        mpu,
+        """
+        loop:   clc
+                lda $10
+                adc #$03
+                sta $10
+                eor $11
+                rol a
+                and #$7f
+                tax
+                dex
+                txa
+                ora $12
+                sta $11
+                lsr a
+                sbc $10
+                iny
+                bne loop
+                inc $12
+                jmp loop
+        """,
+    )
+    return mpu
+
+
+def copy(mpu_type):
+    """Copy a page with absolute indexed and indirect indexed loops."""
+    mpu = _make_mpu(mpu_type)
+    width = mpu.BYTE_WIDTH
+    # pointers at $F0 and $F2 to $1000 and $2000
+    for address, pointer in ((0xF0, 0x1000), (0xF2, 0x2000)):
+        mpu.memory[address] = pointer & mpu.byteMask
+        mpu.memory[address + 1] = pointer >> width
+    for offset in range(0x100):
+        mpu.memory[0x1000 + offset] = offset
+    assemble(
+        mpu,
+        """
+        start:  ldx #$ff
+        abs:    lda $1000,x
+                sta $3000,x
+                dex
+                bne abs
+                ldy #$ff
+        ind:    lda ($f0),y
+                sta ($f2),y
+                dey
+                bne ind
+                jmp start
+        """,
+    )
+    return mpu
+
+
+def decimal(mpu_type):
+    """Decimal mode counters, like a score or a clock."""
+    mpu = _make_mpu(mpu_type)
+    assemble(
+        mpu,
+        """
+                sed
+        loop:   clc
+                lda $10
+                adc #$01
+                sta $10
+                lda $11
+                adc #$00
+                sta $11
+                sec
+                lda $12
+                sbc #$07
+                sta $12
+                lda $13
+                sbc #$00
+                sta $13
+                jmp loop
+        """,
+    )
+    return mpu
+
+
+def branch(mpu_type):
+    """Short loops with taken and untaken conditional branches."""
+    mpu = _make_mpu(mpu_type)
+    assemble(
+        mpu,
+        """
+        start:  ldx #$00
+                ldy #$00
+        loop:   txa
+                and #$03
+                beq skip
+                bit $10
+                bmi skip
+                bvs skip
+                iny
+                cpy #$40
+                bcc skip
+                ldy #$00
+        skip:   inx
+                bne loop
+                inc $10
+                jmp start
+        """,
+    )
+    return mpu
+
+
+def io(mpu_type):
+    """Character input and output through ObservableMemory subscribers."""
+    mpu = _make_mpu(mpu_type)
+    memory = mpu.memory
+    state = {"in": 0, "out": 0}
+
+    def getc(address):
+        state["in"] = (state["in"] + 1) & 0x7F
+        return state["in"]
+
+    def putc(address, value):
+        state["out"] += 1
+
+    memory.subscribe_to_read([0xF004], getc)
+    memory.subscribe_to_write([0xF001], putc)
+    assemble(
+        mpu,
+        """
+        loop:   lda $f004
+                beq loop
+                sta $f001
+                cmp #$0d
+                bne loop
+                lda #$0a
+                sta $f001
+                jmp loop
+        """,
+    )
+    return mpu
+
+
+def ehbasic(mpu_type, path=EHBASIC):
+    """EhBASIC running a canned program, with its console on
+    ObservableMemory.  Needs an 8-bit MPU and the EhBASIC image from the
+    examples directory of the source tree.
+    """
+    if mpu_type.BYTE_WIDTH != 8 or not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        image = bytearray(f.read())
+
+    memory = ObservableMemory()
+    memory.write(0x0000, image)
+    keys = list(bytearray(EHBASIC_INPUT.encode("ascii")))
+
+    def getc(address):
+        if keys:
+            return keys.pop(0)
+        return 0
+
+    def putc(address, value):
+        pass
+
+    memory.subscribe_to_read([0xF004], getc)
+    memory.subscribe_to_write([0xF001], putc)
+    return mpu_type(memory=memory, pc=None)
+
+
+def _make_mpu(mpu_type):
+    memory = ObservableMemory(addrWidth=mpu_type.ADDR_WIDTH)
+    return mpu_type(memory=memory, pc=ORIGIN)
+
+
+WORKLOADS = [
+    ("alu", alu),
+    ("copy", copy),
+    ("decimal", decimal),
+    ("branch", branch),
+    ("io", io),
+    ("ehbasic", ehbasic),
+]
@@ -0,0 +1,1114 @@
+"""Specialized instruction handlers for the MPU classes.
+
+The handlers in an MPU's instruct table pass a bound addressing method to
+a generic operation, which reads memory through ByteAt and WordAt.  This
+module turns the table built by the @instruction decorator into Python
+source for one flat function per opcode, with the addressing mode, page
+crossing cycles and flag updates written out, and compiles it.
+"""
+
+import inspect
+import re
+
+from py65.devices import mpu65c02, mpu6502
+from py65.memory import ObservableMemory
+
+# Handlers the 65C02 adds or replaces that are a plain 6502 operation
+# with an addressing mode.  Other 65C02 handlers (BRK, JMP indirect, WAI)
+# keep their original implementation.
+_CMOS_GENERIC = set(
+    [
+        ("ORA", "zpi"),
+        ("AND", "zpi"),
+        ("EOR", "zpi"),
+        ("ADC", "zpi"),
+        ("STA", "zpi"),
+        ("LDA", "zpi"),
+        ("CMP", "zpi"),
+        ("SBC", "zpi"),
+        ("BIT", "zpx"),
+        ("BIT", "abx"),
+        ("BIT", "imm"),
+        ("INC", "acc"),
+        ("DEC", "acc"),
+        ("STZ", "zpg"),
+        ("STZ", "zpx"),
+        ("STZ", "abs"),
+        ("STZ", "abx"),
+        ("TSB", "zpg"),
+        ("TSB", "abs"),
+        ("TRB", "zpg"),
+        ("TRB", "abs"),
+        ("PHX", "imp"),
+        ("PHY", "imp"),
+        ("PLX", "imp"),
+        ("PLY", "imp"),
+        ("BRA", "rel"),
+        ("JMP", "iax"),
+    ]
+    + [("RMB%d" % bit, "zpg") for bit in range(8)]
+    + [("SMB%d" % bit, "zpg") for bit in range(8)]
+)
+
+# Methods the generated handlers write out in place.  If a class
+# overrides any of them, its own handlers are kept.
+_INLINED = (
+    "ByteAt",
+    "WordAt",
+    "WrapAt",
+    "FlagsNZ",
+    "BranchRelAddr",
+    "stPush",
+    "stPop",
+    "stPushWord",
+    "stPopWord",
+    "ProgramCounter",
+    "ImmediateByte",
+    "ZeroPageAddr",
+    "ZeroPageXAddr",
+    "ZeroPageYAddr",
+    "IndirectXAddr",
+    "IndirectYAddr",
+    "AbsoluteAddr",
+    "AbsoluteXAddr",
+    "AbsoluteYAddr",
+    "ZeroPageIndirectAddr",
+    "IndirectAbsXAddr",
+    "opORA",
+    "opASL",
+    "opLSR",
+    "opBCL",
+    "opBST",
+    "opCLR",
+    "opSET",
+    "opAND",
+    "opBIT",
+    "opROL",
+    "opEOR",
+    "opADC",
+    "opROR",
+    "opSTA",
+    "opSTY",
+    "opSTX",
+    "opCMPR",
+    "opSBC",
+    "opDECR",
+    "opINCR",
+    "opLDA",
+    "opLDY",
+    "opLDX",
+    "opRMB",
+    "opSMB",
+    "opSTZ",
+    "opTSB",
+    "opTRB",
+)
+
+_fast_classes = {}
+
+
+def make_fast_mpu(klass):
+    """Return a subclass of the MPU class klass whose instruction table
+    uses generated handlers.  Cycle counts, flags and memory accesses are
+    identical to klass.  Opcodes the generator does not know keep the
+    handler from klass.
+    """
+    fast = _fast_classes.get(klass)
+    if fast is None:
+
+        class fast(klass):
+            instruct = build_instruct(klass)
+
+        fast.__name__ = klass.__name__
+        _fast_classes[klass] = fast
+    return fast
+
+
+def build_instruct(klass):
+    """Return a new 256-entry instruction table for the MPU class klass
+    with a generated handler for every opcode that has a template.
+    """
+    instruct = list(klass.instruct)
+    sources = []
+    for opcode in range(256):
+        source = generate_source(klass, opcode)
+        if source is not None:
+            sources.append(source)
+
+    namespace = {"nz": mpu6502.nz_table(klass.BYTE_WIDTH)}
+    code = compile("\n\n".join(sources), "<py65 %s fastcore>" % klass.__name__, "exec")
+    exec(code, namespace)
+
+    for opcode in range(256):
+        handler = namespace.get("inst_0x%02x" % opcode)
+        if handler is not None:
+            instruct[opcode] = handler
+    return instruct
+
+
+def generate_source(klass, opcode):
+    """Return the Python source of the generated handler for opcode on
+    the MPU class klass, or None if the original handler must be kept.
+    """
+    body = _handler_lines(klass, opcode)
+    if body is None:
+        return None
+
+    lines = [
+        "def inst_0x%02x(mpu):" % opcode,
+        "    memory = mpu.memory",
+        "    pc = mpu.pc",
+    ]
+    lines.extend("    " + line for line in body)
+    return "\n".join(lines)
+
+
+def _handler_lines(klass, opcode):
+    # the body of the generated handler for opcode, which expects "mpu",
+    # "memory" and "pc" (the address after the opcode) as locals
+    name, mode = klass.disassemble[opcode]
+    handler = klass.instruct[opcode]
+
+    if handler is mpu6502.MPU.instruct[opcode]:
+        reference = mpu6502.MPU
+    elif handler is mpu65c02.MPU.instruct[opcode] and (name, mode) in _CMOS_GENERIC:
+        reference = mpu65c02.MPU
+    else:
+        return None
+
+    for method in _INLINED:
+        original = _lookup(reference, method)
+        if original is not None and _lookup(klass, method) is not original:
+            return None
+
+    consts = _constants(klass)
+    consts["extra"] = klass.extracycles[opcode]
+    body = _body(name, mode, consts)
+    if body is None:
+        return None
+    return [line % consts for line in body]
+
+
+def _lookup(klass, name):
+    for base in inspect.getmro(klass):
+        if name in base.__dict__:
+            return base.__dict__[name]
+    return None
+
+
+def _constants(klass):
+    width = klass.BYTE_WIDTH
+    byteMask = (1 << width) - 1
+    return {
+        "width": width,
+        "byteMask": byteMask,
+        "addrMask": (1 << klass.ADDR_WIDTH) - 1,
+        "addrHighMask": byteMask << width,
+        "spBase": 1 << width,
+        # the 65Org16 moves N and V to the top of its 16-bit byte
+        "N": 1 << (width - 1),
+        "V": 1 << (width - 2),
+        "B": klass.BREAK,
+        "U": klass.UNUSED,
+        "D": klass.DECIMAL,
+        "I": klass.INTERRUPT,
+        "Z": klass.ZERO,
+        "C": klass.CARRY,
+        "notNZ": ~(klass.ZERO | (1 << (width - 1))),
+    }
+
+
+# Addressing modes: lines that leave the effective address in "address",
+# and the number of operand bytes that follow the opcode.
+
+_ABSOLUTE = "memory[pc] + (memory[pc + 1] << %(width)d)"
+
+_INDEXED = [
+    "base = %s" % _ABSOLUTE,
+    "address = (base + mpu.%s) & %%(addrMask)d",
+]
+
+_PAGE_CROSSED = [
+    "if (base & %(addrHighMask)d) != (address & %(addrHighMask)d):",
+    "    mpu.excycles += 1",
+]
+
+
+def _address(mode, consts):
+    if mode == "imm":
+        return ["address = pc"], 1
+    if mode == "zpg":
+        return ["address = memory[pc]"], 1
+    if mode == "zpx":
+        return ["address = %(byteMask)d & (mpu.x + memory[pc])"], 1
+    if mode == "zpy":
+        return ["address = %(byteMask)d & (mpu.y + memory[pc])"], 1
+    if mode == "abs":
+        return ["address = " + _ABSOLUTE], 2
+    if mode in ("abx", "aby"):
+        register = mode[-1]
+        lines = [_INDEXED[0], _INDEXED[1] % register]
+        if consts["extra"]:
+            lines.extend(_PAGE_CROSSED)
+        return lines, 2
+    if mode == "inx":
+        return [
+            "zp = %(byteMask)d & (memory[pc] + mpu.x)",
+            "address = memory[zp] + (memory[(zp + 1) & %(byteMask)d] << %(width)d)",
+        ], 1
+    if mode == "iny":
+        lines = [
+            "zp = memory[pc]",
+            "base = memory[zp] + (memory[(zp + 1) & %(byteMask)d] << %(width)d)",
+            "address = (base + mpu.y) & %(addrMask)d",
+        ]
+        if consts["extra"]:
+            lines.extend(_PAGE_CROSSED)
+        return lines, 1
+    if mode == "zpi":
+        return [
+            "zp = 255 & memory[pc]",
+            "address = memory[zp] + (memory[zp + 1] << %(width)d)",
+        ], 1
+    return None, None
+
+
+# Shared operation fragments
+
+_FLAGS_NZ = "mpu.p = (mpu.p & %(notNZ)d) | nz[value]"
+
+_PUSH = [
+    "sp = mpu.sp",
+    "memory[sp + %(spBase)d] = value & %(byteMask)d",
+    "mpu.sp = (sp - 1) & %(byteMask)d",
+]
+
+_POP = [
+    "sp = (mpu.sp + 1) & %(byteMask)d",
+    "mpu.sp = sp",
+    "value = memory[sp + %(spBase)d]",
+]
+
+_BRANCH = [
+    "mpu.excycles += 1",
+    "offset = memory[pc]",
+    "pc += 1",
+    "if offset & %(N)d:",
+    "    target = pc - (offset ^ %(byteMask)d) - 1",
+    "else:",
+    "    target = pc + offset",
+    "if (pc & %(addrHighMask)d) != (target & %(addrHighMask)d):",
+    "    mpu.excycles += 1",
+    "mpu.pc = target & %(addrMask)d",
+]
+
+_BRANCHES = {
+    # name: (flag, branch when flag is set)
+    "BPL": ("N", False),
+    "BMI": ("N", True),
+    "BVC": ("V", False),
+    "BVS": ("V", True),
+    "BCC": ("C", False),
+    "BCS": ("C", True),
+    "BNE": ("Z", False),
+    "BEQ": ("Z", True),
+}
+
+_FLAG_OPS = {
+    "CLC": "mpu.p &= ~%(C)d",
+    "SEC": "mpu.p |= %(C)d",
+    "CLI": "mpu.p &= ~%(I)d",
+    "SEI": "mpu.p |= %(I)d",
+    "CLD": "mpu.p &= ~%(D)d",
+    "SED": "mpu.p |= %(D)d",
+    "CLV": "mpu.p &= ~%(V)d",
+}
+
+_TRANSFERS = {
+    # name: (source, destination)
+    "TAX": ("a", "x"),
+    "TAY": ("a", "y"),
+    "TXA": ("x", "a"),
+    "TYA": ("y", "a"),
+    "TSX": ("sp", "x"),
+}
+
+_STEPS = {
+    # name: (register, delta)
+    "INX": ("x", 1),
+    "INY": ("y", 1),
+    "DEX": ("x", -1),
+    "DEY": ("y", -1),
+}
+
+_PUSHES = {"PHA": "a", "PHX": "x", "PHY": "y"}
+
+_PULLS = {"PLA": "a", "PLX": "x", "PLY": "y"}
+
+_LOADS = {"LDA": "a", "LDX": "x", "LDY": "y"}
+
+_STORES = {"STA": "mpu.a", "STX": "mpu.x", "STY": "mpu.y", "STZ": "0"}
+
+_LOGIC = {"ORA": "|", "AND": "&", "EOR": "^"}
+
+_COMPARES = {"CMP": "a", "CPX": "x", "CPY": "y"}
+
+_SHIFTS = ("ASL", "LSR", "ROL", "ROR", "INC", "DEC")
+
+
+def _body(name, mode, consts):
+    if mode == "imp":
+        return _implied(name)
+    if mode == "rel":
+        return _relative(name)
+    if name == "JMP":
+        return _jump(mode)
+    if name == "JSR" and mode == "abs":
+        return [
+            "value = (pc + 1) & %(addrMask)d",
+            "sp = mpu.sp",
+            "memory[sp + %(spBase)d] = (value >> %(width)d) & %(byteMask)d",
+            "sp = (sp - 1) & %(byteMask)d",
+            "memory[sp + %(spBase)d] = value & %(byteMask)d",
+            "mpu.sp = (sp - 1) & %(byteMask)d",
+            "mpu.pc = " + _ABSOLUTE,
+        ]
+    if name in _SHIFTS and mode == "acc":
+        return ["value = mpu.a"] + _shift(name) + ["mpu.a = value"]
+
+    address, length = _address(mode, consts)
+    if address is None:
+        return None
+    operation = _operation(name, mode)
+    if operation is None:
+        return None
+    return address + operation + ["mpu.pc = pc + %d" % length]
+
+
+def _operation(name, mode):
+    if name in _LOADS:
+        register = _LOADS[name]
+        return ["value = memory[address]", "mpu.%s = value" % register, _FLAGS_NZ]
+    if name in _STORES:
+        return ["memory[address] = %s" % _STORES[name]]
+    if name in _LOGIC:
+        return [
+            "value = mpu.a %s memory[address]" % _LOGIC[name],
+            "mpu.a = value",
+            _FLAGS_NZ,
+        ]
+    if name in _COMPARES:
+        return [
+            "register = mpu.%s" % _COMPARES[name],
+            "value = memory[address]",
+            "p = mpu.p & ~(%(C)d | %(Z)d | %(N)d)",
+            "if register == value:",
+            "    p |= %(C)d | %(Z)d",
+            "elif register > value:",
+            "    p |= %(C)d",
+            "mpu.p = p | ((register - value) & %(N)d)",
+        ]
+    if name == "BIT" and mode == "imm":
+        # the 65C02's BIT #imm only affects the Z flag
+        return [
+            "value = memory[address]",
+            "p = mpu.p & ~%(Z)d",
+            "if (mpu.a & value) == 0:",
+            "    p |= %(Z)d",
+            "mpu.p = p",
+        ]
+    if name == "BIT":
+        return [
+            "value = memory[address]",
+            "p = mpu.p & ~(%(Z)d | %(N)d | %(V)d)",
+            "if (mpu.a & value) == 0:",
+            "    p |= %(Z)d",
+            "mpu.p = p | (value & (%(N)d | %(V)d))",
+        ]
+    if name == "ADC":
+        return [
+            "if mpu.p & %(D)d:",
+            "    mpu.opADC(lambda: address)",
+            "else:",
+            "    data = memory[address]",
+            "    a = mpu.a",
+            "    result = data + a + (mpu.p & %(C)d)",
+            "    p = mpu.p & ~(%(C)d | %(V)d | %(N)d | %(Z)d)",
+            "    if (~(a ^ data) & (a ^ result)) & %(N)d:",
+            "        p |= %(V)d",
+            "    if result > %(byteMask)d:",
+            "        p |= %(C)d",
+            "        result &= %(byteMask)d",
+            "    mpu.p = p | nz[result]",
+            "    mpu.a = result",
+        ]
+    if name == "SBC":
+        return [
+            "if mpu.p & %(D)d:",
+            "    mpu.opSBC(lambda: address)",
+            "else:",
+            "    data = memory[address]",
+            "    a = mpu.a",
+            "    result = a + (~data & %(byteMask)d) + (mpu.p & %(C)d)",
+            "    p = mpu.p & ~(%(C)d | %(Z)d | %(V)d | %(N)d)",
+            "    if ((a ^ data) & (a ^ result)) & %(N)d:",
+            "        p |= %(V)d",
+            "    value = result & %(byteMask)d",
+            "    if result > %(byteMask)d:",
+            "        p |= %(C)d",
+            "    mpu.p = p | nz[value]",
+            "    mpu.a = value",
+        ]
+    if name in _SHIFTS:
+        return ["value = memory[address]"] + _shift(name) + ["memory[address] = value"]
+    if name in ("TSB", "TRB"):
+        if name == "TSB":
+            result = "value | mpu.a"
+        else:
+            result = "value & ~mpu.a"
+        return [
+            "value = memory[address]",
+            "p = mpu.p & ~%(Z)d",
+            "if (value & mpu.a) == 0:",
+            "    p |= %(Z)d",
+            "mpu.p = p",
+            "memory[address] = " + result,
+        ]
+    if name[:3] in ("RMB", "SMB"):
+        bit = 1 << int(name[3])
+        if name.startswith("RMB"):
+            return ["memory[address] = memory[address] & %d" % (0xFF ^ bit)]
+        return ["memory[address] = memory[address] | %d" % bit]
+    return None
+
+
+def _shift(name):
+    # operates on "value" in place and updates the flags
+    if name == "ASL":
+        return [
+            "p = mpu.p & ~(%(C)d | %(N)d | %(Z)d)",
+            "if value & %(N)d:",
+            "    p |= %(C)d",
+            "value = (value << 1) & %(byteMask)d",
+            "mpu.p = p | nz[value]",
+        ]
+    if name == "LSR":
+        return [
+            "p = (mpu.p & ~(%(C)d | %(N)d | %(Z)d)) | (value & 1)",
+            "value = value >> 1",
+            "mpu.p = p if value else p | %(Z)d",
+        ]
+    if name == "ROL":
+        return [
+            "carry = %(C)d if value & %(N)d else 0",
+            "value = ((value << 1) | (mpu.p & %(C)d)) & %(byteMask)d",
+            "mpu.p = (mpu.p & ~%(C)d) | carry",
+            _FLAGS_NZ,
+        ]
+    if name == "ROR":
+        return [
+            "carry = value & 1",
+            "value = (value >> 1) | (%(N)d if mpu.p & %(C)d else 0)",
+            "mpu.p = (mpu.p & ~%(C)d) | carry",
+            _FLAGS_NZ,
+        ]
+    if name == "INC":
+        return ["value = (value + 1) & %(byteMask)d", _FLAGS_NZ]
+    if name == "DEC":
+        return ["value = (value - 1) & %(byteMask)d", _FLAGS_NZ]
+
+
+def _implied(name):
+    if name == "NOP":
+        return ["pass"]
+    if name in _FLAG_OPS:
+        return [_FLAG_OPS[name]]
+    if name in _TRANSFERS:
+        source, destination = _TRANSFERS[name]
+        return ["value = mpu.%s" % source, "mpu.%s = value" % destination, _FLAGS_NZ]
+    if name == "TXS":
+        return ["mpu.sp = mpu.x"]
+    if name in _STEPS:
+        register, delta = _STEPS[name]
+        return [
+            "value = (mpu.%s + %d) & %%(byteMask)d" % (register, delta),
+            "mpu.%s = value" % register,
+            _FLAGS_NZ,
+        ]
+    if name in _PUSHES:
+        return ["value = mpu.%s" % _PUSHES[name]] + _PUSH
+    if name == "PHP":
+        return ["value = mpu.p | %(B)d | %(U)d"] + _PUSH
+    if name in _PULLS:
+        return _POP + ["mpu.%s = value" % _PULLS[name], _FLAGS_NZ]
+    if name == "PLP":
+        return _POP + ["mpu.p = value | %(B)d | %(U)d"]
+    if name == "RTS":
+        return (
+            _POP
+            + [
+                "low = value",
+            ]
+            + _POP
+            + [
+                "mpu.pc = low + (value << %(width)d) + 1",
+            ]
+        )
+    if name == "RTI":
+        return (
+            _POP
+            + [
+                "mpu.p = value | %(B)d | %(U)d",
+            ]
+            + _POP
+            + [
+                "low = value",
+            ]
+            + _POP
+            + [
+                "mpu.pc = low + (value << %(width)d)",
+            ]
+        )
+    return None
+
+
+def _relative(name):
+    if name == "BRA":
+        return list(_BRANCH)
+    if name not in _BRANCHES:
+        return None
+    flag, when_set = _BRANCHES[name]
+    taken = ["    " + line for line in _BRANCH]
+    skipped = ["    mpu.pc = pc + 1"]
+    if when_set:
+        return ["if mpu.p & %%(%s)d:" % flag] + taken + ["else:"] + skipped
+    return ["if mpu.p & %%(%s)d:" % flag] + skipped + ["else:"] + taken
+
+
+def _jump(mode):
+    if mode == "abs":
+        return ["mpu.pc = " + _ABSOLUTE]
+    if mode == "ind":
+        # the NMOS 6502 does not carry into the high byte of the pointer
+        return [
+            "pointer = " + _ABSOLUTE,
+            "high = (pointer & %(addrHighMask)d) + ((pointer + 1) & %(byteMask)d)",
+            "mpu.pc = memory[pointer] + (memory[high] << %(width)d)",
+        ]
+    if mode == "iax":
+        return [
+            "pointer = (%s + mpu.x) & %%(addrMask)d" % _ABSOLUTE,
+            "mpu.pc = memory[pointer] + (memory[pointer + 1] << %(width)d)",
+        ]
+    return None
+
+
+# Basic block translation
+
+# Instructions after which a block ends because the next address is only
+# known at run time.
+_CONTROL = ("JMP", "JSR", "RTS", "RTI")
+
+_OPERAND_BYTES = {
+    "imp": 0,
+    "acc": 0,
+    "imm": 1,
+    "zpg": 1,
+    "zpx": 1,
+    "zpy": 1,
+    "inx": 1,
+    "iny": 1,
+    "zpi": 1,
+    "rel": 1,
+    "abs": 2,
+    "abx": 2,
+    "aby": 2,
+    "ind": 2,
+    "iax": 2,
+}
+
+# Instructions that do not read the memory at their effective address,
+# and those that read the stack
+_NO_READ = ("STA", "STX", "STY", "STZ", "JMP", "JSR")
+_STACK_READS = ("PLA", "PLP", "PLX", "PLY", "RTS", "RTI")
+
+# Modes whose effective address is read from memory at run time
+_INDIRECT = ("inx", "iny", "zpi")
+
+_SET_PC = re.compile(r"^mpu\.pc = pc \+ \d+$")
+_USES_PC = re.compile(r"(?<![\w.])pc\b")
+_WRITES_MEMORY = re.compile(r"memory\[[^]]*\] =")
+
+# The most instructions translated into one block
+BLOCK_LIMIT = 32
+
+# Code rewritten this many times, like the self-modifying CHRGET routine
+# of many BASICs, is no longer translated
+REWRITE_LIMIT = 4
+
+_translating_classes = {}
+
+
+def make_translating_mpu(klass):
+    """Return a subclass of the MPU class klass whose run() translates
+    straight-line runs of instructions into single Python functions.
+
+    A block starts at the address it is first run from and ends after a
+    branch, jump, return, or after BLOCK_LIMIT instructions, or before an
+    instruction with no generated handler.  Blocks are cached by their
+    start address.  Their operands are compiled in as constants, so the
+    cache watches writes to their addresses through the memory's write
+    subscribers and drops a block as soon as one of its bytes changes.
+
+    Translation is only used when the memory is an ObservableMemory and
+    no tracer is set.  Otherwise, and for step(), the class behaves like
+    the one returned by make_fast_mpu().  Results, cycle counts and the
+    stop conditions of run() are identical to klass.  Subscribers see the
+    cycle count at the start of the instruction that reads or writes, and
+    a block stops after any access that schedules an event (see
+    py65.scheduler), so devices and interrupts are timed as under klass.
+    Which reads may reach a read subscriber is decided when a block is
+    translated, so blocks translated before a read subscriber is added
+    give it the cycle count from their start.
+    """
+    translating = _translating_classes.get(klass)
+    if translating is None:
+        fast = make_fast_mpu(klass)
+
+        class translating(fast):
+            _blocks = None
+
+            def run(
+                self,
+                max_cycles=None,
+                max_instructions=None,
+                stopcodes=(),
+                breakpoints=(),
+            ):
+                traced = self.tracer is not None
+                if traced or not isinstance(self.memory, ObservableMemory):
+                    return fast.run(
+                        self, max_cycles, max_instructions, stopcodes, breakpoints
+                    )
+                if self._blocks is None or self._blocks.memory is not self.memory:
+                    if self._blocks is not None:
+                        self._blocks.close()
+                    self._blocks = BlockCache(klass, self.memory)
+                return _run_blocks(
+                    self,
+                    fast,
+                    max_cycles,
+                    max_instructions,
+                    frozenset(stopcodes),
+                    frozenset(breakpoints),
+                )
+
+            def restore(self, snapshot):
+                # restoring bypasses the write subscribers that keep the
+                # cached blocks current
+                self.drop_blocks()
+                return fast.restore(self, snapshot)
+
+            def drop_blocks(self):
+                """Forget all translated blocks.  Call this after changing
+                code in memory without calling the write subscribers.
+                """
+                if self._blocks is not None:
+                    self._blocks.close()
+                    self._blocks = None
+
+        translating.__name__ = klass.__name__
+        _translating_classes[klass] = translating
+    return translating
+
+
+def _run_blocks(mpu, fast, max_cycles, max_instructions, stopcodes, breakpoints):
+    # MPU.run() with each instruction that starts a cached block running
+    # the whole block instead, when no stop condition can fall inside it
+    memory = mpu.memory
+    instruct = mpu.instruct
+    cycletime = mpu.cycletime
+    extracycles = mpu.extracycles
+    addrMask = mpu.addrMask
+    cache = mpu._blocks
+    blocks = cache.blocks
+    translate = cache.translate
+    written = cache.written
+    scheduler = mpu.scheduler
+
+    if max_instructions is None:
+        max_instructions = -1
+    elif max_instructions <= 0:
+        return mpu
+    if max_cycles is None:
+        end_cycles = None
+    else:
+        end_cycles = mpu.processorCycles + max_cycles
+    if scheduler is not None:
+        # blocks stop after a write that schedules an earlier event
+        scheduler.moved = written
+
+    mpu.fire_events()
+    count = 0
+    while True:
+        if mpu.waiting:
+            slots = []
+            if max_instructions >= 0:
+                slots.append(max_instructions - count)
+            if end_cycles is not None:
+                slots.append(end_cycles - mpu.processorCycles)
+            limit = max(min(slots), 1) if slots else None
+            if mpu.stopped and limit is None:
+                break
+
+            skipped = mpu.skip_to_event(limit)
+            if skipped is None:
+                # MPU.run() consumes the remaining budget
+                if max_instructions >= 0:
+                    max_instructions -= count
+                if end_cycles is not None:
+                    max_cycles = end_cycles - mpu.processorCycles
+                return fast.run(
+                    mpu, max_cycles, max_instructions, stopcodes, breakpoints
+                )
+
+            count += skipped
+            if count == max_instructions:
+                break
+            if end_cycles is not None and mpu.processorCycles >= end_cycles:
+                break
+            if mpu.waiting:
+                continue
+            if breakpoints and mpu.pc in breakpoints:
+                break
+            if stopcodes and memory[mpu.pc] in stopcodes:
+                break
+            continue
+
+        pc = mpu.pc
+        try:
+            block = blocks[pc]
+        except KeyError:
+            block = translate(pc)
+
+        if (
+            block is not None
+            and (max_instructions < 0 or count + block.length <= max_instructions)
+            and (
+                end_cycles is None
+                or mpu.processorCycles + block.max_cycles <= end_cycles
+            )
+            and (
+                scheduler is None
+                or mpu.processorCycles + block.max_cycles <= scheduler.deadline
+            )
+            and not (breakpoints and not breakpoints.isdisjoint(block.addresses))
+            and not (stopcodes and not stopcodes.isdisjoint(block.opcodes))
+        ):
+            written[0] = 0
+            count += block.function(mpu)
+        else:
+            instructCode = memory[pc]
+            mpu.pc = (pc + 1) & addrMask
+            mpu.excycles = 0
+            mpu.addcycles = extracycles[instructCode]
+            instruct[instructCode](mpu)
+            mpu.pc &= addrMask
+            mpu.processorCycles += cycletime[instructCode] + mpu.excycles
+            count += 1
+
+        if scheduler is not None and mpu.processorCycles >= scheduler.deadline:
+            scheduler.fire()
+        if count == max_instructions:
+            break
+        if end_cycles is not None and mpu.processorCycles >= end_cycles:
+            break
+        if breakpoints and mpu.pc in breakpoints:
+            break
+        if stopcodes and memory[mpu.pc] in stopcodes:
+            break
+
+    return mpu
+
+
+class Block:
+    """A translated run of instructions.  function(mpu) executes them and
+    returns how many it executed, which is fewer than length only when one
+    of them wrote to translated code.
+    """
+
+    def __init__(self, start, end, length, max_cycles, addresses, opcodes, function):
+        self.start = start  # first and last address of its bytes
+        self.end = end
+        self.length = length
+        self.max_cycles = max_cycles  # with every page crossing taken
+        self.addresses = addresses  # of the instructions after the first
+        self.opcodes = opcodes  # of the instructions after the first
+        self.function = function
+
+
+class BlockCache:
+    """Translated blocks of one ObservableMemory, by start address."""
+
+    def __init__(self, klass, memory):
+        self.klass = klass
+        self.memory = memory
+        self.consts = _constants(klass)
+        self.blocks = {}
+        self._pages = {}  # 256-byte page -> start addresses of blocks on it
+        self._rewrites = {}  # start address -> blocks dropped there
+        self._watched = bytearray(memory.physMask + 1)
+        self._lines = [_handler_lines(klass, opcode) for opcode in range(256)]
+        self.written = [0]  # set when a write drops a block
+        self._observed = False  # if the memory has any read subscribers
+
+    def close(self):
+        """Stop watching the memory and forget all blocks."""
+        self.memory.unsubscribe_from_write(self._code_written)
+        self.blocks.clear()
+        self._pages.clear()
+        self._watched[:] = bytearray(len(self._watched))
+
+    def translate(self, start):
+        """Translate and cache the block starting at start.  Returns None,
+        also cached, if the instruction at start cannot be translated.
+        """
+        if self._rewrites.get(start, 0) >= REWRITE_LIMIT:
+            instructions = None
+        else:
+            instructions = self._decode(start)
+        if not instructions:
+            self.blocks[start] = None
+            return None
+
+        self._observed = self.memory.has_read_subscribers(0, self.memory.physMask)
+        source, max_cycles = self._block_source(start, instructions)
+        namespace = {
+            "nz": mpu6502.nz_table(self.klass.BYTE_WIDTH),
+            "written": self.written,
+        }
+        code = compile(source, "<py65 block $%x>" % start, "exec")
+        exec(code, namespace)
+
+        address, opcode, length = instructions[-1]
+        block = Block(
+            start,
+            address + length - 1,
+            len(instructions),
+            max_cycles,
+            frozenset(i[0] for i in instructions[1:]),
+            frozenset(i[1] for i in instructions[1:]),
+            namespace["block"],
+        )
+        self.blocks[start] = block
+        for page in range(block.start >> 8, (block.end >> 8) + 1):
+            self._pages.setdefault(page, []).append(start)
+        # ranges stay subscribed after their blocks are dropped
+        if not all(self._watched[block.start : block.end + 1]):
+            self.memory.subscribe_to_write_range(
+                block.start, block.end, self._code_written
+            )
+            self._watched[block.start : block.end + 1] = b"\x01" * (
+                block.end + 1 - block.start
+            )
+        return block
+
+    def _code_written(self, address, value):
+        for start in list(self._pages.get(address >> 8, ())):
+            block = self.blocks[start]
+            if block.start <= address <= block.end:
+                del self.blocks[start]
+                for page in range(block.start >> 8, (block.end >> 8) + 1):
+                    self._pages[page].remove(start)
+                self._rewrites[start] = self._rewrites.get(start, 0) + 1
+                self.written[0] = 1
+
+    def _decode(self, start):
+        # (address, opcode, length) of each instruction in the block
+        klass = self.klass
+        memory = self.memory
+        physMask = memory.physMask
+        instructions = []
+        address = start
+        while len(instructions) < BLOCK_LIMIT:
+            if address > physMask or memory.has_read_subscribers(address):
+                break
+            opcode = memory[address]
+            if opcode > 0xFF or self._lines[opcode] is None:
+                break
+            name, mode = klass.disassemble[opcode]
+            length = 1 + _OPERAND_BYTES[mode]
+            last = address + length - 1
+            if last > physMask or any(
+                memory.has_read_subscribers(a) for a in range(address + 1, last + 1)
+            ):
+                break
+            instructions.append((address, opcode, length))
+            address += length
+            if mode == "rel" or name in _CONTROL:
+                break
+        return instructions
+
+    def _block_source(self, start, instructions):
+        klass = self.klass
+        memory = self.memory
+        consts = self.consts
+        lines = [
+            "def block(mpu):",
+            "    memory = mpu.memory",
+            "    excycles = 0",
+        ]
+        cycles = 0  # of the instructions so far
+        synced = 0  # of those already added to mpu.processorCycles
+        max_cycles = 0
+        for number, (address, opcode, length) in enumerate(instructions):
+            name, mode = klass.disassemble[opcode]
+            operands = [memory[a] for a in range(address + 1, address + length)]
+            following = (address + length) & consts["addrMask"]
+
+            lines.append("    # $%x %s %s" % (address, name, mode))
+            if mode == "rel":
+                body, extra = self._branch(name, address, operands[0])
+                max_cycles += extra
+            else:
+                body = self._fold(self._lines[opcode], mode, address, operands)
+                if "excycles += 1" in "\n".join(body):
+                    max_cycles += 1
+                writes = any(_WRITES_MEMORY.search(line) for line in body)
+                if writes or self._reads_observed(name, mode, address):
+                    # subscribers see the cycle count at the start of the
+                    # instruction, as they do under the interpreter
+                    if number:
+                        lines.extend(
+                            [
+                                "    mpu.processorCycles += %d + excycles"
+                                % (cycles - synced),
+                                "    excycles = 0",
+                            ]
+                        )
+                        synced = cycles
+                    if name not in _CONTROL and number < len(instructions) - 1:
+                        body.extend(
+                            [
+                                "if written[0]:",
+                                "    mpu.pc = %d" % following,
+                                "    mpu.processorCycles += %d + excycles"
+                                % (cycles + klass.cycletime[opcode] - synced),
+                                "    return %d" % (number + 1),
+                            ]
+                        )
+                if name in _CONTROL:
+                    body.append("mpu.pc &= %d" % consts["addrMask"])
+                elif number == len(instructions) - 1:
+                    body.append("mpu.pc = %d" % following)
+            lines.extend("    " + line for line in body)
+            cycles += klass.cycletime[opcode]
+            max_cycles += klass.cycletime[opcode]
+
+        lines.extend(
+            [
+                "    mpu.processorCycles += %d + excycles" % (cycles - synced),
+                "    return %d" % len(instructions),
+            ]
+        )
+        return "\n".join(lines), max_cycles
+
+    def _reads_observed(self, name, mode, address):
+        # whether the instruction at address may read an address that has
+        # read subscribers
+        if not self._observed:
+            return False
+        if mode in _INDIRECT and name not in _NO_READ:
+            return True
+        memory = self.memory
+        return any(
+            memory.has_read_subscribers(start, end)
+            for start, end in self._read_spans(name, mode, address)
+        )
+
+    def _read_spans(self, name, mode, address):
+        # (start, end) spans of the memory the instruction at address may
+        # read as data that are known before it runs; the addresses read
+        # through a pointer by the _INDIRECT modes are not
+        consts = self.consts
+        memory = self.memory
+        byteMask = consts["byteMask"]
+        if name in _STACK_READS:
+            return self._span(consts["spBase"], byteMask)
+        if mode in ("zpx", "zpy") + _INDIRECT:
+            # the zero page holds the operand or the pointer
+            if mode in _INDIRECT or name not in _NO_READ:
+                return self._span(0, byteMask)
+            return []
+        if mode == "zpg" and name not in _NO_READ:
+            return self._span(memory[address + 1], 0)
+        if mode in ("abs", "abx", "aby", "ind", "iax"):
+            base = memory[address + 1] + (memory[address + 2] << consts["width"])
+            if mode == "abs" and name not in _NO_READ:
+                return self._span(base, 0)
+            if mode in ("abx", "aby") and name not in _NO_READ:
+                return self._span(base, byteMask)
+            if mode == "ind":
+                # the NMOS 6502 reads the high byte from the start of the
+                # page if the pointer is at its end
+                return self._span(base, 1) + self._span(
+                    base & consts["addrHighMask"], 0
+                )
+            if mode == "iax":
+                return self._span(base, byteMask + 1)
+        return []
+
+    def _span(self, start, length):
+        # the spans of memory from start through start + length
+        physMask = self.memory.physMask
+        start &= physMask
+        if length >= physMask:
+            return [(0, physMask)]
+        end = start + length
+        if end > physMask:
+            return [(start, physMask), (0, end & physMask)]
+        return [(start, end)]
+
+    def _fold(self, body, mode, address, operands):
+        # compile in the operands, whose bytes are watched, and drop the
+        # program counter updates of instructions that fall through
+        text = []
+        for line in body:
+            if _SET_PC.match(line):
+                continue
+            if len(operands) > 1:
+                line = line.replace("memory[pc + 1]", str(operands[1]))
+            if operands:
+                line = line.replace("memory[pc]", str(operands[0]))
+            if mode == "imm":
+                line = line.replace("memory[address]", str(operands[0]))
+            text.append(line.replace("mpu.excycles", "excycles"))
+        if any(_USES_PC.search(line) for line in text):
+            text.insert(0, "pc = %d" % (address + 1))
+        return text
+
+    def _branch(self, name, address, offset):
+        # the target of a branch is known, so only the condition remains
+        consts = self.consts
+        pc = address + 2
+        if offset & consts["N"]:
+            target = pc - (offset ^ consts["byteMask"]) - 1
+        else:
+            target = pc + offset
+        extra = 1
+        if (pc & consts["addrHighMask"]) != (target & consts["addrHighMask"]):
+            extra += 1
+        target &= consts["addrMask"]
+
+        taken = ["excycles += %d" % extra, "mpu.pc = %d" % target]
+        if name == "BRA":
+            return taken, extra
+        flag, when_set = _BRANCHES[name]
+        skipped = ["mpu.pc = %d" % (pc & consts["addrMask"])]
+        if not when_set:
+            taken, skipped = skipped, taken
+        lines = ["if mpu.p & %d:" % consts[flag]]
+        lines.extend("    " + line for line in taken)
+        lines.append("else:")
+        lines.extend("    " + line for line in skipped)
+        return lines, extra
@@ -1,3 +1,7 @@
+from array import array
+
+from py65.memory import load_pages, make_memory, memory_pages
+from py65.scheduler import NEVER
 from py65.utils.conversions import itoa
 from py65.utils.devices import make_instruction_decorator
 
@@ -35,9 +39,15 @@ class MPU:
         self.excycles = 0
         self.addcycles = False
         self.processorCycles = 0
+        self.nzFlags = nz_table(self.BYTE_WIDTH)
+        self.waiting = False  # set by WAI on the 65C02 and 65Org16
+        self.stopped = False  # set with waiting by STP on the 65C02
+        self.lastSnapshot = None  # shares memory pages with new snapshots
+        self.tracer = None  # records each instruction, see py65.trace
+        self.scheduler = None  # fires timed events, see py65.scheduler
 
         if memory is None:
-            memory = 0x10000 * [0x00]
+            memory = make_memory(0x10000, self.BYTE_WIDTH)
         self.memory = memory
         self.start_pc = pc  # if None, reset vector is used
 
@@ -64,12 +74,153 @@ class MPU:
 
     def step(self):
         instructCode = self.memory[self.pc]
+        if self.tracer is not None:
+            self.tracer.record(
+                self.pc,
+                instructCode,
+                self.a,
+                self.x,
+                self.y,
+                self.sp,
+                self.p,
+                self.processorCycles,
+            )
         self.pc = (self.pc + 1) & self.addrMask
         self.excycles = 0
         self.addcycles = self.extracycles[instructCode]
         self.instruct[instructCode](self)
         self.pc &= self.addrMask
         self.processorCycles += self.cycletime[instructCode] + self.excycles
+        scheduler = self.scheduler
+        if scheduler is not None and self.processorCycles >= scheduler.deadline:
+            scheduler.fire()
+        return self
+
+    def fire_events(self):
+        # fire the events of the scheduler that are due, if any
+        scheduler = self.scheduler
+        if scheduler is not None and self.processorCycles >= scheduler.deadline:
+            scheduler.fire()
+
+    def skip_to_event(self, limit=None):
+        # advance a waiting processor to the next scheduled event, if one
+        # is due within limit cycles (None for no limit), and fire it;
+        # returns the cycles skipped, or None if there is no such event
+        scheduler = self.scheduler
+        if scheduler is None or scheduler.deadline == NEVER:
+            return None
+        skip = max(scheduler.deadline - self.processorCycles, 0)
+        if limit is not None and skip > limit:
+            return None
+        self.processorCycles += skip
+        scheduler.fire()
+        return skip
+
+    def run(self, max_cycles=None, max_instructions=None, stopcodes=(), breakpoints=()):
+        """Execute instructions until a stop condition is reached.  At least
+        one instruction is always executed, unless max_instructions is zero
+        or less, in which case run() returns at once.  Execution stops after
+        max_instructions instructions, once max_cycles cycles have elapsed,
+        or when the next instruction is one of the opcodes in stopcodes or
+        is at one of the addresses in breakpoints.
+
+        A waiting processor (see WAI on the 65C02) burns one cycle per
+        instruction slot, as step() does, but skips straight to each event
+        of the scheduler, whose callback may wake it with an interrupt (see
+        py65.interrupts).  When no event is left within the budget, the
+        rest of the budget is consumed at once and run() returns; with no
+        budget at all it returns immediately.  A processor stopped by STP
+        never wakes, so without a budget run() returns as soon as it stops.
+
+        If tracer is set, its record() method is called before each
+        instruction as in step().  If scheduler is set, its due events are
+        fired after each instruction, before the stop conditions are
+        checked, and once before the first instruction.
+        """
+        memory = self.memory
+        instruct = self.instruct
+        cycletime = self.cycletime
+        extracycles = self.extracycles
+        addrMask = self.addrMask
+        tracer = self.tracer
+        scheduler = self.scheduler
+        stopcodes = frozenset(stopcodes)
+        breakpoints = frozenset(breakpoints)
+
+        if max_instructions is None:
+            max_instructions = -1
+        elif max_instructions <= 0:
+            return self
+        if max_cycles is None:
+            end_cycles = None
+        else:
+            end_cycles = self.processorCycles + max_cycles
+
+        self.fire_events()
+        count = 0
+        while True:
+            if self.waiting:
+                slots = []
+                if max_instructions >= 0:
+                    slots.append(max_instructions - count)
+                if end_cycles is not None:
+                    slots.append(end_cycles - self.processorCycles)
+                limit = max(min(slots), 1) if slots else None
+                if self.stopped and limit is None:
+                    # only a reset restarts a processor stopped by STP
+                    break
+
+                skipped = self.skip_to_event(limit)
+                if skipped is None:
+                    if limit is not None:
+                        self.processorCycles += limit
+                        self.fire_events()
+                    break
+
+                count += skipped
+                if count == max_instructions:
+                    break
+                if end_cycles is not None and self.processorCycles >= end_cycles:
+                    break
+                if self.waiting:
+                    continue
+                if breakpoints and self.pc in breakpoints:
+                    break
+                if stopcodes and memory[self.pc] in stopcodes:
+                    break
+                continue
+
+            instructCode = memory[self.pc]
+            if tracer is not None:
+                tracer.record(
+                    self.pc,
+                    instructCode,
+                    self.a,
+                    self.x,
+                    self.y,
+                    self.sp,
+                    self.p,
+                    self.processorCycles,
+                )
+            self.pc = (self.pc + 1) & addrMask
+            self.excycles = 0
+            self.addcycles = extracycles[instructCode]
+            instruct[instructCode](self)
+            self.pc &= addrMask
+            self.processorCycles += cycletime[instructCode] + self.excycles
+            if scheduler is not None and self.processorCycles >= scheduler.deadline:
+                scheduler.fire()
+
+            count += 1
+            if count == max_instructions:
+                break
+            if end_cycles is not None and self.processorCycles >= end_cycles:
+                break
+            if breakpoints and self.pc in breakpoints:
+                break
+            if stopcodes and memory[self.pc] in stopcodes:
+                break
+
         return self
 
     def reset(self):
@@ -82,10 +233,16 @@ class MPU:
         self.y = 0
         self.p = self.BREAK | self.UNUSED
         self.processorCycles = 0
+        self.waiting = False
+        self.stopped = False
 
     def irq(self):
         # triggers a normal IRQ
         # this is very similar to the BRK instruction
+        # an IRQ wakes a processor waiting after WAI even if it is masked
+        if self.stopped:
+            return
+        self.waiting = False
         if self.p & self.INTERRUPT:
             return
         self.stPushWord(self.pc)
@@ -98,6 +255,9 @@ class MPU:
     def nmi(self):
         # triggers a NMI IRQ in the processor
         # this is very similar to the BRK instruction
+        if self.stopped:
+            return
+        self.waiting = False
         self.stPushWord(self.pc)
         self.p &= ~self.BREAK
         self.stPush(self.p | self.UNUSED)
@@ -105,6 +265,42 @@ class MPU:
         self.pc = self.WordAt(self.NMI)
         self.processorCycles += 7
 
+    def snapshot(self):
+        """Return a Snapshot of the registers, cycle count, waiting flag
+        and memory.  Memory pages that have not changed since the last
+        snapshot was taken or restored are shared with it, so a snapshot
+        taken shortly after restoring another costs little extra space.
+        """
+        base = ()
+        if self.lastSnapshot is not None:
+            base = self.lastSnapshot.pages
+        self.lastSnapshot = Snapshot(
+            self.name,
+            (self.pc, self.a, self.x, self.y, self.sp, self.p),
+            self.processorCycles,
+            self.waiting,
+            memory_pages(self.memory, base),
+            self.stopped,
+        )
+        return self.lastSnapshot
+
+    def restore(self, snapshot):
+        """Return the MPU and its memory to the state in snapshot, which
+        must have been taken from an MPU of the same type with the same
+        type and size of memory.  Memory is loaded in place, bypassing
+        the subscribers of an ObservableMemory.
+        """
+        if snapshot.name != self.name:
+            msg = "Cannot restore a %s snapshot into a %s"
+            raise ValueError(msg % (snapshot.name, self.name))
+        load_pages(self.memory, snapshot.pages)
+        self.pc, self.a, self.x, self.y, self.sp, self.p = snapshot.registers
+        self.processorCycles = snapshot.processorCycles
+        self.waiting = snapshot.waiting
+        self.stopped = getattr(snapshot, "stopped", False)
+        self.lastSnapshot = snapshot
+        return self
+
     # Helpers for addressing modes
 
     def ByteAt(self, addr):
@@ -207,11 +403,7 @@ class MPU:
         return z
 
     def FlagsNZ(self, value):
-        self.p &= ~(self.ZERO | self.NEGATIVE)
-        if value == 0:
-            self.p |= self.ZERO
-        else:
-            self.p |= value & self.NEGATIVE
+        self.p = (self.p & ~(self.ZERO | self.NEGATIVE)) | self.nzFlags[value]
 
     # operations
 
@@ -231,11 +423,7 @@ class MPU:
         if tbyte & self.NEGATIVE:
             self.p |= self.CARRY
         tbyte = (tbyte << 1) & self.byteMask
-
-        if tbyte:
-            self.p |= tbyte & self.NEGATIVE
-        else:
-            self.p |= self.ZERO
+        self.p |= self.nzFlags[tbyte]
 
         if x is None:
             self.a = tbyte
@@ -325,39 +513,21 @@ class MPU:
         data = self.ByteAt(x())
 
         if self.p & self.DECIMAL:
-            halfcarry = 0
-            decimalcarry = 0
-            adjust0 = 0
-            adjust1 = 0
-            nibble0 = (data & 0xF) + (self.a & 0xF) + (self.p & self.CARRY)
-            if nibble0 > 9:
-                adjust0 = 6
-                halfcarry = 1
-            nibble1 = ((data >> 4) & 0xF) + ((self.a >> 4) & 0xF) + halfcarry
-            if nibble1 > 9:
-                adjust1 = 6
-                decimalcarry = 1
-
-            # the ALU outputs are not decimally adjusted
-            nibble0 = nibble0 & 0xF
-            nibble1 = nibble1 & 0xF
-            aluresult = (nibble1 << 4) + nibble0
-
-            # the final A contents will be decimally adjusted
-            nibble0 = (nibble0 + adjust0) & 0xF
-            nibble1 = (nibble1 + adjust1) & 0xF
-            final = (nibble1 << 4) + nibble0
+            if self.byteMask == 0xFF:
+                index = ((self.p & self.CARRY) << 16) | (self.a << 8) | data
+                entry = decimal_table(decimal_adc)[index]
+                final, flags = entry & 0xFF, entry >> 8
+            else:
+                final, flags = decimal_adc(
+                    self.a,
+                    data,
+                    self.p & self.CARRY,
+                    self.byteMask,
+                    self.NEGATIVE,
+                    self.OVERFLOW,
+                )
             self.p &= ~(self.CARRY | self.OVERFLOW | self.NEGATIVE | self.ZERO)
-
-            if final == 0:
-                self.p |= self.ZERO
-            if aluresult & 0x80:
-                self.p |= self.NEGATIVE
-            if decimalcarry == 1:
-                self.p |= self.CARRY
-            if (~(self.a ^ data) & (self.a ^ aluresult)) & self.NEGATIVE:
-                self.p |= self.OVERFLOW
-
+            self.p |= flags
             self.a = final
         else:
             if self.p & self.CARRY:
@@ -372,10 +542,7 @@ class MPU:
             if data > self.byteMask:
                 self.p |= self.CARRY
                 data &= self.byteMask
-            if data == 0:
-                self.p |= self.ZERO
-            else:
-                self.p |= data & self.NEGATIVE
+            self.p |= self.nzFlags[data]
             self.a = data
 
     def opROR(self, x):
@@ -424,51 +591,31 @@ class MPU:
         data = self.ByteAt(x())
 
         if self.p & self.DECIMAL:
-            halfcarry = 1
-            decimalcarry = 0
-            adjust0 = 0
-            adjust1 = 0
-
-            nibble0 = (self.a & 0xF) + (~data & 0xF) + (self.p & self.CARRY)
-            if nibble0 <= 0xF:
-                halfcarry = 0
-                adjust0 = 10
-            nibble1 = ((self.a >> 4) & 0xF) + ((~data >> 4) & 0xF) + halfcarry
-            if nibble1 <= 0xF:
-                adjust1 = 10 << 4
-
-            # the ALU outputs are not decimally adjusted
-            aluresult = self.a + (~data & self.byteMask) + (self.p & self.CARRY)
-
-            if aluresult > self.byteMask:
-                decimalcarry = 1
-            aluresult &= self.byteMask
-
-            # but the final result will be adjusted
-            nibble0 = (aluresult + adjust0) & 0xF
-            nibble1 = ((aluresult + adjust1) >> 4) & 0xF
-
-            self.p &= ~(self.CARRY | self.ZERO | self.NEGATIVE | self.OVERFLOW)
-            if aluresult == 0:
-                self.p |= self.ZERO
+            if self.byteMask == 0xFF:
+                index = ((self.p & self.CARRY) << 16) | (self.a << 8) | data
+                entry = decimal_table(decimal_sbc)[index]
+                final, flags = entry & 0xFF, entry >> 8
             else:
-                self.p |= aluresult & self.NEGATIVE
-            if decimalcarry == 1:
-                self.p |= self.CARRY
-            if ((self.a ^ data) & (self.a ^ aluresult)) & self.NEGATIVE:
-                self.p |= self.OVERFLOW
-            self.a = (nibble1 << 4) + nibble0
+                final, flags = decimal_sbc(
+                    self.a,
+                    data,
+                    self.p & self.CARRY,
+                    self.byteMask,
+                    self.NEGATIVE,
+                    self.OVERFLOW,
+                )
+            self.p &= ~(self.CARRY | self.ZERO | self.NEGATIVE | self.OVERFLOW)
+            self.p |= flags
+            self.a = final
         else:
             result = self.a + (~data & self.byteMask) + (self.p & self.CARRY)
             self.p &= ~(self.CARRY | self.ZERO | self.OVERFLOW | self.NEGATIVE)
             if ((self.a ^ data) & (self.a ^ result)) & self.NEGATIVE:
                 self.p |= self.OVERFLOW
             data = result & self.byteMask
-            if data == 0:
-                self.p |= self.ZERO
             if result > self.byteMask:
                 self.p |= self.CARRY
-            self.p |= data & self.NEGATIVE
+            self.p |= self.nzFlags[data]
             self.a = data
 
     def opDECR(self, x):
@@ -478,12 +625,8 @@ class MPU:
             addr = x()
             tbyte = self.ByteAt(addr)
 
-        self.p &= ~(self.ZERO | self.NEGATIVE)
         tbyte = (tbyte - 1) & self.byteMask
-        if tbyte:
-            self.p |= tbyte & self.NEGATIVE
-        else:
-            self.p |= self.ZERO
+        self.FlagsNZ(tbyte)
 
         if x is None:
             self.a = tbyte
@@ -497,12 +640,8 @@ class MPU:
             addr = x()
             tbyte = self.ByteAt(addr)
 
-        self.p &= ~(self.ZERO | self.NEGATIVE)
         tbyte = (tbyte + 1) & self.byteMask
-        if tbyte:
-            self.p |= tbyte & self.NEGATIVE
-        else:
-            self.p |= self.ZERO
+        self.FlagsNZ(tbyte)
 
         if x is None:
             self.a = tbyte
@@ -1275,3 +1414,143 @@ class MPU:
     def inst_0xfe(self):
         self.opINCR(self.AbsoluteXAddr)
         self.pc += 2
+
+
+# Snapshots
+
+
+class Snapshot:
+    """The state of an MPU returned by MPU.snapshot().  The memory is held
+    as a tuple of immutable pages (see py65.memory.memory_pages), so
+    snapshots can share pages with each other and can be pickled.
+    """
+
+    def __init__(self, name, registers, processorCycles, waiting, pages, stopped=False):
+        self.name = name
+        self.registers = registers  # (pc, a, x, y, sp, p)
+        self.processorCycles = processorCycles
+        self.waiting = waiting
+        self.pages = pages
+        self.stopped = stopped
+
+
+# Flag tables
+
+_nz_tables = {}
+
+
+def nz_table(byteWidth):
+    """Return the NEGATIVE and ZERO flags for each value of a byte that is
+    byteWidth bits wide.  The sign bit is the top bit of the byte.
+    """
+    table = _nz_tables.get(byteWidth)
+    if table is None:
+        negative = 1 << (byteWidth - 1)
+        table = [value & negative for value in range(1 << byteWidth)]
+        table[0] = MPU.ZERO
+        _nz_tables[byteWidth] = table
+    return table
+
+
+# Decimal mode arithmetic
+
+_decimal_tables = {}
+
+
+def decimal_table(function):
+    """Return the results of decimal_adc or decimal_sbc for 8-bit bytes as
+    an array indexed by carry << 16 | a << 8 | data.  Each entry holds the
+    result in its low byte and the flags in its high byte.  Tables are
+    built on first use.
+    """
+    table = _decimal_tables.get(function)
+    if table is None:
+        table = array("H", [0]) * 0x20000
+        for carry in (0, 1):
+            for a in range(0x100):
+                index = (carry << 16) | (a << 8)
+                for data in range(0x100):
+                    final, flags = function(a, data, carry, 0xFF, 0x80, 0x40)
+                    table[index | data] = final | (flags << 8)
+        _decimal_tables[function] = table
+    return table
+
+
+def decimal_adc(a, data, carry, byteMask, NEGATIVE, OVERFLOW):
+    """Add data and carry to a in decimal mode.  Returns the result and
+    the CARRY, OVERFLOW, NEGATIVE, and ZERO flags that are set.
+    """
+    halfcarry = 0
+    decimalcarry = 0
+    adjust0 = 0
+    adjust1 = 0
+    nibble0 = (data & 0xF) + (a & 0xF) + carry
+    if nibble0 > 9:
+        adjust0 = 6
+        halfcarry = 1
+    nibble1 = ((data >> 4) & 0xF) + ((a >> 4) & 0xF) + halfcarry
+    if nibble1 > 9:
+        adjust1 = 6
+        decimalcarry = 1
+
+    # the ALU outputs are not decimally adjusted
+    nibble0 = nibble0 & 0xF
+    nibble1 = nibble1 & 0xF
+    aluresult = (nibble1 << 4) + nibble0
+
+    # the final A contents will be decimally adjusted
+    nibble0 = (nibble0 + adjust0) & 0xF
+    nibble1 = (nibble1 + adjust1) & 0xF
+    final = (nibble1 << 4) + nibble0
+
+    flags = 0
+    if final == 0:
+        flags |= MPU.ZERO
+    if aluresult & 0x80:
+        flags |= NEGATIVE
+    if decimalcarry == 1:
+        flags |= MPU.CARRY
+    if (~(a ^ data) & (a ^ aluresult)) & NEGATIVE:
+        flags |= OVERFLOW
+    return final, flags
+
+
+def decimal_sbc(a, data, carry, byteMask, NEGATIVE, OVERFLOW):
+    """Subtract data and the borrow (not carry) from a in decimal mode.
+    Returns the result and the CARRY, OVERFLOW, NEGATIVE, and ZERO flags
+    that are set.
+    """
+    halfcarry = 1
+    decimalcarry = 0
+    adjust0 = 0
+    adjust1 = 0
+
+    nibble0 = (a & 0xF) + (~data & 0xF) + carry
+    if nibble0 <= 0xF:
+        halfcarry = 0
+        adjust0 = 10
+    nibble1 = ((a >> 4) & 0xF) + ((~data >> 4) & 0xF) + halfcarry
+    if nibble1 <= 0xF:
+        adjust1 = 10 << 4
+
+    # the ALU outputs are not decimally adjusted
+    aluresult = a + (~data & byteMask) + carry
+
+    if aluresult > byteMask:
+        decimalcarry = 1
+    aluresult &= byteMask
+
+    # but the final result will be adjusted
+    nibble0 = (aluresult + adjust0) & 0xF
+    nibble1 = ((aluresult + adjust1) >> 4) & 0xF
+
+    flags = 0
+    if aluresult == 0:
+        flags |= MPU.ZERO
+    else:
+        flags |= aluresult & NEGATIVE
+    if decimalcarry == 1:
+        flags |= MPU.CARRY
+    if ((a ^ data) & (a ^ aluresult)) & NEGATIVE:
+        flags |= OVERFLOW
+    return (nibble1 << 4) + nibble0, flags
@@ -6,11 +6,16 @@ class MPU(mpu6502.MPU):
     def __init__(self, *args, **kwargs):
         mpu6502.MPU.__init__(self, *args, **kwargs)
         self.name = "65C02"
-        self.waiting = False
 
     def step(self):
         if self.waiting:
-            self.processorCycles += 1
+            # skip to the next scheduled event, or burn one cycle; only a
+            # reset restarts a stopped processor, so it never skips
+            if self.stopped or self.skip_to_event() is None:
+                self.processorCycles += 1
+                scheduler = self.scheduler
+                if scheduler is not None and self.processorCycles >= scheduler.deadline:
+                    scheduler.fire()
         else:
             mpu6502.MPU.step(self)
         return self
@@ -284,6 +289,12 @@ class MPU(mpu6502.MPU):
     def inst_0xda(self):
         self.stPush(self.x)
 
+    @instruction(name="STP", mode="imp", cycles=3)
+    def inst_0xdb(self):
+        # only a reset restarts a stopped processor
+        self.waiting = True
+        self.stopped = True
+
     @instruction(name="SMB6", mode="zpg", cycles=5)
     def inst_0xe7(self):
         self.opSMB(self.ZeroPageAddr, 0x40)
@@ -22,7 +22,6 @@ class MPU(mpu6502.MPU):
     def __init__(self, *args, **kwargs):
         mpu6502.MPU.__init__(self, *args, **kwargs)
         self.name = "65Org16"
-        self.waiting = False
         self.IrqTo = (1 << self.ADDR_WIDTH) - 2
         self.ResetTo = (1 << self.ADDR_WIDTH) - 4
         self.NMITo = (1 << self.ADDR_WIDTH) - 6
@@ -31,7 +30,10 @@ class MPU(mpu6502.MPU):
 
     def step(self):
         if self.waiting:
-            self.processorCycles += 1
+            # skip to the next scheduled event, or burn one cycle
+            if self.skip_to_event() is None:
+                self.processorCycles += 1
+                self.fire_events()
         else:
             mpu6502.MPU.step(self)
         return self
@@ -1,5 +1,30 @@
+from py65.memory import ObservableMemory
 from py65.utils.addressing import AddressParser
 
+# addressing mode -> (instruction length, operand format, operand kind),
+# where the kind is "addr" or "byte" for operands that may be labels and
+# None for operands that are formatted as they are
+MODES = {
+    "acc": (1, " A", None),
+    "abs": (3, " %s", "addr"),
+    "abx": (3, " %s,X", "addr"),
+    "aby": (3, " %s,Y", "addr"),
+    "imm": (2, " #$%s", None),
+    "imp": (1, "", None),
+    "ind": (3, " (%s)", "addr"),
+    "iny": (2, " (%s),Y", "byte"),
+    "inx": (2, " (%s,X)", "byte"),
+    "iax": (3, " (%s,X)", "addr"),
+    "rel": (2, " %s", "addr"),
+    "zpi": (2, " (%s)", "byte"),
+    "zpg": (2, " %s", "byte"),
+    "zpx": (2, " %s,X", "byte"),
+    "zpy": (2, " %s,Y", "byte"),
+}
+
+# values read ahead at a time by instructions()
+CHUNK_SIZE = 4096
+
 
 class Disassembler:
     def __init__(self, mpu, address_parser=None):
@@ -16,131 +41,109 @@ class Disassembler:
         self.addrMask = mpu.addrMask
         self.byteMask = mpu.byteMask
 
+        self._opcodes = []
+        for disasm, addressing in mpu.disassemble:
+            if addressing not in MODES:
+                msg = "Addressing mode: %r" % addressing
+                raise NotImplementedError(msg)
+            self._opcodes.append((disasm, addressing))
+        self._lengths = [MODES[addressing][0] for _, addressing in self._opcodes]
+
+        # address -> (instruction bytes, text or template, target, fallback)
+        self._cache = {}
+
     def instruction_at(self, pc):
         """Disassemble the instruction at PC and return a tuple
         containing (instruction byte count, human readable text)
         """
+        pc &= self.addrMask
+        block = self._peek_block(pc, 3)
+        opcode = block[0]
+        length = self._lengths[opcode] if opcode < len(self._lengths) else 1
+        return (length, self._text(pc, block[:length]))
+
+    def instructions(self, start, end):
+        """Disassemble the instructions from start through end, wrapping
+        around the top of memory if start is greater than end.  Yields a
+        tuple of (address, instruction byte count, human readable text,
+        instruction bytes) for each instruction.
+
+        Memory is read in blocks without calling any read subscribers, so
+        listing I/O addresses has no side effects.  Decoded instructions
+        are cached by address and reused while their bytes are unchanged.
+        """
+        size = self.addrMask + 1
+        count = (end - start) % size + 1
+        lengths = self._lengths
+        text = self._text
+
+        offset = 0
+        while offset < count:
+            address = (start + offset) % size
+            chunk = min(count - offset, CHUNK_SIZE)
+            block = self._peek_block(address, chunk + 2)
+
+            index = 0
+            while index < chunk:
+                pc = (address + index) % size
+                opcode = block[index]
+                length = lengths[opcode] if opcode < len(lengths) else 1
+                values = block[index : index + length]
+                yield (pc, length, text(pc, values), values)
+                index += length
+            offset += index
+
+    def _peek_block(self, start, length):
+        memory = self._mpu.memory
+        if isinstance(memory, ObservableMemory):
+            return memory.peek_block(start, length)
+
+        size = len(memory)
+        start %= size
+        block = memory[start : start + length]
+        while len(block) < length:
+            block += memory[: length - len(block)]
+        return block
+
+    def _text(self, pc, values):
+        entry = self._cache.get(pc)
+        if entry is None or entry[0] != values:
+            entry = self._cache[pc] = self._decode(pc, values)
+        values, text, target, fallback = entry
+        if target is not None:
+            text = text % self._address_parser.label_for(target, fallback)
+        return text
+
+    def _decode(self, pc, values):
+        # returns (values, text, None, None) or, for an operand that may
+        # be a label, (values, template, target address, fallback text)
+        if values[0] >= len(self._opcodes):
+            return (values, "???", None, None)
+        disasm, addressing = self._opcodes[values[0]]
+        length, format, kind = MODES[addressing]
+
+        if length == 1:
+            return (values, disasm + format, None, None)
+        if length == 2:
+            operand = values[1]
+        else:
+            operand = values[1] + (values[2] << self.byteWidth)
+
+        if kind is None:
+            # immediate
+            return (values, disasm + format % (self.byteFmt % operand), None, None)
 
-        instruction = self._mpu.ByteAt(pc)
-        disasm, addressing = self._mpu.disassemble[instruction]
-
-        if addressing == "acc":
-            disasm += " A"
-            length = 1
-
-        elif addressing == "abs":
-            address = self._mpu.WordAt(pc + 1)
-            address_or_label = self._address_parser.label_for(
-                address, "$" + self.addrFmt % address
-            )
-            disasm += " " + address_or_label
-            length = 3
-
-        elif addressing == "abx":
-            address = self._mpu.WordAt(pc + 1)
-            address_or_label = self._address_parser.label_for(
-                address, "$" + self.addrFmt % address
-            )
-            disasm += " %s,X" % address_or_label
-            length = 3
-
-        elif addressing == "aby":
-            address = self._mpu.WordAt(pc + 1)
-            address_or_label = self._address_parser.label_for(
-                address, "$" + self.addrFmt % address
-            )
-            disasm += " %s,Y" % address_or_label
-            length = 3
-
-        elif addressing == "imm":
-            byte = self._mpu.ByteAt(pc + 1)
-            disasm += " #$" + self.byteFmt % byte
-            length = 2
-
-        elif addressing == "imp":
-            length = 1
-
-        elif addressing == "ind":
-            address = self._mpu.WordAt(pc + 1)
-            address_or_label = self._address_parser.label_for(
-                address, "$" + self.addrFmt % address
-            )
-            disasm += " (%s)" % address_or_label
-            length = 3
-
-        elif addressing == "iny":
-            zp_address = self._mpu.ByteAt(pc + 1)
-            address_or_label = self._address_parser.label_for(
-                zp_address, "$" + self.byteFmt % zp_address
-            )
-            disasm += " (%s),Y" % address_or_label
-            length = 2
-
-        elif addressing == "inx":
-            zp_address = self._mpu.ByteAt(pc + 1)
-            address_or_label = self._address_parser.label_for(
-                zp_address, "$" + self.byteFmt % zp_address
-            )
-            disasm += " (%s,X)" % address_or_label
-            length = 2
-
-        elif addressing == "iax":
-            address = self._mpu.WordAt(pc + 1)
-            address_or_label = self._address_parser.label_for(
-                address, "$" + self.addrFmt % address
-            )
-            disasm += " (%s,X)" % address_or_label
-            length = 3
-
-        elif addressing == "rel":
-            opv = self._mpu.ByteAt(pc + 1)
-            targ = pc + 2
-            if opv & (1 << (self.byteWidth - 1)):
-                targ -= (opv ^ self.byteMask) + 1
+        target = operand
+        if addressing == "rel":
+            target = pc + 2
+            if operand & (1 << (self.byteWidth - 1)):
+                target -= (operand ^ self.byteMask) + 1
             else:
-                targ += opv
-            targ &= self.addrMask
-
-            address_or_label = self._address_parser.label_for(
-                targ, "$" + self.addrFmt % targ
-            )
-            disasm += " " + address_or_label
-            length = 2
-
-        elif addressing == "zpi":
-            zp_address = self._mpu.ByteAt(pc + 1)
-            address_or_label = self._address_parser.label_for(
-                zp_address, "$" + self.byteFmt % zp_address
-            )
-            disasm += " (%s)" % address_or_label
-            length = 2
-
-        elif addressing == "zpg":
-            zp_address = self._mpu.ByteAt(pc + 1)
-            address_or_label = self._address_parser.label_for(
-                zp_address, "$" + self.byteFmt % zp_address
-            )
-            disasm += " %s" % address_or_label
-            length = 2
-
-        elif addressing == "zpx":
-            zp_address = self._mpu.ByteAt(pc + 1)
-            address_or_label = self._address_parser.label_for(
-                zp_address, "$" + self.byteFmt % zp_address
-            )
-            disasm += " %s,X" % address_or_label
-            length = 2
-
-        elif addressing == "zpy":
-            zp_address = self._mpu.ByteAt(pc + 1)
-            address_or_label = self._address_parser.label_for(
-                zp_address, "$" + self.byteFmt % zp_address
-            )
-            disasm += " %s,Y" % address_or_label
-            length = 2
+                target += operand
+            target &= self.addrMask
 
+        if kind == "addr":
+            fallback = "$" + self.addrFmt % target
         else:
-            msg = "Addressing mode: %r" % addressing
-            raise NotImplementedError(msg)
-
-        return (length, disasm)
+            fallback = "$" + self.byteFmt % target
+        return (values, disasm + format, target, fallback)
@@ -0,0 +1,215 @@
+import sys
+from collections import deque
+
+# approximate bytes held by a journal entry and by each write it records
+ENTRY_SIZE = 200
+WRITE_SIZE = 100
+
+
+class History:
+    """Record the execution of an MPU whose memory is an ObservableMemory
+    so that it can be rewound.
+
+    Every instruction run through step() or run() is journaled with the
+    registers, cycle count and waiting flag from before it and the old
+    values of the memory it wrote, so rewinding within the journal is
+    exact and takes time proportional to the instructions undone.  Writes
+    made between instructions, such as by monitor commands, are journaled
+    with the next instruction.
+
+    Every interval cycles, and after writes made between instructions, a
+    checkpoint is taken with MPU.snapshot().  The checkpoints reach further
+    back than the journal: rewinding past the journal restores the last
+    checkpoint before the instruction asked for and runs forward to it
+    again, so the devices read and written since are accessed again.
+    The journal and the checkpoints may each use about half of limit bytes
+    and discard their oldest entries first to stay within it.
+    """
+
+    def __init__(self, mpu, limit=64 * 1024 * 1024, interval=1000000):
+        self.mpu = mpu
+        self.limit = limit
+        self.interval = interval
+        self.executed = 0  # instructions recorded, less those rewound
+
+        self.journal = deque()  # ((pc, a, x, y, sp, p, cycles, waiting), writes)
+        self._journal_size = 0
+        self._writes = []
+
+        self.checkpoints = []  # (executed, snapshot)
+        self._pages = {}  # id(page) -> [page, number of checkpoints]
+        self._checkpoint_size = 0
+        self._checkpoint()
+
+        memory = mpu.memory
+        memory.subscribe_to_write_range(0, memory.physMask, self._written)
+
+    def close(self):
+        """Stop recording writes to the memory."""
+        self.mpu.memory.unsubscribe_from_write(self._written)
+
+    def size(self):
+        """Return the approximate number of bytes used by the history."""
+        return self._journal_size + self._checkpoint_size
+
+    def step(self):
+        """Execute and record one instruction."""
+        mpu = self.mpu
+        if self._writes or mpu.processorCycles >= self._next_checkpoint:
+            # runs forward from a checkpoint cannot repeat the writes made
+            # between instructions, so one is taken after them
+            self._checkpoint()
+
+        state = (
+            mpu.pc,
+            mpu.a,
+            mpu.x,
+            mpu.y,
+            mpu.sp,
+            mpu.p,
+            mpu.processorCycles,
+            mpu.waiting,
+        )
+        mpu.step()
+
+        writes, self._writes = tuple(self._writes), []
+        self.journal.append((state, writes))
+        self.executed += 1
+        self._journal_size += ENTRY_SIZE + WRITE_SIZE * len(writes)
+        while self._journal_size > self.limit // 2 and self.journal:
+            state, writes = self.journal.popleft()
+            self._journal_size -= ENTRY_SIZE + WRITE_SIZE * len(writes)
+
+    def run(self, stopcodes=(), breakpoints=()):
+        """Execute and record instructions like MPU.run() with no cycle or
+        instruction budget, until the next instruction is one of the
+        opcodes in stopcodes or is at one of the addresses in breakpoints.
+        A waiting processor skips to the next event of the scheduler, which
+        may wake it, as in MPU.run(); run() returns when none is left.
+
+        Each instruction is run and recorded through step(), so recording
+        runs at about the speed of the interpreter whatever engine the MPU
+        uses.
+        """
+        mpu = self.mpu
+        memory = mpu.memory
+        mpu.fire_events()
+        while True:
+            if mpu.waiting:
+                if mpu.stopped or mpu.skip_to_event() is None:
+                    break
+                if mpu.waiting:
+                    continue
+            else:
+                self.step()
+            if mpu.pc in breakpoints or memory[mpu.pc] in stopcodes:
+                break
+
+    def back(self, count):
+        """Rewind count instructions, or as far as the history reaches.
+        Returns the number of instructions rewound.
+        """
+        start = self.executed
+        target = max(start - count, 0)
+        while self.executed > target and self.journal:
+            self._undo()
+        if self.executed > target:
+            if self._restore(lambda executed, snapshot: executed <= target):
+                while self.executed < target:
+                    self.step()
+        return start - self.executed
+
+    def rewind(self, cycles):
+        """Rewind to the last recorded instruction that started at or
+        before the cycle count cycles.  Returns the number of instructions
+        rewound.
+        """
+        start = self.executed
+        mpu = self.mpu
+        while mpu.processorCycles > cycles and self.journal:
+            self._undo()
+        if mpu.processorCycles > cycles:
+            if self._restore(
+                lambda executed, snapshot: snapshot.processorCycles <= cycles
+            ):
+                # run past cycles and take back the instruction that did
+                while mpu.processorCycles <= cycles and self.executed < start:
+                    self.step()
+                if mpu.processorCycles > cycles:
+                    self._undo()
+        return start - self.executed
+
+    def _written(self, address, value):
+        self._writes.append((address, self.mpu.memory.peek(address)))
+
+    def _undo(self):
+        state, writes = self.journal.pop()
+        self._journal_size -= ENTRY_SIZE + WRITE_SIZE * len(writes)
+
+        # writes made since the instruction ran are undone with it
+        writes = writes + tuple(self._writes)
+        self._writes = []
+        mpu = self.mpu
+        memory = mpu.memory
+        for address, value in reversed(writes):
+            memory.write(address, [value])
+        if writes and hasattr(mpu, "drop_blocks"):
+            # the writes bypass the subscribers that keep the blocks of a
+            # translating MPU current
+            mpu.drop_blocks()
+
+        mpu.pc, mpu.a, mpu.x, mpu.y, mpu.sp, mpu.p = state[:6]
+        mpu.processorCycles, mpu.waiting = state[6:]
+        self.executed -= 1
+        self._forget_checkpoints_after(self.executed)
+
+    def _restore(self, usable):
+        for executed, snapshot in reversed(self.checkpoints):
+            if usable(executed, snapshot):
+                break
+        else:
+            return False
+
+        self.mpu.restore(snapshot)
+        self.executed = executed
+        self.journal.clear()
+        self._journal_size = 0
+        self._writes = []
+        self._forget_checkpoints_after(executed)
+        return True
+
+    def _checkpoint(self):
+        if self.checkpoints and self.checkpoints[-1][0] == self.executed:
+            self._forget(self.checkpoints.pop())
+        snapshot = self.mpu.snapshot()
+        self.checkpoints.append((self.executed, snapshot))
+        self._next_checkpoint = snapshot.processorCycles + self.interval
+        for page in snapshot.pages:
+            entry = self._pages.get(id(page))
+            if entry is None:
+                self._pages[id(page)] = [page, 1]
+                self._checkpoint_size += sys.getsizeof(page)
+            else:
+                entry[1] += 1
+
+        # the newest checkpoint is kept even if it alone is over the limit
+        while self._checkpoint_size > self.limit // 2 and len(self.checkpoints) > 1:
+            self._forget(self.checkpoints.pop(0))
+
+    def _forget_checkpoints_after(self, executed):
+        while self.checkpoints and self.checkpoints[-1][0] > executed:
+            self._forget(self.checkpoints.pop())
+        if self.checkpoints:
+            cycles = self.checkpoints[-1][1].processorCycles + self.interval
+        else:
+            cycles = self.mpu.processorCycles
+        self._next_checkpoint = cycles
+
+    def _forget(self, checkpoint):
+        executed, snapshot = checkpoint
+        for page in snapshot.pages:
+            entry = self._pages[id(page)]
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._pages[id(page)]
+                self._checkpoint_size -= sys.getsizeof(page)
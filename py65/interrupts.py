@@ -0,0 +1,78 @@
+"""Model the IRQ and NMI lines of an MPU, so that several devices can
+hold the same line on their own behalf.
+
+Devices call assert_irq() and deassert_irq() with a name of their own.
+The IRQ line is level-triggered: it is sampled at each instruction
+boundary while any device asserts it, and the MPU takes the interrupt
+whenever its I flag is clear.  An interrupt handler that does not make
+its device deassert the line is therefore entered again after RTI, as
+on the real processor.  While the line is asserted and masked it is
+sampled after every instruction.
+
+The NMI line is edge-triggered: the MPU takes one NMI when the first
+device asserts it, whatever the I flag, and none again until every
+device has deasserted it and one asserts it again.
+
+Either interrupt wakes a 65C02 waiting after WAI, which continues after
+the WAI without taking a masked IRQ.  A processor stopped by STP stays
+stopped until it is reset.
+
+Lines are sampled through the scheduler of the MPU (see py65.scheduler),
+which is created and attached if the MPU has none, so create the
+InterruptLines before running the MPU.
+"""
+
+from py65.scheduler import Scheduler
+
+
+class InterruptLines:
+    def __init__(self, mpu):
+        if mpu.scheduler is None:
+            mpu.scheduler = Scheduler(mpu)
+        self.mpu = mpu
+        self.irq_sources = set()
+        self.nmi_sources = set()
+        self.nmi_pending = False
+        self._sampling = False
+
+    def assert_irq(self, source):
+        """Hold the IRQ line on behalf of source."""
+        self.irq_sources.add(source)
+        self._sample(self.mpu.processorCycles)
+
+    def deassert_irq(self, source):
+        """Release the IRQ line held by source, if it holds it."""
+        self.irq_sources.discard(source)
+
+    def assert_nmi(self, source):
+        """Hold the NMI line on behalf of source.  An NMI is taken at the
+        next instruction boundary if no other source holds the line.
+        """
+        if not self.nmi_sources:
+            self.nmi_pending = True
+            self._sample(self.mpu.processorCycles)
+        self.nmi_sources.add(source)
+
+    def deassert_nmi(self, source):
+        """Release the NMI line held by source, if it holds it."""
+        self.nmi_sources.discard(source)
+
+    def _sample(self, cycle):
+        # sample the lines at the instruction boundary at or after cycle
+        if not self._sampling:
+            self._sampling = True
+            self.mpu.scheduler.at(cycle, self._boundary)
+
+    def _boundary(self, cycle):
+        self._sampling = False
+        mpu = self.mpu
+        if self.nmi_pending:
+            self.nmi_pending = False
+            mpu.nmi()
+        elif self.irq_sources:
+            mpu.irq()
+
+        # a held IRQ line is sampled again after the next instruction,
+        # unless the processor is stopped and no instruction will come
+        if self.irq_sources and not mpu.stopped:
+            self._sample(mpu.processorCycles + 1)
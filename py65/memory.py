@@ -1,50 +1,101 @@
-from collections import defaultdict
+from array import array
+from itertools import chain
+
+# number of cells in each page of memory_pages()
+PAGE_SIZE = 256
+
+
+def make_memory(size, byteWidth=8):
+    """Return a zero-filled memory of size cells that indexes and slices
+    like a list of ints.  Memory with 8-bit bytes is a bytearray and wider
+    memory is an array of unsigned 16-bit values.  Both use a fraction of
+    the space of a list and can be copied or loaded with a single buffer
+    copy.
+    """
+    if byteWidth <= 8:
+        return bytearray(size)
+    return array("H", [0x00]) * size
 
 
 class ObservableMemory:
-    def __init__(self, subject=None, addrWidth=16):
+    def __init__(self, subject=None, addrWidth=16, byteWidth=None):
         self.physMask = 0xFFFF
         if addrWidth > 16:
             # even with 32-bit address space, model only 256k memory
             self.physMask = 0x3FFFF
 
+        if byteWidth is None:
+            # only the 65Org16 has a wide address space, and its bytes
+            # are 16 bits wide
+            byteWidth = 16 if addrWidth > 16 else 8
+
         if subject is None:
-            subject = (self.physMask + 1) * [0x00]
+            subject = make_memory(self.physMask + 1, byteWidth)
         self._subject = subject
 
-        self._read_subscribers = defaultdict(list)
-        self._write_subscribers = defaultdict(list)
+        self._read_subscribers = {}
+        self._write_subscribers = {}
+        self._read_ranges = []
+        self._write_ranges = []
+
+        # 256-entry page maps flag the pages that have any subscribers so
+        # accesses to plain memory never need to consult the tables above.
+        # The range page maps hold the range subscriptions overlapping
+        # each page.
+        self._pageShift = self.physMask.bit_length() - 8
+        self._read_pages = bytearray(256)
+        self._write_pages = bytearray(256)
+        self._read_range_pages = [()] * 256
+        self._write_range_pages = [()] * 256
 
     def __setitem__(self, address, value):
         if isinstance(address, slice):
-            r = range(*address.indices(self.physMask + 1))
-            for n, v in zip(r, value):
-                self[n] = v
+            start, stop, step = address.indices(self.physMask + 1)
+            r = range(start, stop, step)
+            if step == 1:
+                self.write_block(start, list(value)[: len(r)])
+            else:
+                for n, v in zip(r, value):
+                    self[n] = v
             return
 
         address &= self.physMask
-        callbacks = self._write_subscribers[address]
-
-        for callback in callbacks:
-            result = callback(address, value)
-            if result is not None:
-                value = result
+        page = address >> self._pageShift
+        if self._write_pages[page]:
+            for callback in self._write_subscribers.get(address, ()):
+                result = callback(address, value)
+                if result is not None:
+                    value = result
+            for start, end, callback in self._write_range_pages[page]:
+                if start <= address <= end:
+                    result = callback(address, value)
+                    if result is not None:
+                        value = result
 
         self._subject[address] = value
 
     def __getitem__(self, address):
         if isinstance(address, slice):
-            r = range(*address.indices(self.physMask + 1))
-            return [self[n] for n in r]
+            start, stop, step = address.indices(self.physMask + 1)
+            if step == 1:
+                return list(self.read_block(start, max(stop - start, 0)))
+            return [self[n] for n in range(start, stop, step)]
 
         address &= self.physMask
-        callbacks = self._read_subscribers[address]
-        final_result = None
+        page = address >> self._pageShift
+        if not self._read_pages[page]:
+            return self._subject[address]
 
-        for callback in callbacks:
+        final_result = None
+        for callback in self._read_subscribers.get(address, ()):
             result = callback(address)
             if result is not None:
                 final_result = result
+        for start, end, callback in self._read_range_pages[page]:
+            if start <= address <= end:
+                result = callback(address)
+                if result is not None:
+                    final_result = result
 
         if final_result is None:
             return self._subject[address]
@@ -60,6 +111,7 @@ class ObservableMemory:
             callbacks = self._write_subscribers.setdefault(address, [])
             if callback not in callbacks:
                 callbacks.append(callback)
+            self._write_pages[address >> self._pageShift] = 1
 
     def subscribe_to_read(self, address_range, callback):
         for address in address_range:
@@ -67,7 +119,289 @@ class ObservableMemory:
             callbacks = self._read_subscribers.setdefault(address, [])
             if callback not in callbacks:
                 callbacks.append(callback)
+            self._read_pages[address >> self._pageShift] = 1
+
+    def subscribe_to_write_range(self, start_address, end_address, callback):
+        """Call callback(address, value) on writes to any address from
+        start_address through end_address, inclusive.  The range is stored
+        as a single entry no matter how large it is.  Range subscribers are
+        called after those registered with subscribe_to_write.
+        """
+        self._write_ranges = self._add_range(
+            self._write_ranges, start_address, end_address, callback
+        )
+        self._write_pages, self._write_range_pages = self._index_pages(
+            self._write_subscribers, self._write_ranges
+        )
+
+    def subscribe_to_read_range(self, start_address, end_address, callback):
+        """Call callback(address) on reads from any address from
+        start_address through end_address, inclusive.  The range is stored
+        as a single entry no matter how large it is.  Range subscribers are
+        called after those registered with subscribe_to_read.
+        """
+        self._read_ranges = self._add_range(
+            self._read_ranges, start_address, end_address, callback
+        )
+        self._read_pages, self._read_range_pages = self._index_pages(
+            self._read_subscribers, self._read_ranges
+        )
+
+    def unsubscribe_from_write(self, callback):
+        """Remove callback from every address and range it was subscribed
+        to for writes.
+        """
+        self._write_ranges = self._remove_callback(
+            self._write_subscribers, self._write_ranges, callback
+        )
+        self._write_pages, self._write_range_pages = self._index_pages(
+            self._write_subscribers, self._write_ranges
+        )
+
+    def unsubscribe_from_read(self, callback):
+        """Remove callback from every address and range it was subscribed
+        to for reads.
+        """
+        self._read_ranges = self._remove_callback(
+            self._read_subscribers, self._read_ranges, callback
+        )
+        self._read_pages, self._read_range_pages = self._index_pages(
+            self._read_subscribers, self._read_ranges
+        )
+
+    def _add_range(self, ranges, start_address, end_address, callback):
+        start_address &= self.physMask
+        end_address &= self.physMask
+        if start_address > end_address:
+            msg = "Range start $%x is above end $%x"
+            raise ValueError(msg % (start_address, end_address))
+
+        # merge with overlapping or adjacent ranges of the same callback so
+        # that it is never called twice for one access
+        kept = []
+        position = None
+        for start, end, other in ranges:
+            touches = start <= end_address + 1 and end + 1 >= start_address
+            if other == callback and touches:
+                start_address = min(start, start_address)
+                end_address = max(end, end_address)
+                if position is None:
+                    position = len(kept)
+            else:
+                kept.append((start, end, other))
+
+        if position is None:
+            position = len(kept)
+        kept.insert(position, (start_address, end_address, callback))
+        return kept
+
+    def _remove_callback(self, subscribers, ranges, callback):
+        for address in list(subscribers.keys()):
+            callbacks = subscribers[address]
+            if callback in callbacks:
+                callbacks.remove(callback)
+                if not callbacks:
+                    del subscribers[address]
+        return [r for r in ranges if r[2] != callback]
+
+    def _index_pages(self, subscribers, ranges):
+        shift = self._pageShift
+        pages = bytearray(256)
+        range_pages = [()] * 256
+        for address in subscribers:
+            pages[address >> shift] = 1
+        for entry in ranges:
+            start, end, callback = entry
+            for page in range(start >> shift, (end >> shift) + 1):
+                pages[page] = 1
+                range_pages[page] += (entry,)
+        return pages, range_pages
+
+    def has_read_subscribers(self, address, end_address=None):
+        """Return True if reading address, or any address from address
+        through end_address inclusive, calls any read subscriber.
+        """
+        if end_address is not None:
+            spans = self._observed_spans(
+                self._read_subscribers,
+                self._read_ranges,
+                address & self.physMask,
+                end_address & self.physMask,
+            )
+            return bool(spans)
+
+        address &= self.physMask
+        page = address >> self._pageShift
+        if not self._read_pages[page]:
+            return False
+        if address in self._read_subscribers:
+            return True
+        for start, end, callback in self._read_range_pages[page]:
+            if start <= address <= end:
+                return True
+        return False
+
+    def peek(self, address):
+        """Return the value at address without calling any read
+        subscribers.
+        """
+        return self._subject[address & self.physMask]
+
+    def peek_block(self, start_address, length):
+        """Read length values starting at start_address, wrapping around
+        the top of memory, without calling any read subscribers.  The
+        result is a slice of the same type as the subject.
+        """
+        start_address &= self.physMask
+        end_address = start_address + length
+        if end_address <= self.physMask + 1:
+            return self._subject[start_address:end_address]
+
+        size = self.physMask + 1
+        block = self._subject[start_address:size]
+        while len(block) < length:
+            block += self._subject[: min(length - len(block), size)]
+        return block
+
+    def read_block(self, start_address, length):
+        """Read length values starting at start_address, wrapping around
+        the top of memory.  Unobserved spans are copied straight from the
+        subject and only observed addresses go through the read
+        subscribers.  The result is a slice of the same type as the
+        subject, such as a bytearray.
+        """
+        size = self.physMask + 1
+        start_address &= self.physMask
+
+        blocks = []
+        while length > 0:
+            count = min(length, size - start_address)
+            end_address = start_address + count - 1
+
+            block = self._subject[start_address : end_address + 1]
+            spans = self._observed_spans(
+                self._read_subscribers, self._read_ranges, start_address, end_address
+            )
+            for start, end in spans:
+                for address in range(start, end + 1):
+                    block[address - start_address] = self[address]
+
+            blocks.append(block)
+            length -= count
+            start_address = 0
+
+        if not blocks:
+            return self._subject[0:0]
+        result = blocks[0]
+        for block in blocks[1:]:
+            result += block
+        return result
+
+    def write_block(self, start_address, values):
+        """Write a sequence of values starting at start_address, wrapping
+        around the top of memory.  Unobserved spans are copied straight
+        into the subject and only observed addresses go through the write
+        subscribers.
+        """
+        if isinstance(self._subject, array) and not isinstance(values, array):
+            values = array(self._subject.typecode, values)
+
+        size = self.physMask + 1
+        start_address &= self.physMask
+
+        offset = 0
+        while offset < len(values):
+            count = min(len(values) - offset, size - start_address)
+            end_address = start_address + count - 1
+
+            position = start_address
+            spans = self._observed_spans(
+                self._write_subscribers, self._write_ranges, start_address, end_address
+            )
+            for start, end in spans + [(end_address + 1, end_address)]:
+                if position < start:
+                    first = offset + position - start_address
+                    last = offset + start - start_address
+                    self._subject[position:start] = values[first:last]
+                for address in range(start, end + 1):
+                    self[address] = values[offset + address - start_address]
+                position = end + 1
+
+            offset += count
+            start_address = 0
+
+    def _observed_spans(self, subscribers, ranges, start_address, end_address):
+        # sorted, merged (start, end) spans of the subscribed addresses
+        # between start_address and end_address, inclusive
+        spans = [(a, a) for a in subscribers if start_address <= a <= end_address]
+        for start, end, callback in ranges:
+            if start <= end_address and end >= start_address:
+                spans.append((max(start, start_address), min(end, end_address)))
+        spans.sort()
+
+        merged = []
+        for start, end in spans:
+            if merged and start <= merged[-1][1] + 1:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+        return merged
 
     def write(self, start_address, bytes):
         start_address &= self.physMask
+        if isinstance(self._subject, array) and not isinstance(bytes, array):
+            bytes = array(self._subject.typecode, bytes)
         self._subject[start_address : start_address + len(bytes)] = bytes
+
+
+def memory_pages(memory, base=()):
+    """Return the contents of memory as a tuple of pages of PAGE_SIZE
+    cells.  Pages are immutable: bytes for a bytearray or an array, whose
+    values are kept in machine order, and tuples for other sequences.  A
+    page with the same contents as a page in base, or as an earlier page,
+    is the same object, so pages shared by many snapshots are stored once
+    and pickled once.  The subject of an ObservableMemory is read directly
+    without calling any read subscribers.
+    """
+    if isinstance(memory, ObservableMemory):
+        memory = memory._subject
+    if isinstance(memory, bytearray):
+        data, size = bytes(memory), PAGE_SIZE
+    elif isinstance(memory, array):
+        data, size = _tobytes(memory), PAGE_SIZE * memory.itemsize
+    else:
+        data, size = tuple(memory), PAGE_SIZE
+
+    known = dict((page, page) for page in base)
+    pages = []
+    for start in range(0, len(data), size):
+        page = data[start : start + size]
+        pages.append(known.setdefault(page, page))
+    return tuple(pages)
+
+
+def load_pages(memory, pages):
+    """Replace the contents of memory with pages returned by
+    memory_pages().  The memory must be of the same type and size as the
+    one the pages were taken from.  The subject of an ObservableMemory is
+    written directly without calling any write subscribers.
+    """
+    if isinstance(memory, ObservableMemory):
+        memory = memory._subject
+    if isinstance(memory, bytearray):
+        values = b"".join(pages)
+    elif isinstance(memory, array):
+        values = array(memory.typecode)
+        _frombytes(values, b"".join(pages))
+    else:
+        values = list(chain.from_iterable(pages))
+
+    if len(values) != len(memory):
+        msg = "Pages of %d cells do not fit memory of %d cells"
+        raise ValueError(msg % (len(values), len(memory)))
+    memory[:] = values
+
+
+# array.tostring() and fromstring() were renamed in Python 3
+_tobytes = getattr(array, "tobytes", None) or array.tostring
+_frombytes = getattr(array, "frombytes", None) or array.fromstring
@@ -7,41 +7,64 @@ Usage: %s [options]
 Options:
 -h, --help             : Show this message
 -m, --mpu <device>     : Choose which MPU device (default is 6502)
+-e, --engine <name>    : Choose how instructions are run: interpreter, fast
+                         or translating (default is interpreter)
 -l, --load <file>      : Load a file at address 0
 -r, --rom <file>       : Load a rom at the top of address space and reset into it
 -g, --goto <address>   : Perform a goto command after loading any files
 -i, --input <address>  : define location of getc (default $f004)
 -o, --output <address> : define location of putc (default $f001)
+-s, --script <file>    : Run the commands in file without a terminal and
+                         exit, reading them from stdin if file is -
+-S, --status           : Show the registers after each command of a script
 """
 
 import cmd
 import getopt
+import io
 import os
 import re
 import shlex
 import sys
 import traceback
+from array import array
 
-from py65.assembler import Assembler
+from py65.assembler import Assembler, FileAssembler
+from py65.devices import fastcore
 from py65.devices.mpu65c02 import MPU as CMOS65C02
 from py65.devices.mpu65org16 import MPU as V65Org16
 from py65.devices.mpu6502 import MPU as NMOS6502
 from py65.disassembler import Disassembler
+from py65.history import History
 from py65.memory import ObservableMemory
+from py65.profiler import Profiler
 from py65.utils import console
 from py65.utils.addressing import AddressParser
 from py65.utils.conversions import itoa
+from py65.utils.labels import load_labels
 
 try:
     from urllib2 import urlopen
 except ImportError:  # Python 3
     from urllib.request import urlopen
 
+try:
+    from StringIO import StringIO  # type: ignore[import-error]
+except ImportError:  # Python 3
+    from io import StringIO
+
 
 class Monitor(cmd.Cmd):
 
     Microprocessors = {"6502": NMOS6502, "65C02": CMOS65C02, "65Org16": V65Org16}
 
+    # functions returning the class that runs an MPU class on each engine
+    Engines = {
+        "interpreter": lambda mpu_type: mpu_type,
+        "fast": fastcore.make_fast_mpu,
+        "translating": fastcore.make_translating_mpu,
+    }
+
     def __init__(
         self,
         argv=None,
@@ -51,36 +74,54 @@ class Monitor(cmd.Cmd):
         memory=None,
         putc_addr=0xF001,
         getc_addr=0xF004,
+        headless=False,
     ):
         self.mpu_type = mpu_type
+        self.engine = "interpreter"
         self.memory = memory
         self.putc_addr = putc_addr
         self.getc_addr = getc_addr
+        self.headless = headless
+        self.show_status = None
+        self.script = None
         self._breakpoints = []
         self._width = 78
+        self._error = None
         self.prompt = "."
         self._add_shortcuts()
 
-        # Save the current system input mode so it can be restored after
-        # after processing commands and before exiting.
-        console.save_mode(sys.stdin)
-
-        # Attempt to get a copy of stdin that is unbuffered on systems
-        # that support it.  This allows for immediate response to
-        # typed input as well as pasted input.  If unable to get an
-        # unbuffered version of stdin, the original version is returned.
-        self.unbuffered_stdin = console.get_unbuffered_stdin(stdin)
-
-        cmd.Cmd.__init__(self, stdin=self.unbuffered_stdin, stdout=stdout)
+        cmd.Cmd.__init__(self, stdin=stdin, stdout=stdout)
+        self.output = console.BufferedOutput(self.stdout)
+
+        if argv is None:
+            argv = sys.argv
+        load, rom, goto = self._parse_args(argv)
+        if self.show_status is None:
+            self.show_status = not self.headless
+
+        if self.headless:
+            # Leave the terminal alone and read program input from stdin
+            # as it is, or from nowhere if the script is read from stdin.
+            self.unbuffered_stdin = None
+            if self.script == "-" and stdin is None:
+                self.stdin = StringIO()
+        else:
+            # Save the current system input mode so it can be restored
+            # after processing commands and before exiting.
+            console.save_mode(sys.stdin)
+
+            # Attempt to get a copy of stdin that is unbuffered on systems
+            # that support it.  This allows for immediate response to
+            # typed input as well as pasted input.  If unable to get an
+            # unbuffered version of stdin, the original version is used.
+            self.unbuffered_stdin = console.get_unbuffered_stdin(stdin)
+            if self.unbuffered_stdin is not None:
+                self.stdin = self.unbuffered_stdin
+        self._input = console.InputReader(self.stdin, noncanonical=not self.headless)
 
         # Check for any exceptions thrown during __init__ while
         # processing the arguments.
         try:
-
-            if argv is None:
-                argv = sys.argv
-            load, rom, goto = self._parse_args(argv)
-
             self._reset(self.mpu_type, self.getc_addr, self.putc_addr)
 
             if load is not None:
@@ -101,13 +142,13 @@ class Monitor(cmd.Cmd):
         except:
             # Restore input mode on any exception and then rethrow the
             # exception.
-            console.restore_mode()
+            self._restore_mode()
             raise
 
     def __del__(self):
         try:
             # Restore the input mode.
-            console.restore_mode()
+            self._restore_mode()
             # Close the unbuffered input file handle, if it exists.
             if self.unbuffered_stdin != None:
                 if self.unbuffered_stdin != sys.stdin:
@@ -117,8 +158,19 @@ class Monitor(cmd.Cmd):
 
     def _parse_args(self, argv):
         try:
-            shortopts = "hi:o:m:l:r:g:"
-            longopts = ["help", "mpu=", "input=", "output=", "load=", "rom=", "goto="]
+            shortopts = "hi:o:m:e:l:r:g:s:S"
+            longopts = [
+                "help",
+                "mpu=",
+                "engine=",
+                "input=",
+                "output=",
+                "load=",
+                "rom=",
+                "goto=",
+                "script=",
+                "status",
+            ]
             options, args = getopt.getopt(argv[1:], shortopts, longopts)
         except getopt.GetoptError as exc:
             self._output(exc.args[0])
@@ -143,6 +195,14 @@ class Monitor(cmd.Cmd):
                     sys.exit(1)
                 self.mpu_type = mpu_type
 
+            if opt in ("-e", "--engine"):
+                if value not in self.Engines:
+                    engines = sorted(self.Engines.keys())
+                    msg = "Fatal: no such engine. Available engines: %s"
+                    self._output(msg % ", ".join(engines))
+                    sys.exit(1)
+                self.engine = value
+
             if opt in ("-h", "--help"):
                 self._usage()
                 self._exit(0)
@@ -156,6 +216,13 @@ class Monitor(cmd.Cmd):
             if opt in ("-g", "--goto"):
                 goto = value
 
+            if opt in ("-s", "--script"):
+                self.script = value
+                self.headless = True
+
+            if opt in ("-S", "--status"):
+                self.show_status = True
+
         return load, rom, goto
 
     def _usage(self):
@@ -166,24 +233,74 @@ class Monitor(cmd.Cmd):
         line = self._preprocess_line(line)
 
         result = None
+        self._error = None
         try:
             result = cmd.Cmd.onecmd(self, line)
         except KeyboardInterrupt:
-            self._output("Interrupt")
+            self._error = "Interrupt"
+            self._output(self._error)
         except Exception:
-            error = "".join(traceback.format_exception(*sys.exc_info()))
-            self._output(error)
+            self._error = "".join(traceback.format_exception(*sys.exc_info()))
+            self._output(self._error)
 
-        if not line.startswith("quit"):
+        if self.show_status and not line.startswith("quit"):
             self._output_mpu_status()
 
         # Switch back to the previous input mode.
-        console.restore_mode()
+        self._restore_mode()
 
         return result
 
+    def default(self, line):
+        self._error = "*** Unknown syntax: %s" % line
+        self._output(self._error)
+
+    def execute(self, line):
+        """Run one monitor command and return a dict with the command, the
+        text it wrote, the formatted traceback if it raised an exception
+        (or None), the registers and cycles of the MPU afterward, and
+        whether the command asked the monitor to quit.
+        """
+        stdout = self.stdout
+        captured = StringIO()
+        self.stdout = captured
+        self.output.redirect(captured)
+        try:
+            stop = self.onecmd(line)
+        finally:
+            self.output.redirect(stdout)
+            self.stdout = stdout
+
+        mpu = self._mpu
+        return {
+            "command": line,
+            "output": captured.getvalue(),
+            "error": self._error,
+            "registers": dict(pc=mpu.pc, a=mpu.a, x=mpu.x, y=mpu.y, sp=mpu.sp, p=mpu.p),
+            "cycles": mpu.processorCycles,
+            "quit": bool(stop),
+        }
+
+    def run_script(self, lines):
+        """Run the monitor commands in lines, such as the lines of a file,
+        until one of them quits.  Blank lines and comments are skipped
+        rather than repeating the last command.  Returns a list of the
+        results of execute(), one per command run.
+        """
+        results = []
+        for line in lines:
+            line = line.rstrip("\r\n")
+            if not self._preprocess_line(line):
+                continue
+            result = self.execute(line)
+            results.append(result)
+            if result["quit"]:
+                break
+        return results
+
     def _reset(self, mpu_type, getc_addr=0xF004, putc_addr=0xF001):
-        self._mpu = mpu_type(memory=self.memory)
+        self.mpu_type = mpu_type
+        self._mpu = self.Engines[self.engine](mpu_type)(memory=self.memory)
         self.addrWidth = self._mpu.ADDR_WIDTH
         self.byteWidth = self._mpu.BYTE_WIDTH
         self.addrFmt = self._mpu.ADDR_FORMAT
@@ -195,6 +312,8 @@ class Monitor(cmd.Cmd):
         self._address_parser = AddressParser()
         self._disassembler = Disassembler(self._mpu, self._address_parser)
         self._assembler = Assembler(self._mpu, self._address_parser)
+        self._history = None
+        self._profiler = None
 
     def _add_shortcuts(self):
         self._shortcuts = {
@@ -202,6 +321,7 @@ class Monitor(cmd.Cmd):
             "~": "tilde",
             "a": "assemble",
             "ab": "add_breakpoint",
+            "b": "back",
             "al": "add_label",
             "d": "disassemble",
             "db": "delete_breakpoint",
@@ -268,21 +388,21 @@ class Monitor(cmd.Cmd):
 
     def _install_mpu_observers(self, getc_addr, putc_addr):
         def putc(address, value):
-            try:
-                self.stdout.write(chr(value))
-            except UnicodeEncodeError:  # Python 3
-                self.stdout.write("?")
-            self.stdout.flush()
+            self.output.write(value)
 
         def getc(address):
-            char = console.getch_noblock(self.stdin)
+            # show everything written before waiting for input
+            self.output.flush()
+            char = self._input.getch_noblock()
             if char:
                 byte = ord(char)
             else:
                 byte = 0
             return byte
 
-        m = ObservableMemory(subject=self.memory, addrWidth=self.addrWidth)
+        m = ObservableMemory(
+            subject=self.memory, addrWidth=self.addrWidth, byteWidth=self.byteWidth
+        )
         m.subscribe_to_write([self.putc_addr], putc)
         m.subscribe_to_read([self.getc_addr], getc)
 
@@ -292,11 +412,16 @@ class Monitor(cmd.Cmd):
         self._output("\n" + repr(self._mpu))
 
     def _output(self, stuff):
+        self.output.flush()
         self.stdout.write("%s\n" % stuff)
 
     def _exit(self, exitcode=0):
         sys.exit(exitcode)
 
+    def _restore_mode(self):
+        if not self.headless:
+            console.restore_mode()
+
     def do_help(self, args):
         args = self._shortcuts.get(args.strip(), args)
         return cmd.Cmd.do_help(self, args)
@@ -315,8 +440,7 @@ class Monitor(cmd.Cmd):
         self._output("reset\t\tReset the microprocessor")
 
     def do_reset(self, args):
-        klass = self._mpu.__class__
-        self._reset(mpu_type=klass)
+        self._reset(mpu_type=self.mpu_type)
 
     def do_mpu(self, args):
         def available_mpus():
@@ -344,6 +468,30 @@ class Monitor(cmd.Cmd):
         self._output("")
         return 1
 
+    def do_engine(self, args):
+        def available_engines():
+            engines = sorted(self.Engines.keys())
+            self._output("Available engines: %s" % ", ".join(engines))
+
+        if args == "":
+            self._output("Current engine is %s" % self.engine)
+            available_engines()
+        elif args not in self.Engines:
+            self._output("Unknown engine: %s" % args)
+            available_engines()
+        else:
+            # the MPU keeps its registers and memory on the new engine
+            mpu = self._mpu
+            if hasattr(mpu, "drop_blocks"):
+                mpu.drop_blocks()
+            self.engine = args
+            mpu.__class__ = self.Engines[args](self.mpu_type)
+            self._output("Running on the %s engine" % args)
+
+    def help_engine(self):
+        self._output("engine		Print the current and available engines.")
+        self._output("engine <name>	Run instructions on a new engine.")
+
     def help_quit(self):
         self._output("To quit, type ^D or use the quit command.")
 
@@ -430,6 +578,52 @@ class Monitor(cmd.Cmd):
                 addr = self.addrFmt % start
                 self.stdout.write("\r$%s  ?Syntax\n" % addr)
 
+    def help_assemble_file(self):
+        self._output("assemble_file <filename> [<output>]")
+        self._output("Assemble a source file into memory and add its labels.")
+        self._output("Assembly starts at the program counter unless the file")
+        self._output("sets an origin.  If <output> is given, the image is also")
+        self._output("saved to it, as Intel HEX if its name ends in .hex.")
+
+    def do_assemble_file(self, args):
+        split = shlex.split(args)
+        if len(split) not in (1, 2):
+            self._output("Syntax error: %s" % args)
+            return self.help_assemble_file()
+
+        assembler = FileAssembler(self._mpu, self._address_parser)
+        try:
+            segments = assembler.assemble_file(split[0], self._mpu.pc)
+        except (OSError, IOError) as exc:
+            msg = "Cannot load file: [%d] %s" % (exc.errno, exc.strerror)
+            self._output(msg)
+            return
+        except SyntaxError as exc:
+            self._output("%s:%d: %s" % (exc.filename, exc.lineno, exc.msg))
+            return
+
+        starttoend = "$" + self.addrFmt + " to $" + self.addrFmt
+        for start, values in segments:
+            self._write_memory(start, values)
+            fmt = (len(values), start, start + len(values) - 1)
+            self._output(("Assembled +%d bytes from " + starttoend) % fmt)
+
+        if len(split) == 2:
+            filename = split[1]
+            try:
+                if filename.lower().endswith(".hex"):
+                    f = open(filename, "w")
+                    f.write("".join(line + "\n" for line in assembler.intel_hex()))
+                else:
+                    f = open(filename, "wb")
+                    f.write(assembler.binary())
+                f.close()
+            except (OSError, IOError) as exc:
+                msg = "Cannot save file: [%d] %s" % (exc.errno, exc.strerror)
+                self._output(msg)
+                return
+            self._output("Saved %s" % filename)
+
     def do_disassemble(self, args):
         splitted = shlex.split(args)
         if len(splitted) != 1:
@@ -442,35 +636,16 @@ class Monitor(cmd.Cmd):
         else:
             end = start
 
-        max_address = (2**self._mpu.ADDR_WIDTH) - 1
-        cur_address = start
-        needs_wrap = start > end
-
-        while needs_wrap or cur_address <= end:
-            length, disasm = self._disassembler.instruction_at(cur_address)
-            self._output(self._format_disassembly(cur_address, length, disasm))
+        instructions = self._disassembler.instructions(start, end)
+        for address, length, disasm, values in instructions:
+            line = self._format_disassembly(address, length, disasm, values)
+            self._output(line)
 
-            remaining = length
-            while remaining:
-                remaining -= 1
-                cur_address += 1
-                if start > end and cur_address > max_address:
-                    needs_wrap = False
-                    cur_address = 0
-
-    def _format_disassembly(self, address, length, disasm):
-        cur_address = address
-        max_address = (2**self._mpu.ADDR_WIDTH) - 1
-
-        bytes_remaining = length
-        dump = ""
-
-        while bytes_remaining:
-            if cur_address > max_address:
-                cur_address = 0
-            dump += self.byteFmt % self._mpu.memory[cur_address] + " "
-            cur_address += 1
-            bytes_remaining -= 1
+    def _format_disassembly(self, address, length, disasm, values=None):
+        if values is None:
+            values = self._disassembler.instructions(address, address)
+            values = next(values)[3][:length]
+        dump = ((self.byteFmt + " ") * length) % tuple(values)
 
         fieldwidth = 1 + int(1 + self.byteWidth / 4) * 3
         fieldfmt = "%%-%ds" % fieldwidth
@@ -486,9 +661,93 @@ class Monitor(cmd.Cmd):
         self._output("Single-step through instructions.")
 
     def do_step(self, args):
-        self._mpu.step()
+        if self._history is not None:
+            self._history.step()
+        else:
+            self._mpu.step()
+        self.do_disassemble(self.addrFmt % self._mpu.pc)
+
+    def help_back(self):
+        self._output("back [<count>]")
+        self._output("Rewind <count> instructions (default 1) recorded while")
+        self._output("history is on.  If they are no longer in the journal,")
+        self._output("run forward to them from the last checkpoint before them.")
+
+    def do_back(self, args):
+        if self._history is None:
+            return self._output("History is off.  Use 'history on' first.")
+
+        count = 1
+        if args != "":
+            try:
+                count = int(args)
+            except ValueError:
+                return self._output("Illegal count: %s" % args)
+
+        rewound = self._history.back(count)
+        self._output("Rewound %d instructions" % rewound)
+        self.do_disassemble(self.addrFmt % self._mpu.pc)
+
+    def help_rewind(self):
+        self._output("rewind <cycles>")
+        self._output("Rewind to the last instruction recorded while history")
+        self._output("is on that started at or before the cycle count.")
+
+    def do_rewind(self, args):
+        if args == "":
+            return self.help_rewind()
+        if self._history is None:
+            return self._output("History is off.  Use 'history on' first.")
+
+        try:
+            cycles = int(args)
+        except ValueError:
+            return self._output("Illegal cycle count: %s" % args)
+
+        rewound = self._history.rewind(cycles)
+        self._output("Rewound %d instructions" % rewound)
         self.do_disassemble(self.addrFmt % self._mpu.pc)
 
+    def help_history(self):
+        self._output("history [on [<megabytes>]|off]")
+        self._output("Record execution so that back and rewind can undo it,")
+        self._output("using at most <megabytes> of memory (default 64).")
+        self._output("With no argument, the current history is described.")
+
+    def do_history(self, args):
+        split = shlex.split(args)
+        if split[:1] == ["on"] and len(split) <= 2:
+            limit = 64
+            if len(split) == 2:
+                try:
+                    limit = int(split[1])
+                except ValueError:
+                    return self._output("Illegal size: %s" % split[1])
+            if self._history is not None:
+                self._history.close()
+            self._history = History(self._mpu, limit=limit * 1024 * 1024)
+        elif split == ["off"]:
+            if self._history is not None:
+                self._history.close()
+            self._history = None
+        elif split:
+            self._output("Syntax error: %s" % args)
+            return self.help_history()
+
+        history = self._history
+        if history is None:
+            return self._output("History is off")
+        msg = "History is on: %d instructions, %d checkpoints, %d of %d KB"
+        self._output(
+            msg
+            % (
+                len(history.journal),
+                len(history.checkpoints),
+                history.size() // 1024,
+                history.limit // 1024,
+            )
+        )
+
     def help_return(self):
         self._output("return")
         self._output("Continues execution and returns to the monitor just")
@@ -517,27 +776,95 @@ class Monitor(cmd.Cmd):
         mem = self._mpu.memory
 
         # Switch to immediate (noncanonical) no-echo input mode on POSIX
-        # operating systems.  This has no effect on Windows.
-        console.noncanonical_mode(self.stdin)
-
-        if not breakpoints:
-            while True:
-                mpu.step()
-                if mem[mpu.pc] in stopcodes:
-                    break
-        else:
-            while True:
-                mpu.step()
-                pc = mpu.pc
-                if mem[pc] in stopcodes:
-                    break
-                if pc in breakpoints:
-                    msg = "Breakpoint %d reached."
-                    self._output(msg % self._breakpoints.index(pc))
-                    break
+        # operating systems and read input in the background while the
+        # program runs.
+        self._input.start()
+        try:
+            if self._history is not None:
+                self._history.run(stopcodes=stopcodes, breakpoints=breakpoints)
+            else:
+                mpu.run(stopcodes=stopcodes, breakpoints=breakpoints)
+        finally:
+            self._input.stop()
+            self.output.flush()
+
+        pc = mpu.pc
+        if pc in breakpoints and mem[pc] not in stopcodes:
+            msg = "Breakpoint %d reached."
+            self._output(msg % self._breakpoints.index(pc))
 
         # Switch back to the previous input mode.
-        console.restore_mode()
+        self._restore_mode()
+
+    def help_profile(self):
+        self._output("profile [on|off|flat [<count>]|tree [<depth>]]")
+        self._output("Turn profiling of the cycles run at each address and in")
+        self._output("each routine on or off.  'flat' lists the <count>")
+        self._output("addresses with the most cycles (default 20) and 'tree'")
+        self._output("shows the calls made through JSR, BRK and interrupts")
+        self._output("down to <depth> levels.  With no argument, 'flat'.")
+
+    def do_profile(self, args):
+        split = args.split()
+        if split == ["on"]:
+            self._profiler = Profiler(self._mpu)
+            self._mpu.tracer = self._profiler
+            return self._output("Profiling on")
+        if split == ["off"]:
+            if self._profiler is not None and self._mpu.tracer is self._profiler:
+                self._mpu.tracer = None
+            return self._output("Profiling off")
+
+        if split[:1] not in ([], ["flat"], ["tree"]) or len(split) > 2:
+            self._output("Syntax error: %s" % args)
+            return self.help_profile()
+        if self._profiler is None:
+            return self._output("No profile.  Use 'profile on' first.")
+
+        limit = None
+        if len(split) == 2:
+            try:
+                limit = int(split[1])
+            except ValueError:
+                return self._output("Illegal number: %s" % split[1])
+
+        if split[:1] == ["tree"]:
+            self._output_call_tree(limit)
+        else:
+            self._output_flat_profile(20 if limit is None else limit)
+
+    def _output_flat_profile(self, count):
+        rows = self._profiler.flat()
+        total = sum(cycles for address, n, cycles in rows) or 1
+        self._output("%12s %6s %10s  %s" % ("Cycles", "%", "Count", "Address"))
+        for address, n, cycles in rows[:count]:
+            percent = 100.0 * cycles / total
+            name = self._format_routine(address)
+            self._output("%12d %5.1f%% %10d  %s" % (cycles, percent, n, name))
+
+    def _output_call_tree(self, depth):
+        self._output("%12s %12s %8s  %s" % ("Total", "Self", "Calls", "Routine"))
+        pending = [(self._profiler.tree(), 0)]
+        while pending:
+            call, level = pending.pop()
+            if call.address is None:
+                name = "(top)"
+            else:
+                name = self._format_routine(call.address)
+            self._output(
+                "%12d %12d %8d  %s%s"
+                % (call.total(), call.cycles, call.calls, "  " * level, name)
+            )
+            if depth is None or level < depth:
+                children = sorted(call.children.values(), key=lambda c: c.total())
+                pending.extend((child, level + 1) for child in children)
+
+    def _format_routine(self, address):
+        name = "$" + self.addrFmt % address
+        label = self._address_parser.label_for(address)
+        if label is not None:
+            name += " " + label
+        return name
 
     def help_radix(self):
         self._output("radix [H|D|O|B]")
@@ -593,6 +920,10 @@ class Monitor(cmd.Cmd):
 
     def do_registers(self, args):
         if args == "":
+            # the status after each command shows the registers, unless
+            # it is turned off
+            if not self.show_status:
+                self._output_mpu_status()
             return
 
         pairs = re.findall(r"([^=,\s]*)=([^=,\s]*)", args)
@@ -720,13 +1051,16 @@ class Monitor(cmd.Cmd):
         start = self._address_parser.number(split[1])
         end = self._address_parser.number(split[2])
 
-        mem = self._mpu.memory[start : end + 1]
+        mem = self._read_memory(start, end - start + 1)
+        if self.byteWidth == 8:
+            data = bytearray(mem)
+        else:
+            # output each octet from msb first
+            shifts = range(self.byteWidth - 8, -1, -8)
+            data = bytearray((m >> shift) & 0xFF for m in mem for shift in shifts)
         try:
             f = open(filename, "wb")
-            for m in mem:
-                # output each octect from msb first
-                for shift in range(self.byteWidth - 8, -1, -8):
-                    f.write(bytearray([(m >> shift) & 0xFF]))
+            f.write(data)
             f.close()
         except (OSError, IOError) as exc:
             msg = "Cannot save file: [%d] %s" % (exc.errno, exc.strerror)
@@ -765,26 +1099,38 @@ class Monitor(cmd.Cmd):
             self._fill(start, end, filler)
 
     def _fill(self, start, end, filler):
-        address = start
-        length, index = len(filler), 0
+        length = len(filler)
 
         if start == end:
             end = start + length - 1
             if end > self.addrMask:
                 end = self.addrMask
 
-        while address <= end:
-            address &= self.addrMask
-            self._mpu.memory[address] = filler[index] & self.byteMask
-            index += 1
-            if index == length:
-                index = 0
-            address += 1
+        count = end - start + 1
+        if count > 0:
+            filler = [value & self.byteMask for value in filler]
+            data = (filler * (count // length + 1))[:count]
+            self._write_memory(start, data)
 
         fmt = (end - start + 1, start, end)
         starttoend = "$" + self.addrFmt + " to $" + self.addrFmt
         self._output(("Wrote +%d bytes from " + starttoend) % fmt)
 
+    def _read_memory(self, start, length):
+        memory = self._mpu.memory
+        if isinstance(memory, ObservableMemory):
+            return memory.read_block(start, length)
+        return memory[start : start + length]
+
+    def _write_memory(self, start, data):
+        memory = self._mpu.memory
+        if isinstance(memory, ObservableMemory):
+            memory.write_block(start, data)
+        else:
+            if isinstance(memory, array):
+                data = array(memory.typecode, data)
+            memory[start : start + len(data)] = data
+
     def help_mem(self):
         self._output("mem <address_range>")
         self._output("Display the contents of memory.")
@@ -797,9 +1143,10 @@ class Monitor(cmd.Cmd):
 
         start, end = self._address_parser.range(split[0])
 
+        mem = self._read_memory(start, end - start + 1)
+
         line = self.addrFmt % start + ":"
-        for address in range(start, end + 1):
-            byte = self._mpu.memory[address]
+        for address, byte in zip(range(start, end + 1), mem):
             more = "  " + self.byteFmt % byte
 
             exceeded = len(line) + len(more) > self._width
@@ -829,6 +1176,34 @@ class Monitor(cmd.Cmd):
             label = split[1]
             self._address_parser.labels[label] = address
 
+    def help_load_labels(self):
+        self._output("load_labels <filename>")
+        self._output("Add the labels in a VICE label file, ca65 debug file,")
+        self._output("or ACME or 64tass symbol list.")
+
+    def do_load_labels(self, args):
+        split = shlex.split(args)
+        if len(split) != 1:
+            self._output("Syntax error: %s" % args)
+            return self.help_load_labels()
+
+        filename = split[0]
+        try:
+            f = io.open(filename, "r", encoding="latin-1")
+        except (OSError, IOError) as exc:
+            msg = "Cannot load file: [%d] %s" % (exc.errno, exc.strerror)
+            self._output(msg)
+            return
+        try:
+            added, skipped = load_labels(self._address_parser, f)
+        finally:
+            f.close()
+
+        msg = "Loaded %d labels from %s" % (added, filename)
+        if skipped:
+            msg += " (%d skipped as too wide)" % skipped
+        self._output(msg)
+
     def help_show_labels(self):
         self._output("show_labels")
         self._output("Display current label mappings.")
@@ -933,6 +1308,9 @@ class Monitor(cmd.Cmd):
 def main(args=None):
     c = Monitor()
 
+    if c.script is not None:
+        return _run_script(c)
+
     try:
         import readline
 
@@ -948,5 +1326,28 @@ def main(args=None):
         console.restore_mode()
 
 
+def _run_script(monitor):
+    # run the commands of a --script file, echoing their output as they
+    # go, and return 1 if any of them failed
+    if monitor.script == "-":
+        lines = sys.stdin
+    else:
+        lines = open(monitor.script)
+    status = 0
+    try:
+        for line in lines:
+            for result in monitor.run_script([line]):
+                monitor.stdout.write(result["output"])
+                monitor.stdout.flush()
+                if result["error"] is not None:
+                    status = 1
+                if result["quit"]:
+                    return status
+    finally:
+        if lines is not sys.stdin:
+            lines.close()
+    return status
+
+
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
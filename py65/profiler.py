@@ -0,0 +1,120 @@
+from array import array
+
+JSR = 0x20
+BRK = 0x00
+
+
+class Call:
+    """A node of a call tree: a routine entered from the routine of its
+    parent node.  address is None for the root, which holds the code run
+    outside of any call.
+    """
+
+    def __init__(self, address):
+        self.address = address
+        self.calls = 0
+        self.cycles = 0  # spent in the routine itself
+        self.children = {}
+
+    def total(self):
+        """Return the cycles spent in the routine and its callees."""
+        return self.cycles + sum(child.total() for child in self.children.values())
+
+
+class Profiler:
+    """Count the instructions and cycles run at each address by an MPU and
+    the cycles spent in each routine.  Set the MPU's tracer to a profiler
+    to profile everything it runs.
+
+    Counts and cycles are kept in preallocated arrays indexed by address.
+    An instruction's cycles are only known when the next one starts, and
+    they also cover any interrupt or waiting in between.
+
+    Calls are followed through the stack pointer.  A JSR or BRK, or a
+    hardware interrupt, seen as a drop of the stack pointer by three onto
+    the address of the IRQ or NMI vector, enters the routine at the next
+    PC.  A routine returns once the stack pointer is back at or above its
+    level before the call, so RTS, RTI and code that discards return
+    addresses unwind correctly.
+    """
+
+    def __init__(self, mpu):
+        self.mpu = mpu
+        memory = mpu.memory
+        if hasattr(memory, "physMask"):
+            size = memory.physMask + 1
+        else:
+            size = len(memory)
+        self._mask = size - 1
+        self.counts = array("d", [0]) * size
+        self.cycles = array("d", [0]) * size
+
+        self.root = Call(None)
+        self._node = self.root
+        self._stack = []  # (sp before the call, call)
+        self._last = None  # (pc, opcode, sp, cycles) of the last instruction
+
+    def record(self, pc, opcode, a, x, y, sp, p, cycles):
+        last = self._last
+        if last is not None:
+            lastPc, lastOpcode, lastSp, lastCycles = last
+            spent = cycles - lastCycles
+            self.cycles[lastPc & self._mask] += spent
+            self._node.cycles += spent
+            if sp != lastSp:
+                self._follow_calls(pc, lastOpcode, lastSp, sp)
+
+        self.counts[pc & self._mask] += 1
+        self._last = (pc, opcode, sp, cycles)
+
+    def _follow_calls(self, pc, lastOpcode, lastSp, sp):
+        stack = self._stack
+        mask = self.mpu.byteMask
+        # sp is at or above the level before the call, allowing for the
+        # stack pointer wrapping around
+        while stack and (sp - stack[-1][0]) & mask <= mask >> 1:
+            stack.pop()
+        if lastOpcode == JSR or lastOpcode == BRK or self._interrupted(pc, lastSp, sp):
+            parent = stack[-1][1] if stack else self.root
+            node = parent.children.get(pc)
+            if node is None:
+                node = parent.children[pc] = Call(pc)
+            node.calls += 1
+            stack.append((lastSp, node))
+        self._node = stack[-1][1] if stack else self.root
+
+    def _interrupted(self, pc, lastSp, sp):
+        # the stack pointer alone cannot tell an interrupt from a TXS
+        mpu = self.mpu
+        if (lastSp - sp) & mpu.byteMask != 3:
+            return False
+        return pc == mpu.WordAt(mpu.IRQ) or pc == mpu.WordAt(mpu.NMI)
+
+    def flat(self, limit=None):
+        """Return (address, count, cycles) for each address that ran an
+        instruction, most cycles first, up to limit rows.
+        """
+        self._settle()
+        counts = self.counts
+        cycles = self.cycles
+        rows = [
+            (address, int(counts[address]), int(cycles[address]))
+            for address in range(len(counts))
+            if counts[address]
+        ]
+        rows.sort(key=lambda row: (-row[2], row[0]))
+        return rows[:limit]
+
+    def tree(self):
+        """Return the root Call of the call tree."""
+        self._settle()
+        return self.root
+
+    def _settle(self):
+        # charge the cycles run since the last instruction started
+        if self._last is not None:
+            pc, opcode, sp, cycles = self._last
+            spent = self.mpu.processorCycles - cycles
+            self.cycles[pc & self._mask] += spent
+            self._node.cycles += spent
+            self._last = (pc, opcode, sp, self.mpu.processorCycles)
@@ -0,0 +1,96 @@
+"""Run callbacks when the processor cycle count reaches given values, so
+that devices such as timers can act on emulated time.
+
+A Scheduler is attached to an MPU by setting its scheduler attribute.
+MPU.run() and step() then fire the events that are due at the boundary
+after each instruction, before the stop conditions of run() are checked.
+The run loop only compares the cycle count with the scheduler's deadline,
+the cycle of the earliest pending event, so a scheduler with nothing
+pending costs one comparison per instruction.
+
+Events are scheduled at absolute values of MPU.processorCycles.  Because
+instructions take several cycles, an event usually fires a little after
+its cycle; the callback is passed the cycle it was due at so that a
+periodic device can schedule its next event without drifting.
+"""
+
+import heapq
+
+# deadline when no event is pending; compares greater than any cycle count
+NEVER = float("inf")
+
+
+class Event:
+    """A callback scheduled to run at cycle.  Cancelled events stay in the
+    scheduler's queue until their cycle comes but are not fired.
+    """
+
+    def __init__(self, cycle, callback):
+        self.cycle = cycle
+        self.callback = callback
+        self.cancelled = False
+
+
+class Scheduler:
+    def __init__(self, mpu):
+        self.mpu = mpu
+        self.deadline = NEVER
+        self._events = []  # heap of (cycle, sequence, event)
+        self._sequence = 0  # fires events due at the same cycle in order
+
+        # a one-item list set to 1 when the deadline moves earlier; the
+        # translating core of py65.devices.fastcore points it at the flag
+        # its blocks check after each write, so that an event scheduled
+        # by a device written to inside a block is not run past
+        self.moved = [0]
+
+    def __len__(self):
+        return sum(1 for entry in self._events if not entry[2].cancelled)
+
+    def at(self, cycle, callback):
+        """Schedule callback(cycle) to be called once the cycle count
+        reaches cycle.  An event for a cycle that has already passed fires
+        at the next instruction boundary.  Returns the Event.
+        """
+        event = Event(cycle, callback)
+        heapq.heappush(self._events, (cycle, self._sequence, event))
+        self._sequence += 1
+        if cycle < self.deadline:
+            self.deadline = cycle
+            self.moved[0] = 1
+        return event
+
+    def after(self, cycles, callback):
+        """Schedule callback(cycle) to be called cycles cycles from now."""
+        return self.at(self.mpu.processorCycles + cycles, callback)
+
+    def cancel(self, event):
+        """Keep event from firing."""
+        event.cancelled = True
+        self._update_deadline()
+
+    def fire(self):
+        """Call the callbacks of all events due at the current cycle count,
+        earliest first, including events that they schedule for cycles
+        that have already passed.
+        """
+        events = self._events
+        while events and events[0][0] <= self.mpu.processorCycles:
+            cycle, sequence, event = heapq.heappop(events)
+            if not event.cancelled:
+                event.callback(cycle)
+        self._update_deadline()
+
+    def clear(self):
+        """Forget all pending events."""
+        del self._events[:]
+        self.deadline = NEVER
+
+    def _update_deadline(self):
+        events = self._events
+        while events and events[0][2].cancelled:
+            heapq.heappop(events)
+        if events:
+            self.deadline = events[0][0]
+        else:
+            self.deadline = NEVER
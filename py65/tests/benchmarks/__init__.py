@@ -0,0 +1 @@
+# this is a package
@@ -0,0 +1,103 @@
+import json
+
+from py65.benchmarks import runner, workloads
+from py65.devices.mpu6502 import MPU as NMOS6502
+
+try:
+    from StringIO import StringIO  # type: ignore[import-error]
+except ImportError:  # Python 3
+    from io import StringIO
+
+# run_benchmark
+
+
+def test_run_benchmark_reports_rates():
+    result = runner.run_benchmark(workloads.alu, NMOS6502, 1000, repeat=2)
+    assert 1000 == result["instructions"]
+    assert result["cycles"] > 2000
+    assert result["seconds"] > 0
+    assert result["instructions_per_second"] == 1000 / result["seconds"]
+    assert result["cycles_per_second"] == result["cycles"] / result["seconds"]
+
+
+def test_run_benchmark_returns_none_for_unsupported_mpu():
+    result = runner.run_benchmark(lambda mpu_type: None, NMOS6502, 1000)
+    assert result is None
+
+
+# run_benchmarks
+
+
+def test_run_benchmarks_runs_every_combination():
+    report = runner.run_benchmarks(
+        [("alu", workloads.alu), ("never", lambda mpu_type: None)],
+        runner.MPUS[:2],
+        runner.ENGINES[:2],
+        500,
+        1,
+    )
+    keys = [(r["workload"], r["mpu"], r["engine"]) for r in report["results"]]
+    assert [
+        ("alu", "6502", "interpreter"),
+        ("alu", "6502", "fast"),
+        ("alu", "65C02", "interpreter"),
+        ("alu", "65C02", "fast"),
+    ] == keys
+    assert 4 == len(report["skipped"])
+    assert "python" in report
+
+
+# format_results
+
+
+def test_format_results_shows_change_from_baseline():
+    result = dict(
+        workload="alu",
+        mpu="6502",
+        engine="fast",
+        instructions=1000,
+        cycles=2000,
+        seconds=0.5,
+        instructions_per_second=2000.0,
+        cycles_per_second=4000.0,
+    )
+    baseline = dict(result, instructions_per_second=1000.0)
+    text = runner.format_results({"results": [result]}, {"results": [baseline]})
+    assert "+100.0%" in text.splitlines()[1]
+
+
+# main
+
+
+def test_main_prints_json():
+    stdout = StringIO()
+    argv = ["bench", "-w", "alu", "-m", "6502", "-n", "500", "-r", "1", "-j"]
+    assert 0 == runner.main(argv, stdout)
+    report = json.loads(stdout.getvalue())
+    assert 1 == len(report["results"])
+    assert "interpreter" == report["results"][0]["engine"]
+
+
+def test_main_compares_with_saved_results(tmpdir):
+    stdout = StringIO()
+    argv = ["bench", "-w", "alu", "-m", "6502", "-n", "500", "-r", "1", "-j"]
+    runner.main(argv, stdout)
+    saved = tmpdir.join("before.json")
+    saved.write(stdout.getvalue())
+
+    stdout = StringIO()
+    argv = ["bench", "-w", "alu", "-m", "6502", "-n", "500", "-r", "1"]
+    assert 0 == runner.main(argv + ["-c", str(saved)], stdout)
+    assert "%" in stdout.getvalue().splitlines()[1]
+
+
+def test_main_rejects_unknown_workload():
+    stdout = StringIO()
+    assert 1 == runner.main(["bench", "-w", "nope"], stdout)
+    assert "no such workload" in stdout.getvalue()
+
+
+def test_main_shows_usage():
+    stdout = StringIO()
+    assert 0 == runner.main(["bench", "--help"], stdout)
+    assert "Workloads: alu, copy" in stdout.getvalue()
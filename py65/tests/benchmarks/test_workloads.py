@@ -0,0 +1,81 @@
+import pytest
+
+from py65.benchmarks import workloads
+from py65.devices import fastcore
+from py65.devices.mpu65c02 import MPU as CMOS65C02
+from py65.devices.mpu65org16 import MPU as V65Org16
+from py65.devices.mpu6502 import MPU as NMOS6502
+
+MPUS = [NMOS6502, CMOS65C02, V65Org16]
+
+# assemble
+
+
+def test_assemble_resolves_forward_labels():
+    mpu = NMOS6502()
+    labels = workloads.assemble(
+        mpu,
+        """
+        start:  jmp done  ; skip the nop
+                nop
+        done:   bne start
+        """,
+        origin=0xC000,
+    )
+    assert {"start": 0xC000, "done": 0xC004} == labels
+    assert [0x4C, 0x04, 0xC0, 0xEA, 0xD0, 0xFA] == list(mpu.memory[0xC000:0xC006])
+
+
+def test_assemble_uses_symbols():
+    mpu = NMOS6502()
+    workloads.assemble(mpu, "sta counter", origin=0x0200, symbols={"counter": 0x10})
+    assert [0x85, 0x10] == list(mpu.memory[0x0200:0x0202])
+
+
+def test_assemble_writes_wide_bytes_on_65org16():
+    mpu = V65Org16()
+    workloads.assemble(mpu, "lda #$1234", origin=0x0200)
+    assert [0xA9, 0x1234] == list(mpu.memory[0x0200:0x0202])
+
+
+# workloads
+
+
+@pytest.mark.parametrize("name, workload", workloads.WORKLOADS)
+@pytest.mark.parametrize("mpu_type", MPUS)
+def test_workload_runs_forever(name, workload, mpu_type):
+    mpu = workload(mpu_type)
+    if mpu is None:
+        assert (name, mpu_type) == ("ehbasic", V65Org16)
+        return
+    mpu.run(max_instructions=5000)
+    assert 5000 * 2 <= mpu.processorCycles
+
+
+@pytest.mark.parametrize("name, workload", workloads.WORKLOADS)
+def test_workload_is_reproducible(name, workload):
+    states = []
+    for _ in range(2):
+        mpu = workload(NMOS6502)
+        mpu.run(max_instructions=3000)
+        states.append((repr(mpu), mpu.processorCycles))
+    assert states[0] == states[1]
+
+
+@pytest.mark.parametrize("name, workload", workloads.WORKLOADS)
+def test_workload_is_translated(name, workload):
+    mpu = workload(fastcore.make_translating_mpu(NMOS6502))
+    mpu.run(max_instructions=3000)
+    assert mpu._blocks is not None
+    assert any(mpu._blocks.blocks.values())
+
+
+def test_copy_copies_page():
+    mpu = workloads.copy(NMOS6502)
+    mpu.run(max_instructions=5000)
+    assert list(range(1, 0x100)) == list(mpu.memory[0x3001:0x3100])
+    assert list(range(1, 0x100)) == list(mpu.memory[0x2001:0x2100])
+
+
+def test_ehbasic_is_skipped_without_image():
+    assert workloads.ehbasic(NMOS6502, path="/nonexistent/ehbasic.bin") is None
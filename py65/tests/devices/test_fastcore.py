@@ -0,0 +1,299 @@
+import os
+import random
+
+import pytest
+
+import py65.devices.mpu65c02
+import py65.devices.mpu65org16
+import py65.devices.mpu6502
+from py65.devices import fastcore
+from py65.memory import ObservableMemory
+from py65.tests.devices import test_mpu65c02, test_mpu6502
+
+# The generated handlers must pass the full test suite of each core.
+
+
+def _test_names(module):
+    return sorted(name for name in dir(module) if name.startswith("test_"))
+
+
+@pytest.mark.parametrize("name", _test_names(test_mpu6502))
+def test_6502_suite(monkeypatch, name):
+    klass = fastcore.make_fast_mpu(py65.devices.mpu6502.MPU)
+    monkeypatch.setattr(test_mpu6502, "_get_target_class", lambda: klass)
+    getattr(test_mpu6502, name)()
+
+
+@pytest.mark.parametrize("name", _test_names(test_mpu65c02))
+def test_65c02_suite(monkeypatch, name):
+    klass = fastcore.make_fast_mpu(py65.devices.mpu65c02.MPU)
+    monkeypatch.setattr(test_mpu65c02, "_get_target_class", lambda: klass)
+    getattr(test_mpu65c02, name)()
+
+
+# make_fast_mpu
+
+
+def test_make_fast_mpu_returns_cached_subclass():
+    klass = py65.devices.mpu6502.MPU
+    fast = fastcore.make_fast_mpu(klass)
+    assert issubclass(fast, klass)
+    assert fast is fastcore.make_fast_mpu(klass)
+    assert fast.disassemble is klass.disassemble
+    assert fast.cycletime is klass.cycletime
+
+
+def test_make_fast_mpu_keeps_handlers_without_template():
+    klass = py65.devices.mpu65c02.MPU
+    fast = fastcore.make_fast_mpu(klass)
+    assert fast.instruct[0x00] is klass.instruct[0x00]  # BRK
+    assert fast.instruct[0x6C] is klass.instruct[0x6C]  # JMP (ind)
+    assert fast.instruct[0xCB] is klass.instruct[0xCB]  # WAI
+    assert fast.instruct[0xA9] is not klass.instruct[0xA9]  # LDA #imm
+
+
+def test_make_fast_mpu_keeps_handlers_using_overridden_helpers():
+    class MPU(py65.devices.mpu6502.MPU):
+        def ZeroPageAddr(self):
+            return py65.devices.mpu6502.MPU.ZeroPageAddr(self)
+
+    fast = fastcore.make_fast_mpu(MPU)
+    assert fast.instruct == MPU.instruct
+
+
+# Differential tests against the original handlers
+
+
+@pytest.mark.parametrize(
+    "klass",
+    [
+        py65.devices.mpu6502.MPU,
+        py65.devices.mpu65c02.MPU,
+        py65.devices.mpu65org16.MPU,
+    ],
+)
+def test_matches_original_handlers(klass):
+    fast = fastcore.make_fast_mpu(klass)
+    rng = random.Random(6502)
+    for opcode in range(256):
+        if fast.instruct[opcode] is klass.instruct[opcode]:
+            continue
+        for _ in range(40):
+            state = _random_state(klass, rng, opcode)
+            expected = _run_one(klass, state)
+            actual = _run_one(fast, state)
+            assert expected == actual, "opcode $%02x" % opcode
+
+
+# make_translating_mpu
+
+
+def test_translating_mpu_runs_ehbasic_like_original():
+    results = []
+    for klass in (
+        fastcore.make_fast_mpu(py65.devices.mpu6502.MPU),
+        fastcore.make_translating_mpu(py65.devices.mpu6502.MPU),
+    ):
+        mpu, output = _make_ehbasic(
+            klass, b"C\r\r10 FOR I=1 TO 9:PRINT I*I;:NEXT\rRUN\r"
+        )
+        while b" 81" not in output:
+            mpu.run(max_cycles=997)
+        results.append(_state(mpu) + (bytes(output),))
+    assert results[0] == results[1]
+
+
+def test_translating_mpu_handles_code_modified_by_its_own_block():
+    results = []
+    for klass in (
+        py65.devices.mpu6502.MPU,
+        fastcore.make_translating_mpu(py65.devices.mpu6502.MPU),
+    ):
+        mpu = klass(memory=ObservableMemory(), pc=0x0200)
+        # $0200 INC $0207
+        # $0203 LDA $0207
+        # $0206 LDA #$00
+        # $0208 STA $0300,X
+        # $020B INX
+        # $020C CPX #$10
+        # $020E BNE $0200
+        # $0210 BRK
+        _write(mpu.memory, 0x0200, (0xEE, 0x07, 0x02, 0xAD, 0x07, 0x02))
+        _write(mpu.memory, 0x0206, (0xA9, 0x00, 0x9D, 0x00, 0x03, 0xE8))
+        _write(mpu.memory, 0x020C, (0xE0, 0x10, 0xD0, 0xF0, 0x00))
+        mpu.run(stopcodes=[0x00])
+        results.append(_state(mpu))
+    assert results[0] == results[1]
+    assert list(range(1, 17)) == list(results[1][-1][0x0300:0x0310])
+
+
+def test_translating_mpu_drops_blocks_when_code_is_written():
+    klass = fastcore.make_translating_mpu(py65.devices.mpu6502.MPU)
+    mpu = klass(memory=ObservableMemory(), pc=0x0200)
+    # $0200 LDA #$01
+    # $0202 STA $10
+    # $0204 BRK
+    _write(mpu.memory, 0x0200, (0xA9, 0x01, 0x85, 0x10, 0x00))
+    mpu.run(stopcodes=[0x00])
+    assert 0x01 == mpu.memory[0x10]
+
+    mpu.memory[0x0201] = 0x02
+    mpu.pc = 0x0200
+    mpu.run(stopcodes=[0x00])
+    assert 0x02 == mpu.memory[0x10]
+    assert 0x0204 == mpu.pc
+
+
+def test_translating_mpu_stops_inside_blocks_like_original():
+    stops = [
+        dict(max_instructions=0),
+        dict(max_instructions=-5),
+        dict(max_instructions=3),
+        dict(max_instructions=17),
+        dict(max_cycles=5),
+        dict(max_cycles=100),
+        dict(breakpoints=[0x0206]),
+        dict(stopcodes=[0xE8]),
+    ]
+    for stop in stops:
+        results = []
+        for klass in (
+            py65.devices.mpu6502.MPU,
+            fastcore.make_translating_mpu(py65.devices.mpu6502.MPU),
+        ):
+            mpu = klass(memory=ObservableMemory(), pc=0x0200)
+            # $0200 LDA #$01
+            # $0202 STA $10
+            # $0204 INC $10
+            # $0206 INX
+            # $0207 JMP $0200
+            _write(mpu.memory, 0x0200, (0xA9, 0x01, 0x85, 0x10, 0xE6, 0x10))
+            _write(mpu.memory, 0x0206, (0xE8, 0x4C, 0x00, 0x02))
+            for _ in range(3):
+                mpu.run(**stop)
+            results.append(_state(mpu))
+        assert results[0] == results[1], stop
+
+
+def test_translating_mpu_falls_back_with_plain_memory():
+    klass = fastcore.make_translating_mpu(py65.devices.mpu65c02.MPU)
+    mpu = klass(memory=bytearray(0x10000), pc=0x0200)
+    # $0200 LDA #$01
+    # $0202 WAI
+    _write(mpu.memory, 0x0200, (0xA9, 0x01, 0xCB))
+    mpu.run(max_cycles=10)
+    assert 0x01 == mpu.a
+    assert mpu.waiting
+    assert 10 == mpu.processorCycles
+    assert mpu._blocks is None
+
+
+def test_translating_mpu_drops_blocks_on_restore():
+    klass = fastcore.make_translating_mpu(py65.devices.mpu6502.MPU)
+    mpu = klass(memory=ObservableMemory(), pc=0x0200)
+    # $0200 LDA #$01
+    # $0202 STA $10
+    # $0204 BRK
+    _write(mpu.memory, 0x0200, (0xA9, 0x01, 0x85, 0x10, 0x00))
+    snapshot = mpu.snapshot()
+    mpu.memory[0x0201] = 0x02
+    mpu.run(stopcodes=[0x00])
+    assert 0x02 == mpu.memory[0x10]
+
+    mpu.restore(snapshot)
+    mpu.run(stopcodes=[0x00])
+    assert 0x01 == mpu.memory[0x10]
+    assert 0x0204 == mpu.pc
+
+
+# Test Helpers
+
+
+def _random_state(klass, rng, opcode):
+    byteMask = (1 << klass.BYTE_WIDTH) - 1
+    pc = rng.randint(0x0200, 0xFF00)
+    memory = dict((rng.randint(0, 0xFFFF), rng.randint(0, byteMask)) for _ in range(64))
+    for address in range(256):
+        memory[address] = rng.randint(0, 255)
+    memory[pc] = opcode
+    memory[pc + 1] = rng.randint(0, 255)
+    memory[pc + 2] = rng.randint(0, 255)
+    registers = dict(
+        pc=pc + 1,
+        a=rng.randint(0, byteMask),
+        x=rng.choice([0, 1, 0xFF, rng.randint(0, 255)]),
+        y=rng.choice([0, 1, 0xFF, rng.randint(0, 255)]),
+        sp=rng.choice([0, 1, 0xFE, 0xFF, rng.randint(0, 255)]),
+        p=rng.randint(0, 255),
+    )
+    return memory, registers
+
+
+def _run_one(klass, state):
+    contents, registers = state
+    if klass.BYTE_WIDTH == 8:
+        memory = bytearray(0x10000)
+    else:
+        memory = ObservableMemory(addrWidth=32)
+    for address, value in contents.items():
+        memory[address] = value
+    mpu = klass(memory=memory)
+    for name, value in registers.items():
+        setattr(mpu, name, value)
+    mpu.pc -= 1
+    mpu.step()
+    if klass.BYTE_WIDTH == 8:
+        contents = bytes(memory)
+    else:
+        contents = memory._subject.tobytes()
+    return (
+        mpu.pc,
+        mpu.a,
+        mpu.x,
+        mpu.y,
+        mpu.sp,
+        mpu.p,
+        mpu.processorCycles,
+        mpu.waiting,
+        contents,
+    )
+
+
+def _write(memory, start_address, bytes):
+    memory[start_address : start_address + len(bytes)] = bytes
+
+
+def _state(mpu):
+    return (
+        mpu.pc,
+        mpu.a,
+        mpu.x,
+        mpu.y,
+        mpu.sp,
+        mpu.p,
+        mpu.processorCycles,
+        bytes(mpu.memory[0:0x10000]),
+    )
+
+
+def _make_ehbasic(klass, typed):
+    path = os.path.join(os.path.dirname(__file__), "..", "..", "..", "examples")
+    with open(os.path.join(path, "ehbasic.bin"), "rb") as f:
+        image = bytearray(f.read())
+
+    memory = ObservableMemory()
+    memory.write(0x0000, image)
+    keys = list(bytearray(typed))
+    output = bytearray()
+
+    def getc(address):
+        if keys:
+            return keys.pop(0)
+        return 0
+
+    def putc(address, value):
+        output.append(value)
+
+    memory.subscribe_to_read([0xF004], getc)
+    memory.subscribe_to_write([0xF001], putc)
+    return klass(memory=memory, pc=None), output
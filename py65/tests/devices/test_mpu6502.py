@@ -1,5 +1,10 @@
-﻿import py65.assembler
+﻿import pickle
+
+import pytest
+
+import py65.assembler
 import py65.devices.mpu6502
+from py65.memory import ObservableMemory
 
 # Reset
 
@@ -35,6 +40,13 @@ def test_reset_reads_reset_vector_if_start_pc_is_None():
     assert mpu.pc == 0xABCD
 
 
+def test_default_memory_is_64k_bytearray():
+    klass = _get_target_class()
+    mpu = klass()
+    assert isinstance(mpu.memory, bytearray)
+    assert 0x10000 == len(mpu.memory)
+
+
 # ADC Absolute
 
 
@@ -6341,6 +6353,266 @@ def test_brk_interrupt():
     assert 0x0008 == mpu.pc
 
 
+# Snapshots
+
+
+def test_restore_returns_registers_cycles_and_memory_to_snapshot():
+    mpu = _make_mpu()
+    # $0000 LDA #$01
+    # $0002 STA $10
+    # $0004 INX
+    _write(mpu.memory, 0x0000, (0xA9, 0x01, 0x85, 0x10, 0xE8))
+    mpu.memory[0x10] = 0x00
+    snapshot = mpu.snapshot()
+    expected = repr(mpu)
+    mpu.run(max_instructions=3)
+    assert 0x01 == mpu.memory[0x10]
+
+    mpu.restore(snapshot)
+    assert expected == repr(mpu)
+    assert 0 == mpu.processorCycles
+    assert 0x00 == mpu.memory[0x10]
+
+    mpu.run(max_instructions=3)
+    assert 0x01 == mpu.x
+    assert 0x01 == mpu.memory[0x10]
+    assert 7 == mpu.processorCycles
+
+
+def test_restore_keeps_memory_object():
+    mpu = _make_mpu()
+    memory = mpu.memory
+    mpu.restore(mpu.snapshot())
+    assert memory is mpu.memory
+
+
+def test_restore_sets_waiting_flag():
+    mpu = _make_mpu()
+    mpu.waiting = True
+    snapshot = mpu.snapshot()
+    mpu.waiting = False
+    mpu.restore(snapshot)
+    assert mpu.waiting
+
+
+def test_restore_sets_stopped_flag():
+    mpu = _make_mpu()
+    mpu.waiting = mpu.stopped = True
+    snapshot = mpu.snapshot()
+    mpu.reset()
+    mpu.restore(snapshot)
+    assert mpu.stopped
+
+
+def test_restore_bypasses_observable_memory_subscribers():
+    mpu = _make_mpu(memory=ObservableMemory())
+    snapshot = mpu.snapshot()
+    calls = []
+
+    def write_subscriber(address, value):
+        calls.append(address)
+
+    mpu.memory.subscribe_to_write([0x10], write_subscriber)
+    mpu.memory[0x10] = 0x01
+    mpu.restore(snapshot)
+    assert [0x10] == calls
+    assert 0x00 == mpu.memory[0x10]
+
+
+def test_restore_raises_for_snapshot_of_another_mpu():
+    mpu = _make_mpu()
+    snapshot = mpu.snapshot()
+    mpu.name = "other"
+    with pytest.raises(ValueError) as exc:
+        mpu.restore(snapshot)
+    assert "Cannot restore" in str(exc.value)
+
+
+def test_snapshot_shares_unchanged_pages_with_last_snapshot():
+    mpu = _make_mpu()
+    first = mpu.snapshot()
+    mpu.memory[0x0200] = 0x01
+    second = mpu.snapshot()
+    assert first.pages[0x00] is second.pages[0x00]
+    assert first.pages[0x02] is not second.pages[0x02]
+
+    mpu.restore(first)
+    mpu.memory[0x0300] = 0x01
+    third = mpu.snapshot()
+    assert first.pages[0x02] is third.pages[0x02]
+
+
+def test_snapshot_can_be_pickled():
+    mpu = _make_mpu()
+    mpu.a = 0x42
+    mpu.processorCycles = 1234
+    mpu.memory[0xFFFF] = 0x99
+    data = pickle.dumps(mpu.snapshot(), pickle.HIGHEST_PROTOCOL)
+    assert len(data) < 0x1000
+
+    other = _make_mpu()
+    other.restore(pickle.loads(data))
+    assert 0x42 == other.a
+    assert 1234 == other.processorCycles
+    assert 0x99 == other.memory[0xFFFF]
+
+
+# Flag Tables
+
+
+def test_nz_table_has_flags_for_each_8_bit_value():
+    table = py65.devices.mpu6502.nz_table(8)
+    assert 256 == len(table)
+    assert py65.devices.mpu6502.MPU.ZERO == table[0x00]
+    assert 0 == table[0x7F]
+    assert py65.devices.mpu6502.MPU.NEGATIVE == table[0x80]
+    assert py65.devices.mpu6502.MPU.NEGATIVE == table[0xFF]
+
+
+def test_nz_table_has_sign_bit_15_for_16_bit_values():
+    table = py65.devices.mpu6502.nz_table(16)
+    assert 65536 == len(table)
+    assert py65.devices.mpu6502.MPU.ZERO == table[0x0000]
+    assert 0 == table[0x00FF]
+    assert 0x8000 == table[0x8000]
+
+
+def test_flags_nz_keeps_other_flags():
+    mpu = _make_mpu()
+    mpu.p = 0xFF & ~(mpu.ZERO | mpu.NEGATIVE)
+    mpu.FlagsNZ(0x00)
+    assert 0xFF & ~mpu.NEGATIVE == mpu.p
+    mpu.FlagsNZ(0x80)
+    assert 0xFF & ~mpu.ZERO == mpu.p
+
+
+# Decimal Mode Tables
+
+
+def test_decimal_adc_table_matches_decimal_adc():
+    adc = py65.devices.mpu6502.decimal_adc
+    table = py65.devices.mpu6502.decimal_table(adc)
+    for carry in (0, 1):
+        for a in range(0x100):
+            for data in range(0x100):
+                final, flags = adc(a, data, carry, 0xFF, 0x80, 0x40)
+                entry = table[(carry << 16) | (a << 8) | data]
+                assert (final, flags) == (entry & 0xFF, entry >> 8)
+
+
+def test_decimal_sbc_table_matches_decimal_sbc():
+    sbc = py65.devices.mpu6502.decimal_sbc
+    table = py65.devices.mpu6502.decimal_table(sbc)
+    for carry in (0, 1):
+        for a in range(0x100):
+            for data in range(0x100):
+                final, flags = sbc(a, data, carry, 0xFF, 0x80, 0x40)
+                entry = table[(carry << 16) | (a << 8) | data]
+                assert (final, flags) == (entry & 0xFF, entry >> 8)
+
+
+def test_decimal_table_is_built_once():
+    adc = py65.devices.mpu6502.decimal_adc
+    table = py65.devices.mpu6502.decimal_table(adc)
+    assert table is py65.devices.mpu6502.decimal_table(adc)
+
+
+# Run
+
+
+def test_run_stops_after_max_instructions():
+    mpu = _make_mpu()
+    # $0000 NOP
+    # $0001 NOP
+    # $0002 NOP
+    _write(mpu.memory, 0x0000, (0xEA, 0xEA, 0xEA))
+    mpu.run(max_instructions=2)
+    assert 0x0002 == mpu.pc
+    assert 4 == mpu.processorCycles
+
+
+def test_run_stops_once_max_cycles_have_elapsed():
+    mpu = _make_mpu()
+    # $0000 INX
+    # $0001 JMP $0000
+    _write(mpu.memory, 0x0000, (0xE8, 0x4C, 0x00, 0x00))
+    mpu.run(max_cycles=100)
+    assert 100 <= mpu.processorCycles < 105
+
+
+def test_run_max_cycles_is_relative_to_current_cycle_count():
+    mpu = _make_mpu()
+    # $0000 NOP
+    _write(mpu.memory, 0x0000, (0xEA,))
+    mpu.processorCycles = 1000
+    mpu.run(max_cycles=2)
+    assert 0x0001 == mpu.pc
+    assert 1002 == mpu.processorCycles
+
+
+def test_run_stops_before_stopcode():
+    mpu = _make_mpu()
+    # $0000 LDA #$01
+    # $0002 LDX #$02
+    # $0004 BRK
+    _write(mpu.memory, 0x0000, (0xA9, 0x01, 0xA2, 0x02, 0x00))
+    mpu.run(stopcodes=[0x00])
+    assert 0x0004 == mpu.pc
+    assert 0x01 == mpu.a
+    assert 0x02 == mpu.x
+
+
+def test_run_stops_at_breakpoint():
+    mpu = _make_mpu()
+    # $0000 INX
+    # $0001 INY
+    # $0002 JMP $0000
+    _write(mpu.memory, 0x0000, (0xE8, 0xC8, 0x4C, 0x00, 0x00))
+    mpu.run(breakpoints=[0x0001])
+    assert 0x0001 == mpu.pc
+    assert 0x01 == mpu.x
+    assert 0x00 == mpu.y
+
+
+def test_run_returns_at_once_without_instructions_to_run():
+    for max_instructions in (0, -5):
+        mpu = _make_mpu()
+        # $0000 INX
+        # $0001 JMP $0000
+        _write(mpu.memory, 0x0000, (0xE8, 0x4C, 0x00, 0x00))
+        mpu.run(max_instructions=max_instructions)
+        assert 0x0000 == mpu.pc
+        assert 0 == mpu.processorCycles
+
+
+def test_run_executes_at_least_one_instruction():
+    mpu = _make_mpu()
+    # $0000 NOP
+    # $0001 BRK
+    _write(mpu.memory, 0x0000, (0xEA, 0x00))
+    mpu.run(stopcodes=[0xEA, 0x00], breakpoints=[0x0000])
+    assert 0x0001 == mpu.pc
+
+
+def test_run_matches_step():
+    stepped = _make_mpu()
+    ran = _make_mpu()
+    for mpu in (stepped, ran):
+        _write(mpu.memory, 0x0000, (0xA2, 0x10))  # LDX #$10
+        _write(mpu.memory, 0x0002, (0xBD, 0x00, 0x10))  # LDA $1000,X
+        _write(mpu.memory, 0x0005, (0x69, 0x07))  # ADC #$07
+        _write(mpu.memory, 0x0007, (0x9D, 0x00, 0x20))  # STA $2000,X
+        _write(mpu.memory, 0x000A, (0xCA,))  # DEX
+        _write(mpu.memory, 0x000B, (0xD0, 0xF5))  # BNE $0002
+        _write(mpu.memory, 0x000D, (0x00,))  # BRK
+    while stepped.memory[stepped.pc] != 0x00:
+        stepped.step()
+    ran.run(stopcodes=[0x00])
+    assert repr(stepped) == repr(ran)
+    assert stepped.processorCycles == ran.processorCycles
+    assert stepped.memory == ran.memory
+
+
 # Test Helpers
 
 
@@ -12,6 +12,14 @@ def test_reset_clears_decimal_flag():
     assert 0 == mpu.p & mpu.DECIMAL
 
 
+def test_reset_restarts_stopped_mpu():
+    mpu = _make_mpu()
+    mpu.waiting = mpu.stopped = True
+    mpu.reset()
+    assert not mpu.waiting
+    assert not mpu.stopped
+
+
 # ADC Zero Page, Indirect
 
 
@@ -1521,9 +1529,53 @@ def test_bra_backward():
     assert 3 == mpu.processorCycles  # Crossed boundry
 
 
+# STP
+
+
+def test_stp_sets_waiting_and_stopped():
+    mpu = _make_mpu()
+    # $0204 STP
+    _write(mpu.memory, 0x0204, [0xDB])
+    mpu.pc = 0x0204
+    mpu.step()
+    assert mpu.waiting
+    assert mpu.stopped
+    assert 0x0205 == mpu.pc
+    assert 3 == mpu.processorCycles
+
+
+def test_irq_and_nmi_do_not_wake_stopped_mpu():
+    mpu = _make_mpu()
+    mpu.waiting = mpu.stopped = True
+    mpu.pc = 0x0204
+    mpu.irq()
+    mpu.nmi()
+    assert mpu.waiting
+    assert 0x0204 == mpu.pc
+
+
 # WAI
 
 
+def test_irq_wakes_waiting_mpu_even_when_masked():
+    mpu = _make_mpu()
+    mpu.waiting = True
+    mpu.p |= mpu.INTERRUPT
+    mpu.pc = 0x0205
+    mpu.irq()
+    assert not mpu.waiting
+    assert 0x0205 == mpu.pc
+
+
+def test_nmi_wakes_waiting_mpu():
+    mpu = _make_mpu()
+    mpu.waiting = True
+    _write(mpu.memory, 0xFFFA, (0x88, 0x77))
+    mpu.nmi()
+    assert not mpu.waiting
+    assert 0x7788 == mpu.pc
+
+
 def test_wai_sets_waiting():
     mpu = _make_mpu()
     assert not mpu.waiting
@@ -1536,6 +1588,35 @@ def test_wai_sets_waiting():
     assert 3 == mpu.processorCycles
 
 
+def test_run_returns_when_wai_executed_without_budget():
+    mpu = _make_mpu()
+    # $0204 WAI
+    # $0205 NOP
+    _write(mpu.memory, 0x0204, [0xCB, 0xEA])
+    mpu.pc = 0x0204
+    mpu.run(stopcodes=[0x00])
+    assert mpu.waiting
+    assert 0x0205 == mpu.pc
+    assert 3 == mpu.processorCycles
+
+
+def test_run_while_waiting_consumes_cycle_budget():
+    mpu = _make_mpu()
+    mpu.waiting = True
+    mpu.pc = 0x0204
+    mpu.run(max_cycles=1000)
+    assert mpu.waiting
+    assert 0x0204 == mpu.pc
+    assert 1000 == mpu.processorCycles
+
+
+def test_run_while_waiting_burns_one_cycle_per_instruction():
+    mpu = _make_mpu()
+    mpu.waiting = True
+    mpu.run(max_instructions=10, max_cycles=1000)
+    assert 10 == mpu.processorCycles
+
+
 # Misc
 
 
@@ -1,7 +1,12 @@
+import os
+import shutil
+import tempfile
+
 import pytest
 
-from py65.assembler import Assembler
+from py65.assembler import Assembler, FileAssembler
 from py65.devices.mpu65c02 import MPU as MPU65C02
+from py65.devices.mpu65org16 import MPU as MPU65Org16
 from py65.devices.mpu6502 import MPU
 from py65.utils.addressing import AddressParser
 
@@ -57,6 +62,27 @@ def test_assemble_should_overflow_if_over_top_of_mem():
         assemble("jmp $1234", pc=0xFFFE)
 
 
+def test_assemble_builds_opcode_map_once_per_mpu_class():
+    first = Assembler(MPU())
+    second = Assembler(MPU())
+    assert first._opcodes is second._opcodes
+    assert first._opcodes is not Assembler(MPU65C02())._opcodes
+    assert 0xA9 == first._opcodes[("LDA", "imm")]
+
+
+def test_assemble_prefers_zero_page_over_absolute():
+    assert [0xA5, 0x12] == assemble("lda $0012")
+    # there is no zero page,y mode for lda
+    assert [0xB9, 0x12, 0x00] == assemble("lda $12,y")
+
+
+def test_assemble_splits_operands_by_byte_width():
+    asm = Assembler(MPU65Org16(), AddressParser(maxwidth=32))
+    assert [0xAD, 0x5678, 0x1234] == asm.assemble("lda $12345678")
+    assert [0xA5, 0x1234] == asm.assemble("lda $1234")
+    assert [0xA9, 0xABCD] == asm.assemble("lda #$abcd")
+
+
 def test_assembles_00():
     assert [0x00] == assemble("BRK")
 
@@ -1308,6 +1334,170 @@ def dont_test_assembles_ff():
     pass
 
 
+# FileAssembler
+
+
+def test_file_assembler_resolves_forward_references():
+    segments = assemble_lines(
+        [
+            "        .org $0200",
+            "start   ldx #3",
+            "loop    dex",
+            "        bne loop",
+            "        jmp done",
+            "done:   rts",
+        ]
+    )
+    bytes = [0xA2, 0x03, 0xCA, 0xD0, 0xFD, 0x4C, 0x08, 0x02, 0x60]
+    assert [(0x0200, bytes)] == segments
+
+
+def test_file_assembler_reads_mnemonics_in_first_column_as_instructions():
+    segments = assemble_lines(["*=$0200", "rts", "start lda #1", "inx: nop"])
+    assert [(0x0200, [0x60, 0xA9, 0x01, 0xEA])] == segments
+
+
+def test_file_assembler_uses_zero_page_only_for_defined_addresses():
+    segments = assemble_lines(
+        [
+            "ptr = $10",
+            "  *= $0200",
+            "  lda ptr",
+            "  lda later",
+            "  lda (ptr),y",
+            "later = $20",
+        ]
+    )
+    bytes = [0xA5, 0x10, 0xAD, 0x20, 0x00, 0xB1, 0x10]
+    assert [(0x0200, bytes)] == segments
+
+
+def test_file_assembler_evaluates_expressions():
+    segments = assemble_lines(
+        [
+            "base = $1234",
+            "  lda #<base",
+            "  lda #>base",
+            "  lda #HI(base+$100)",
+            "  lda #'9'+1",
+            "  lda #%101*2-1",
+            "  jmp *",
+            "  lda (base-4)/2,x",
+        ]
+    )
+    bytes = [0xA9, 0x34, 0xA9, 0x12, 0xA9, 0x13, 0xA9, 0x3A, 0xA9, 0x09]
+    bytes += [0x4C, 0x0A, 0x00, 0xBD, 0x18, 0x09]
+    assert [(0x0000, bytes)] == segments
+
+
+def test_file_assembler_emits_data_directives():
+    segments = assemble_lines(
+        [
+            "  .byte 1, $ff, -1, \"a;b\", ','  ; comment",
+            "  .word $1234, end",
+            "  .res 2, $ea",
+            "end",
+        ]
+    )
+    bytes = [0x01, 0xFF, 0xFF, 0x61, 0x3B, 0x62, 0x2C]
+    bytes += [0x34, 0x12, 0x0D, 0x00, 0xEA, 0xEA]
+    assert [(0x0000, bytes)] == segments
+
+
+def test_file_assembler_starts_segments_at_each_origin():
+    asm = FileAssembler(MPU())
+    segments = asm.assemble(
+        ["  .org $0200", "  nop", "  .org $0204", "  .byte 1", "  .end", "  nop"]
+    )
+    assert [(0x0200, [0xEA]), (0x0204, [0x01])] == segments
+    assert (0x0200, [0xEA, 0xFF, 0xFF, 0xFF, 0x01]) == asm.image(0xFF)
+    assert bytearray([0xEA, 0, 0, 0, 1]) == asm.binary()
+
+
+def test_file_assembler_reads_included_files():
+    directory = tempfile.mkdtemp()
+    try:
+        with open(os.path.join(directory, "defs.inc"), "w") as f:
+            f.write("CHROUT = $ffd2\n")
+        with open(os.path.join(directory, "main.asm"), "w") as f:
+            f.write('  .include "defs.inc"\n  jsr CHROUT\n')
+        asm = FileAssembler(MPU())
+        segments = asm.assemble_file(os.path.join(directory, "main.asm"))
+        assert [(0x0000, [0x20, 0xD2, 0xFF])] == segments
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_file_assembler_adds_labels_to_address_parser():
+    address_parser = AddressParser(labels={"chrout": 0xFFD2})
+    asm = FileAssembler(MPU(), address_parser)
+    assert [(0xC000, [0x20, 0xD2, 0xFF])] == asm.assemble(
+        ["start jsr chrout"], origin=0xC000
+    )
+    assert {"start": 0xC000} == asm.labels
+    assert 0xC000 == address_parser.address_for("start")
+
+
+def test_file_assembler_raises_with_line_number():
+    with pytest.raises(SyntaxError) as exc:
+        assemble_lines(["  nop", "  lda missing"], "prog.asm")
+    assert "Label not found: missing" == exc.value.msg
+    assert ("prog.asm", 2) == (exc.value.filename, exc.value.lineno)
+
+
+def test_file_assembler_raises_for_bad_statements():
+    for lines, msg in (
+        (["x nop", "x nop"], "Label already defined: x"),
+        (["  .bogus 1"], "Unknown directive: .bogus"),
+        (["  bne $0100"], "Branch out of range: $0100"),
+        (["  foo $12"], "Syntax error: foo $12"),
+        (["  lda #$100"], "Overflow error: lda #$100"),
+        (["  .byte 256"], "Overflow error: .byte 256"),
+    ):
+        with pytest.raises(SyntaxError) as exc:
+            assemble_lines(lines)
+        assert msg == exc.value.msg
+
+
+def test_file_assembler_writes_intel_hex():
+    asm = FileAssembler(MPU())
+    asm.assemble(["  .org $0200", "  .byte 1, 2, 3"])
+    assert [":03020000010203F5", ":00000001FF"] == asm.intel_hex()
+
+
+def test_file_assembler_writes_intel_hex_variant_for_65org16():
+    # the example image was built when GETSER read $f005 and did not loop
+    source = ["  .org $0200", "another lda $f005", "  eor #$20", "  sta $f001"]
+    asm = FileAssembler(MPU65Org16())
+    asm.assemble(source + ["  jmp another"])
+    assert _example("swapcase.hex") == [line + "\n" for line in asm.intel_hex()]
+
+
+def test_file_assembler_ignores_hxa_directives():
+    asm = FileAssembler(MPU65Org16())
+    asm.assemble_file(os.path.join(EXAMPLES, "swapcase.asm"))
+    # lda GETC, beq another, eor #$20, sta PUTC, jmp another
+    code = [0xA5, 0xF004, 0xF0, 0xFFFC, 0x49, 0x20, 0x85, 0xF001, 0x4C, 0x200, 0]
+    assert [(0x0200, code)] == asm.segments
+    assert 0xF004 == asm.labels["GETC"]
+
+
+def test_file_assembler_builds_65org16_boot_rom():
+    source = "".join(_example("65Org16.boot.asm"))
+    # the example ROM truncates the out of range stack pointer and was
+    # built when GETSER read $f005 and did not loop
+    source = source.replace("#$1FFFF", "#$FFFF")
+    source = source.replace(
+        "GETSER  lda     GETC\n        beq     GETSER\n", "GETSER  lda     GETC+1\n"
+    )
+    asm = FileAssembler(MPU65Org16())
+    asm.assemble(source.splitlines())
+
+    filename = os.path.join(EXAMPLES, "65Org16.boot.rom")
+    with open(filename, "rb") as f:
+        assert bytearray(f.read()) == asm.binary()
+
+
 # Test Helpers
 
 
@@ -1317,3 +1507,17 @@ def assemble(statement, pc=0000, mpu=None):
     address_parser = AddressParser()
     assembler = Assembler(mpu, address_parser)
     return assembler.assemble(statement, pc)
+
+
+def assemble_lines(lines, filename="<source>", mpu=None):
+    if mpu is None:
+        mpu = MPU()
+    return FileAssembler(mpu).assemble(lines, filename)
+
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), "..", "..", "examples")
+
+
+def _example(filename):
+    with open(os.path.join(EXAMPLES, filename)) as f:
+        return f.readlines()
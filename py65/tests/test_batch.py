@@ -0,0 +1,108 @@
+import pytest
+
+from py65.batch import Job, run_job, run_jobs
+
+# Job
+
+
+def test_job_raises_for_unknown_mpu():
+    with pytest.raises(ValueError) as exc:
+        Job(b"", mpu="6809")
+    assert "Unknown MPU: 6809" in str(exc.value)
+
+
+# run_job
+
+
+def test_run_job_returns_registers_cycles_and_memory():
+    # $0200 LDA #$42
+    # $0202 STA $10
+    # $0204 BRK
+    image = bytearray((0xA9, 0x42, 0x85, 0x10, 0x00))
+    job = Job(image, address=0x0200, entry=0x0200, dumps=[(0x10, 0x11)], name="t")
+    result = run_job(job)
+    assert "t" == result["name"]
+    assert "6502" == result["mpu"]
+    assert dict(pc=0x0204, a=0x42, x=0, y=0, sp=0xFF, p=0x30) == result["registers"]
+    assert 5 == result["cycles"]
+    assert "stopcode" == result["stopped"]
+    assert [[0x42, 0x00]] == result["memory"]
+
+
+def test_run_job_starts_at_reset_vector_without_entry():
+    image = bytearray(0x10000)
+    # $0300 INX
+    # $0301 BRK
+    image[0x0300:0x0302] = (0xE8, 0x00)
+    image[0xFFFC:0xFFFE] = (0x00, 0x03)
+    result = run_job(Job(image))
+    assert 0x0301 == result["registers"]["pc"]
+    assert 0x01 == result["registers"]["x"]
+
+
+def test_run_job_captures_output_and_feeds_input():
+    # $0200 LDA $F004
+    # $0203 STA $F001
+    # $0206 BNE $0200
+    # $0208 BRK
+    image = bytearray((0xAD, 0x04, 0xF0, 0x8D, 0x01, 0xF0, 0xD0, 0xF8, 0x00))
+    result = run_job(Job(image, address=0x0200, entry=0x0200, input=b"hi"))
+    assert b"hi\x00" == result["output"]
+
+
+def test_run_job_reports_why_it_stopped():
+    # $0200 INX
+    # $0201 JMP $0200
+    image = bytearray((0xE8, 0x4C, 0x00, 0x02))
+    job = Job(image, address=0x0200, entry=0x0200, max_cycles=100)
+    assert "budget" == run_job(job)["stopped"]
+    job = Job(image, address=0x0200, entry=0x0200, breakpoints=[0x0201])
+    assert "breakpoint" == run_job(job)["stopped"]
+
+
+def test_run_job_on_65c02_reports_waiting():
+    # $0200 WAI
+    image = bytearray((0xCB,))
+    job = Job(image, address=0x0200, entry=0x0200, mpu="65C02", max_cycles=10)
+    result = run_job(job)
+    assert "65C02" == result["mpu"]
+    assert result["waiting"]
+    assert "waiting" == result["stopped"]
+
+
+def test_run_job_on_65org16_loads_wide_values():
+    # $0200 LDA #$1234
+    # $0202 STA $10
+    # $0204 BRK
+    image = [0xA9, 0x1234, 0x85, 0x10, 0x00]
+    job = Job(image, address=0x0200, entry=0x0200, mpu="65Org16", dumps=[(0x10, 0x10)])
+    result = run_job(job)
+    assert [[0x1234]] == result["memory"]
+
+
+def test_run_job_returns_error_instead_of_raising():
+    job = Job(b"", name="broken")
+    job.image = None
+    result = run_job(job)
+    assert "broken" == result["name"]
+    assert "TypeError" in result["error"]
+
+
+# run_jobs
+
+
+def test_run_jobs_returns_results_in_order():
+    jobs = []
+    for count in range(1, 7):
+        # $0200 INX ...
+        # BRK
+        image = bytearray([0xE8] * count + [0x00])
+        jobs.append(Job(image, address=0x0200, entry=0x0200, name=count))
+    for processes in (1, 2):
+        results = run_jobs(jobs, processes=processes)
+        assert list(range(1, 7)) == [r["name"] for r in results]
+        assert list(range(1, 7)) == [r["registers"]["x"] for r in results]
+
+
+def test_run_jobs_with_no_jobs():
+    assert [] == run_jobs([])
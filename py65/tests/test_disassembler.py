@@ -4,16 +4,11 @@ import unittest
 from py65.devices.mpu65c02 import MPU as MPU65C02
 from py65.devices.mpu6502 import MPU
 from py65.disassembler import Disassembler
+from py65.memory import ObservableMemory
 from py65.utils.addressing import AddressParser
 
 
-def _dont_test_disassemble_wraps_after_top_of_mem():
-    """
-    TODO: This test fails with IndexError.  We should fix this
-    so that it does not attempt to index memory out of range.
-    It does not affect most Py65 users because py65mon uses
-    ObservableMemory, which does not raise IndexError.
-    """
+def test_disassemble_wraps_after_top_of_mem():
     mpu = MPU()
     mpu.memory[0xFFFF] = 0x20  # JSR
     mpu.memory[0x0000] = 0xD2  #
@@ -25,6 +20,58 @@ def _dont_test_disassemble_wraps_after_top_of_mem():
     assert "JSR $ffd2" == disasm
 
 
+def test_instructions_lists_range_with_bytes():
+    mpu = MPU()
+    mpu.memory[0x0200:0x0206] = [0xA9, 0x01, 0x8D, 0x00, 0x03, 0x60]
+    dis = Disassembler(mpu)
+    assert [
+        (0x0200, 2, "LDA #$01", bytearray([0xA9, 0x01])),
+        (0x0202, 3, "STA $0300", bytearray([0x8D, 0x00, 0x03])),
+        (0x0205, 1, "RTS", bytearray([0x60])),
+    ] == list(dis.instructions(0x0200, 0x0205))
+
+
+def test_instructions_wraps_when_start_is_above_end():
+    mpu = MPU()
+    mpu.memory[0xFFFE:0x10000] = [0xEA, 0xEA]
+    mpu.memory[0x0000:0x0002] = [0xEA, 0xEA]
+    dis = Disassembler(mpu)
+    addresses = [address for address, _, _, _ in dis.instructions(0xFFFE, 0x0001)]
+    assert [0xFFFE, 0xFFFF, 0x0000, 0x0001] == addresses
+
+
+def test_instructions_does_not_call_read_subscribers():
+    reads = []
+    memory = ObservableMemory()
+    memory.subscribe_to_read_range(0x0000, 0xFFFF, reads.append)
+    memory.write(0x0200, [0xAD, 0x04, 0xF0])
+    dis = Disassembler(MPU(memory=memory))
+    assert "LDA $f004" == list(dis.instructions(0x0200, 0x0200))[0][2]
+    assert (3, "LDA $f004") == dis.instruction_at(0x0200)
+    assert [] == reads
+
+
+def test_instructions_redecodes_changed_bytes():
+    mpu = MPU()
+    dis = Disassembler(mpu)
+    mpu.memory[0x0200:0x0202] = [0xA9, 0x01]
+    assert (2, "LDA #$01") == dis.instruction_at(0x0200)
+    mpu.memory[0x0201] = 0x02
+    assert (2, "LDA #$02") == dis.instruction_at(0x0200)
+    mpu.memory[0x0200] = 0xEA
+    assert (1, "NOP") == dis.instruction_at(0x0200)
+
+
+def test_instructions_uses_labels_added_after_decoding():
+    mpu = MPU()
+    address_parser = AddressParser()
+    dis = Disassembler(mpu, address_parser)
+    mpu.memory[0x0200:0x0203] = [0x20, 0xD2, 0xFF]
+    assert (3, "JSR $ffd2") == dis.instruction_at(0x0200)
+    address_parser.labels["chrout"] = 0xFFD2
+    assert (3, "JSR chrout") == dis.instruction_at(0x0200)
+
+
 def test_disassembles_00():
     length, disasm = disassemble([0x00])
     assert 1 == length
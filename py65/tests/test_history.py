@@ -0,0 +1,254 @@
+import py65.devices.mpu65c02
+import py65.devices.mpu6502
+from py65.devices import fastcore
+from py65.history import History
+from py65.memory import ObservableMemory
+from py65.scheduler import Scheduler
+
+# step
+
+
+def test_step_journals_registers_and_overwritten_memory():
+    mpu = _make_mpu()
+    history = History(mpu)
+    # $0200 LDA #$01
+    # $0202 STA $10
+    _write(mpu.memory, 0x0200, (0xA9, 0x01, 0x85, 0x10))
+    mpu.memory[0x10] = 0x55
+    history.step()
+    history.step()
+    assert 2 == history.executed
+    assert 2 == len(history.journal)
+    state, writes = history.journal[-1]
+    assert (0x0202, 0x01, 0, 0, 0xFF, 0x30, 2, False) == state
+    assert ((0x10, 0x55),) == writes
+
+
+def test_step_takes_checkpoint_every_interval_cycles():
+    mpu = _make_mpu()
+    history = History(mpu, interval=10)
+    # $0200 NOP ...
+    _write(mpu.memory, 0x0200, [0xEA] * 20)
+    for _ in range(12):
+        history.step()
+    assert [0, 5, 10] == [executed for executed, s in history.checkpoints]
+
+
+def test_step_discards_oldest_journal_entries_over_limit():
+    mpu = _make_mpu()
+    history = History(mpu, limit=0)
+    # $0200 NOP
+    _write(mpu.memory, 0x0200, (0xEA,))
+    history.step()
+    assert 0 == len(history.journal)
+    assert 1 == len(history.checkpoints)
+
+
+# run
+
+
+def test_run_stops_at_stopcode_or_breakpoint():
+    mpu = _make_mpu()
+    history = History(mpu)
+    # $0200 INX
+    # $0201 INX
+    # $0202 INX
+    # $0203 BRK
+    _write(mpu.memory, 0x0200, (0xE8, 0xE8, 0xE8, 0x00))
+    history.run(stopcodes=[0x00], breakpoints=[0x0202])
+    assert 0x0202 == mpu.pc
+    history.run(stopcodes=[0x00], breakpoints=[0x0202])
+    assert 0x0203 == mpu.pc
+    assert 3 == history.executed
+
+
+def test_run_returns_at_once_when_waiting():
+    mpu = py65.devices.mpu65c02.MPU(memory=ObservableMemory(), pc=0x0200)
+    history = History(mpu)
+    mpu.waiting = True
+    history.run()
+    assert 0 == history.executed
+
+
+def test_run_wakes_from_wai_on_a_scheduled_interrupt():
+    mpu = py65.devices.mpu65c02.MPU(memory=ObservableMemory(), pc=0x0200)
+    mpu.scheduler = Scheduler(mpu)
+    mpu.scheduler.at(50, lambda cycle: mpu.irq())
+    history = History(mpu)
+    # $0200 CLI
+    # $0201 WAI
+    # $0202 NOP
+    # $0203 BRK
+    # $0300 INX
+    # $0301 RTI
+    _write(mpu.memory, 0x0200, (0x58, 0xCB, 0xEA, 0x00))
+    _write(mpu.memory, 0x0300, (0xE8, 0x40))
+    _write(mpu.memory, 0xFFFE, (0x00, 0x03))
+    history.run(stopcodes=[0x00])
+    assert (0x0203, 1) == (mpu.pc, mpu.x)
+    assert 5 == history.executed
+
+    history.back(5)
+    assert (0x0200, 0, False) == (mpu.pc, mpu.x, mpu.waiting)
+
+
+# back
+
+
+def test_back_undoes_registers_and_memory():
+    mpu = _make_mpu()
+    history = History(mpu)
+    # $0200 LDA #$01
+    # $0202 STA $10
+    # $0204 INC $10
+    _write(mpu.memory, 0x0200, (0xA9, 0x01, 0x85, 0x10, 0xE6, 0x10))
+    for _ in range(3):
+        history.step()
+    assert 0x02 == mpu.memory[0x10]
+
+    assert 2 == history.back(2)
+    assert 0x0202 == mpu.pc
+    assert 0x01 == mpu.a
+    assert 2 == mpu.processorCycles
+    assert 0x00 == mpu.memory[0x10]
+
+    history.step()
+    assert 0x01 == mpu.memory[0x10]
+
+
+def test_back_undoes_writes_made_since_last_instruction():
+    mpu = _make_mpu()
+    history = History(mpu)
+    # $0200 NOP
+    _write(mpu.memory, 0x0200, (0xEA,))
+    history.step()
+    mpu.memory[0x10] = 0x01
+    history.back(1)
+    assert 0x00 == mpu.memory[0x10]
+    assert 0x0200 == mpu.pc
+
+
+def test_back_does_not_call_write_subscribers():
+    mpu = _make_mpu()
+    history = History(mpu)
+    calls = []
+    mpu.memory.subscribe_to_write([0x10], lambda address, value: calls.append(value))
+    # $0200 INC $10
+    _write(mpu.memory, 0x0200, (0xE6, 0x10))
+    history.step()
+    history.back(1)
+    assert [0x01] == calls
+
+
+def test_back_restores_checkpoint_before_discarded_journal():
+    mpu = _make_mpu()
+    history = History(mpu, limit=2000, interval=8)  # journal of 5 entries
+    # $0200 INX ...
+    _write(mpu.memory, 0x0200, [0xE8] * 9)
+    for _ in range(9):
+        history.step()
+    assert 5 == len(history.journal)
+    assert [0, 4, 8] == [executed for executed, s in history.checkpoints]
+
+    assert 7 == history.back(7)  # from the checkpoint at the start
+    assert 2 == history.executed
+    assert 0x0202 == mpu.pc
+    assert 2 == mpu.x
+    assert 2 == len(history.journal)
+    assert 1 == len(history.checkpoints)
+
+
+def test_back_drops_translated_blocks_of_rewritten_code():
+    klass = fastcore.make_translating_mpu(py65.devices.mpu6502.MPU)
+    mpu = klass(memory=ObservableMemory(), pc=0x0300)
+    # $0200 LDX #$01
+    # $0202 JMP $0200
+    # $0300 INC $0201
+    _write(mpu.memory, 0x0200, (0xA2, 0x01, 0x4C, 0x00, 0x02))
+    _write(mpu.memory, 0x0300, (0xEE, 0x01, 0x02))
+    history = History(mpu)
+    history.step()
+    mpu.pc = 0x0200
+    mpu.run(max_instructions=2)
+    assert 2 == mpu.x
+
+    history.back(1)
+    assert 0x01 == mpu.memory[0x0201]
+    mpu.pc = 0x0200
+    mpu.run(max_instructions=2)
+    assert 1 == mpu.x
+
+
+def test_back_stops_at_oldest_history():
+    mpu = _make_mpu()
+    history = History(mpu)
+    # $0200 INX
+    _write(mpu.memory, 0x0200, (0xE8,))
+    history.step()
+    assert 1 == history.back(10)
+    assert 0x0200 == mpu.pc
+    assert 0 == history.back(1)
+
+
+# rewind
+
+
+def test_rewind_goes_to_instruction_started_at_or_before_cycles():
+    mpu = _make_mpu()
+    history = History(mpu)
+    # $0200 INC $10   (5 cycles)
+    # $0202 INC $10
+    # $0204 INC $10
+    _write(mpu.memory, 0x0200, (0xE6, 0x10, 0xE6, 0x10, 0xE6, 0x10))
+    for _ in range(3):
+        history.step()
+    assert 2 == history.rewind(7)
+    assert 5 == mpu.processorCycles
+    assert 0x0202 == mpu.pc
+    assert 0x01 == mpu.memory[0x10]
+
+
+def test_rewind_runs_forward_from_checkpoint_before_discarded_journal():
+    mpu = _make_mpu()
+    history = History(mpu, limit=2000, interval=8)  # journal of 5 entries
+    # $0200 INX ...   (2 cycles)
+    _write(mpu.memory, 0x0200, [0xE8] * 9)
+    for _ in range(9):
+        history.step()
+    assert 6 == history.rewind(7)
+    assert 6 == mpu.processorCycles
+    assert 0x0203 == mpu.pc
+    assert 3 == mpu.x
+
+
+def test_rewind_forgets_checkpoints_after_it():
+    mpu = _make_mpu()
+    history = History(mpu, interval=4)
+    # $0200 NOP ...
+    _write(mpu.memory, 0x0200, [0xEA] * 8)
+    for _ in range(8):
+        history.step()
+    history.rewind(5)
+    assert [0, 2] == [executed for executed, s in history.checkpoints]
+
+
+# close
+
+
+def test_close_stops_recording_writes():
+    mpu = _make_mpu()
+    history = History(mpu)
+    history.close()
+    mpu.memory[0x10] = 0x01
+    assert [] == history._writes
+
+
+# Test Helpers
+
+
+def _write(memory, start_address, bytes):
+    memory[start_address : start_address + len(bytes)] = bytes
+
+
+def _make_mpu():
+    return py65.devices.mpu6502.MPU(memory=ObservableMemory(), pc=0x0200)
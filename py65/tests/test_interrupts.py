@@ -0,0 +1,246 @@
+import py65.devices.mpu65c02
+import py65.devices.mpu6502
+from py65.devices import fastcore
+from py65.interrupts import InterruptLines
+from py65.memory import ObservableMemory
+
+# IRQ
+
+
+def test_irq_is_taken_at_the_next_instruction_boundary():
+    for klass in (py65.devices.mpu6502.MPU, _translating_class()):
+        mpu, lines = _make_mpu_with_lines(klass)
+        _write_program(mpu)
+        # $0200 STA $D000
+        # $0203 NOP ...
+        _write(mpu.memory, 0x0200, [0x8D, 0x00, 0xD0] + [0xEA] * 8)
+        mpu.memory.subscribe_to_write([0xD000], lambda a, v: lines.assert_irq("io"))
+        mpu.run(max_cycles=100, breakpoints=[0x0300])
+        assert 0x0300 == mpu.pc, klass
+        assert 4 + 7 == mpu.processorCycles, klass
+
+
+def test_irq_raised_by_a_read_is_taken_at_the_next_instruction_boundary():
+    for klass in (py65.devices.mpu6502.MPU, _translating_class()):
+        mpu, lines = _make_mpu_with_lines(klass)
+        _write_program(mpu)
+        # $0200 INX
+        # $0201 LDA $D000
+        # $0204 INX ...
+        _write(mpu.memory, 0x0200, [0xE8, 0xAD, 0x00, 0xD0] + [0xE8] * 8)
+        mpu.memory.subscribe_to_read([0xD000], lambda a: lines.assert_irq("io"))
+        mpu.run(max_cycles=100, breakpoints=[0x0300])
+        assert 0x0300 == mpu.pc, klass
+        assert (2 + 4 + 7, 1) == (mpu.processorCycles, mpu.x), klass
+
+
+def test_reads_through_a_pointer_see_the_interpreter_cycle_count():
+    results = []
+    for klass in (py65.devices.mpu6502.MPU, _translating_class()):
+        mpu, lines = _make_mpu_with_lines(klass)
+        _write_program(mpu)
+        # $0200 INX
+        # $0201 LDA ($10),Y
+        # $0203 INX ...
+        _write(mpu.memory, 0x0200, [0xE8, 0xB1, 0x10] + [0xE8] * 8)
+        _write(mpu.memory, 0x0010, (0x00, 0xD0))
+        seen = []
+
+        def read(address):
+            seen.append(mpu.processorCycles)
+            lines.assert_irq("io")
+
+        mpu.memory.subscribe_to_read([0xD000], read)
+        mpu.run(max_cycles=100, breakpoints=[0x0300])
+        results.append((seen, mpu.pc, mpu.processorCycles, mpu.x))
+    assert results[0] == results[1]
+
+
+def test_irq_is_level_triggered():
+    mpu, lines = _make_mpu_with_lines()
+    _write_program(mpu)
+    lines.assert_irq("timer")
+    mpu.run(max_instructions=1)
+    assert 0x0300 == mpu.pc
+    mpu.run(max_instructions=1)  # RTI with the line still held
+    assert 0x0300 == mpu.pc
+
+    lines.deassert_irq("timer")
+    mpu.run(max_instructions=1)
+    assert 0x0200 == mpu.pc
+
+
+def test_irq_line_is_held_until_every_source_deasserts():
+    mpu, lines = _make_mpu_with_lines()
+    _write_program(mpu)
+    lines.assert_irq("timer")
+    lines.assert_irq("serial")
+    lines.deassert_irq("timer")
+    assert set(["serial"]) == lines.irq_sources
+    mpu.run(max_instructions=1)
+    assert 0x0300 == mpu.pc
+
+
+def test_masked_irq_is_taken_once_interrupts_are_enabled():
+    mpu, lines = _make_mpu_with_lines()
+    # $0200 SEI
+    # $0201 NOP
+    # $0202 CLI
+    # $0203 NOP
+    _write(mpu.memory, 0x0200, (0x78, 0xEA, 0x58, 0xEA))
+    _write(mpu.memory, 0xFFFE, (0x00, 0x03))
+    mpu.step()
+    lines.assert_irq("timer")
+    mpu.step()
+    assert 0x0202 == mpu.pc
+    mpu.step()
+    assert 0x0300 == mpu.pc
+
+
+def test_irq_raised_by_an_event_stops_at_a_breakpoint_in_the_handler():
+    mpu, lines = _make_mpu_with_lines()
+    _write_program(mpu)
+    mpu.scheduler.at(100, lambda cycle: lines.assert_irq("timer"))
+    mpu.run(breakpoints=[0x0300])
+    assert 0x0300 == mpu.pc
+    assert 100 + 7 == mpu.processorCycles
+
+
+# NMI
+
+
+def test_nmi_is_edge_triggered():
+    mpu, lines = _make_mpu_with_lines()
+    _write_program(mpu)
+    mpu.p |= mpu.INTERRUPT
+    lines.assert_nmi("button")
+    lines.assert_nmi("watchdog")
+    mpu.step()
+    assert 0x0400 == mpu.pc
+    mpu.step()  # RTI with the line still held
+    assert 0x0201 == mpu.pc
+
+    lines.deassert_nmi("button")
+    lines.deassert_nmi("watchdog")
+    lines.assert_nmi("button")
+    mpu.step()
+    assert 0x0400 == mpu.pc
+
+
+# WAI and STP
+
+
+def test_wai_skips_to_the_event_that_raises_an_irq():
+    for klass in _cmos_classes():
+        mpu, lines = _make_mpu_with_lines(klass)
+        _write_program(mpu)
+        _write(mpu.memory, 0x0200, (0xCB, 0xEA))  # WAI, NOP
+        mpu.scheduler.at(100000, lambda cycle: lines.assert_irq("timer"))
+        mpu.run(breakpoints=[0x0300])
+        assert 0x0300 == mpu.pc, klass
+        assert 100000 + 7 == mpu.processorCycles, klass
+        assert not mpu.waiting, klass
+
+
+def test_wai_with_interrupts_masked_continues_after_wai():
+    mpu, lines = _make_mpu_with_lines(py65.devices.mpu65c02.MPU)
+    _write_program(mpu)
+    _write(mpu.memory, 0x0200, (0xCB, 0xEA, 0xEA))  # WAI, NOP, NOP
+    mpu.p |= mpu.INTERRUPT
+    mpu.scheduler.at(1000, lambda cycle: lines.assert_irq("timer"))
+    mpu.run(max_cycles=2000, breakpoints=[0x0202])
+    assert 0x0202 == mpu.pc
+    assert 1000 + 2 == mpu.processorCycles
+
+
+def test_waiting_mpu_consumes_budget_before_the_next_event():
+    mpu, lines = _make_mpu_with_lines(py65.devices.mpu65c02.MPU)
+    mpu.waiting = True
+    mpu.scheduler.at(1000, lambda cycle: lines.assert_irq("timer"))
+    mpu.run(max_cycles=500)
+    assert mpu.waiting
+    assert 500 == mpu.processorCycles
+
+
+def test_step_while_waiting_skips_to_the_next_event():
+    mpu, lines = _make_mpu_with_lines(py65.devices.mpu65c02.MPU)
+    _write_program(mpu)
+    mpu.waiting = True
+    mpu.scheduler.at(1000, lambda cycle: lines.assert_irq("timer"))
+    mpu.step()
+    assert 0x0300 == mpu.pc
+    assert 1000 + 7 == mpu.processorCycles
+
+
+def test_stp_is_not_woken_by_interrupts():
+    mpu, lines = _make_mpu_with_lines(py65.devices.mpu65c02.MPU)
+    _write_program(mpu)
+    _write(mpu.memory, 0x0200, (0xDB,))  # STP
+    mpu.scheduler.at(100, lambda cycle: lines.assert_irq("timer"))
+    mpu.scheduler.at(200, lambda cycle: lines.assert_nmi("button"))
+    mpu.run(max_cycles=1000)
+    assert mpu.stopped
+    assert 0x0201 == mpu.pc
+    assert 1000 == mpu.processorCycles
+    assert 0 == len(mpu.scheduler)
+
+
+def test_run_without_a_budget_returns_after_stp_with_a_periodic_event():
+    for klass in _cmos_classes():
+        mpu, lines = _make_mpu_with_lines(klass)
+        _write(mpu.memory, 0x0200, (0xEA, 0xDB))  # NOP, STP
+
+        def tick(cycle):
+            mpu.scheduler.at(cycle + 1000, tick)
+
+        mpu.scheduler.at(1000, tick)
+        mpu.run()
+        assert mpu.stopped, klass
+        assert 0x0202 == mpu.pc, klass
+        assert 2 + 3 == mpu.processorCycles, klass
+
+
+def test_step_while_stopped_does_not_skip_to_the_next_event():
+    mpu, lines = _make_mpu_with_lines(py65.devices.mpu65c02.MPU)
+    _write(mpu.memory, 0x0200, (0xDB,))  # STP
+    fired = []
+    mpu.scheduler.at(1000, fired.append)
+    mpu.step()
+    mpu.step()
+    assert mpu.stopped
+    assert 3 + 1 == mpu.processorCycles
+    assert [] == fired
+
+
+# Test Helpers
+
+
+def _write(memory, start_address, bytes):
+    memory[start_address : start_address + len(bytes)] = bytes
+
+
+def _write_program(mpu):
+    # $0200 NOP
+    # $0201 JMP $0200
+    # $0300 RTI (IRQ handler)
+    # $0400 RTI (NMI handler)
+    _write(mpu.memory, 0x0200, (0xEA, 0x4C, 0x00, 0x02))
+    _write(mpu.memory, 0x0300, (0x40,))
+    _write(mpu.memory, 0x0400, (0x40,))
+    _write(mpu.memory, 0xFFFA, (0x00, 0x04))
+    _write(mpu.memory, 0xFFFE, (0x00, 0x03))
+
+
+def _make_mpu_with_lines(klass=py65.devices.mpu6502.MPU):
+    mpu = klass(memory=ObservableMemory(), pc=0x0200)
+    lines = InterruptLines(mpu)
+    return mpu, lines
+
+
+def _cmos_classes():
+    klass = py65.devices.mpu65c02.MPU
+    return (klass, fastcore.make_translating_mpu(klass))
+
+
+def _translating_class():
+    return fastcore.make_translating_mpu(py65.devices.mpu6502.MPU)
@@ -1,4 +1,52 @@
-from py65.memory import ObservableMemory
+import pytest
+
+from py65.memory import (
+    PAGE_SIZE,
+    ObservableMemory,
+    load_pages,
+    make_memory,
+    memory_pages,
+)
+
+# make_memory
+
+
+def test_make_memory_for_8_bit_bytes_is_zeroed_bytearray():
+    memory = make_memory(0x10000)
+    assert isinstance(memory, bytearray)
+    assert 0x10000 == len(memory)
+    assert 0 == max(memory)
+
+
+def test_make_memory_for_16_bit_bytes_holds_16_bit_values():
+    memory = make_memory(0x40000, byteWidth=16)
+    assert 0x40000 == len(memory)
+    memory[0x3FFFF] = 0xFFFF
+    assert 0xFFFF == memory[-1]
+    assert [0x0000, 0xFFFF] == list(memory[-2:])
+
+
+def test_make_memory_slices_like_a_list():
+    memory = make_memory(0x10000)
+    memory[0xC000:0xC003] = [0x01, 0x02, 0x03]
+    assert [0x01, 0x02, 0x03] == list(memory[0xC000:0xC003])
+
+
+# __init__
+
+
+def test___init__default_subject_is_64k_of_8_bit_bytes():
+    mem = ObservableMemory()
+    assert isinstance(mem._subject, bytearray)
+    assert 0x10000 == len(mem._subject)
+
+
+def test___init__default_subject_for_wide_address_is_256k_of_16_bit_bytes():
+    mem = ObservableMemory(addrWidth=32)
+    assert 0x40000 == len(mem._subject)
+    mem[0x3FFFF] = 0xFFFF
+    assert 0xFFFF == mem[0x3FFFF]
+
 
 # __setitem__
 
@@ -80,6 +128,36 @@ def test__subscribe_to_read_does_not_register_same_listener_twice():
     assert ["read_subscriber"] == calls
 
 
+def test___setitem__does_not_grow_subscriber_tables():
+    subject = _make_subject()
+    mem = ObservableMemory(subject=subject)
+
+    def write_subscriber(address, value):
+        return None
+
+    mem.subscribe_to_write([0xC000], write_subscriber)
+
+    for address in range(0xC000, 0xC100):
+        mem[address] = 0xAB
+    assert [0xC000] == list(mem._write_subscribers.keys())
+    assert 0xAB == subject[0xC0FF]
+
+
+def test___setitem__observes_wide_address_pages():
+    mem = ObservableMemory(addrWidth=32)
+
+    calls = []
+
+    def write_subscriber(address, value):
+        calls.append((address, value))
+
+    mem.subscribe_to_write([0x3FFFF], write_subscriber)
+
+    mem[0x3FFFE] = 0x1234
+    mem[0x3FFFF] = 0xABCD
+    assert [(0x3FFFF, 0xABCD)] == calls
+
+
 # __getitem__
 
 
@@ -132,6 +210,40 @@ def test___getitem__calls_all_read_subscribers_uses_last_result():
     assert expected_calls == calls
 
 
+def test___getitem__does_not_grow_subscriber_tables():
+    subject = _make_subject()
+    mem = ObservableMemory(subject=subject)
+
+    def read_subscriber(address):
+        return 0xAB
+
+    mem.subscribe_to_read([0xC000], read_subscriber)
+
+    for address in range(0xC000, 0xC100):
+        mem[address]
+    assert [0xC000] == list(mem._read_subscribers.keys())
+
+
+def test___getitem__on_unobserved_page_ignores_subscribers_elsewhere():
+    subject = _make_subject()
+    mem = ObservableMemory(subject=subject)
+
+    calls = []
+
+    def read_subscriber(address):
+        calls.append(address)
+        return 0xAB
+
+    mem.subscribe_to_read([0xC000], read_subscriber)
+
+    subject[0xC100] = 0x01
+    subject[0xC001] = 0x02
+    assert 0x01 == mem[0xC100]
+    assert 0x02 == mem[0xC001]
+    assert 0xAB == mem[0xC000]
+    assert [0xC000] == calls
+
+
 # __getattr__
 
 
@@ -141,6 +253,350 @@ def test__getattr__proxies_subject():
     assert subject.count == mem.count
 
 
+# subscribe_to_read_range
+
+
+def test_subscribe_to_read_range_covers_all_addresses_in_range():
+    subject = _make_subject()
+    mem = ObservableMemory(subject=subject)
+
+    def read_subscriber(address):
+        return 0xAB
+
+    mem.subscribe_to_read_range(0xC000, 0xCFFF, read_subscriber)
+
+    assert 0xAB == mem[0xC000]
+    assert 0xAB == mem[0xC800]
+    assert 0xAB == mem[0xCFFF]
+    assert 0x00 == mem[0xBFFF]
+    assert 0x00 == mem[0xD000]
+
+
+def test_subscribe_to_read_range_is_stored_as_one_entry():
+    mem = ObservableMemory()
+
+    def read_subscriber(address):
+        return 0xAB
+
+    mem.subscribe_to_read_range(0x0000, 0xFFFF, read_subscriber)
+    assert [(0x0000, 0xFFFF, read_subscriber)] == mem._read_ranges
+    assert {} == mem._read_subscribers
+
+
+def test_subscribe_to_read_range_merges_ranges_of_same_listener():
+    mem = ObservableMemory()
+
+    calls = []
+
+    def read_subscriber(address):
+        calls.append(address)
+
+    mem.subscribe_to_read_range(0xC000, 0xC0FF, read_subscriber)
+    mem.subscribe_to_read_range(0xC080, 0xC1FF, read_subscriber)
+    mem.subscribe_to_read_range(0xC200, 0xC2FF, read_subscriber)
+
+    mem[0xC0C0]
+    assert [0xC0C0] == calls
+    assert [(0xC000, 0xC2FF, read_subscriber)] == mem._read_ranges
+
+
+def test_subscribe_to_read_range_calls_address_subscribers_first():
+    mem = ObservableMemory()
+
+    calls = []
+
+    def read_subscriber_1(address):
+        calls.append("read_subscriber_1")
+        return 0x01
+
+    def read_subscriber_2(address):
+        calls.append("read_subscriber_2")
+        return 0x02
+
+    mem.subscribe_to_read_range(0xC000, 0xC0FF, read_subscriber_2)
+    mem.subscribe_to_read([0xC000], read_subscriber_1)
+
+    assert 0x02 == mem[0xC000]
+    assert ["read_subscriber_1", "read_subscriber_2"] == calls
+
+
+def test_subscribe_to_read_range_raises_for_reversed_range():
+    mem = ObservableMemory()
+
+    def read_subscriber(address):
+        return 0xAB
+
+    with pytest.raises(ValueError):
+        mem.subscribe_to_read_range(0xC001, 0xC000, read_subscriber)
+
+
+# subscribe_to_write_range
+
+
+def test_subscribe_to_write_range_uses_result_of_last_subscriber():
+    subject = _make_subject()
+    mem = ObservableMemory(subject=subject)
+
+    def write_subscriber_1(address, value):
+        return 0x01
+
+    def write_subscriber_2(address, value):
+        return 0x02
+
+    mem.subscribe_to_write_range(0xC000, 0xC0FF, write_subscriber_1)
+    mem.subscribe_to_write_range(0xC080, 0xC0FF, write_subscriber_2)
+
+    mem[0xC000] = 0xAB
+    mem[0xC080] = 0xAB
+    mem[0xC100] = 0xAB
+    assert 0x01 == subject[0xC000]
+    assert 0x02 == subject[0xC080]
+    assert 0xAB == subject[0xC100]
+
+
+# unsubscribe_from_read
+
+
+def test_unsubscribe_from_read_removes_addresses_and_ranges():
+    subject = _make_subject()
+    mem = ObservableMemory(subject=subject)
+
+    def read_subscriber(address):
+        return 0xAB
+
+    mem.subscribe_to_read([0xF004], read_subscriber)
+    mem.subscribe_to_read_range(0xC000, 0xCFFF, read_subscriber)
+    mem.unsubscribe_from_read(read_subscriber)
+
+    assert 0x00 == mem[0xF004]
+    assert 0x00 == mem[0xC000]
+    assert {} == mem._read_subscribers
+    assert [] == mem._read_ranges
+    assert 0 == max(mem._read_pages)
+
+
+def test_unsubscribe_from_read_keeps_other_listeners():
+    mem = ObservableMemory()
+
+    def read_subscriber_1(address):
+        return 0x01
+
+    def read_subscriber_2(address):
+        return 0x02
+
+    mem.subscribe_to_read([0xC000], read_subscriber_1)
+    mem.subscribe_to_read([0xC000], read_subscriber_2)
+    mem.subscribe_to_read_range(0xD000, 0xDFFF, read_subscriber_2)
+    mem.unsubscribe_from_read(read_subscriber_1)
+
+    assert 0x02 == mem[0xC000]
+    assert 0x02 == mem[0xD000]
+
+
+# unsubscribe_from_write
+
+
+def test_unsubscribe_from_write_removes_addresses_and_ranges():
+    subject = _make_subject()
+    mem = ObservableMemory(subject=subject)
+
+    def write_subscriber(address, value):
+        return 0xFF
+
+    mem.subscribe_to_write([0xF001], write_subscriber)
+    mem.subscribe_to_write_range(0xC000, 0xCFFF, write_subscriber)
+    mem.unsubscribe_from_write(write_subscriber)
+
+    mem[0xF001] = 0x01
+    mem[0xC000] = 0x02
+    assert 0x01 == subject[0xF001]
+    assert 0x02 == subject[0xC000]
+    assert 0 == max(mem._write_pages)
+
+
+def test_unsubscribe_from_write_removes_range_of_bound_method():
+    class Device:
+        def write(self, address, value):
+            return 0xFF
+
+    device = Device()
+    mem = ObservableMemory()
+    mem.subscribe_to_write_range(0xC000, 0xCFFF, device.write)
+    mem.unsubscribe_from_write(device.write)
+    mem[0xC000] = 0x02
+    assert 0x02 == mem[0xC000]
+    assert [] == mem._write_ranges
+
+
+# peek
+
+
+def test_peek_does_not_call_read_subscribers():
+    mem = ObservableMemory()
+
+    def read_subscriber(address):
+        raise AssertionError("read subscriber called")
+
+    mem.subscribe_to_read([0xC000], read_subscriber)
+    mem.write(0xC000, [0xAB])
+    assert 0xAB == mem.peek(0xC000)
+    assert 0xAB == mem.peek(0x1C000)
+
+
+def test_peek_block_does_not_call_read_subscribers():
+    mem = ObservableMemory()
+
+    def read_subscriber(address):
+        raise AssertionError("read subscriber called")
+
+    mem.subscribe_to_read_range(0x0000, 0xFFFF, read_subscriber)
+    mem.write(0xFFFF, [0x01])
+    mem.write(0x0000, [0x02, 0x03])
+    assert [0x01, 0x02, 0x03] == list(mem.peek_block(0xFFFF, 3))
+    assert [0x02, 0x03] == list(mem.peek_block(0x10000, 2))
+
+
+# has_read_subscribers
+
+
+def test_has_read_subscribers_checks_addresses_and_ranges():
+    mem = ObservableMemory(subject=_make_subject())
+
+    def read_subscriber(address):
+        return 0xAB
+
+    mem.subscribe_to_read([0xF004], read_subscriber)
+    mem.subscribe_to_read_range(0xD000, 0xD00F, read_subscriber)
+    assert mem.has_read_subscribers(0xF004)
+    assert mem.has_read_subscribers(0xD00F)
+    assert not mem.has_read_subscribers(0xF005)
+    assert not mem.has_read_subscribers(0xD010)
+    assert not mem.has_read_subscribers(0xC000)
+
+
+def test_has_read_subscribers_checks_a_span_of_addresses():
+    mem = ObservableMemory(subject=_make_subject())
+
+    def read_subscriber(address):
+        return 0xAB
+
+    mem.subscribe_to_read([0xF004], read_subscriber)
+    mem.subscribe_to_read_range(0xD000, 0xD00F, read_subscriber)
+    assert mem.has_read_subscribers(0xF000, 0xF0FF)
+    assert mem.has_read_subscribers(0xCFFF, 0xD000)
+    assert not mem.has_read_subscribers(0xD010, 0xF003)
+    assert not mem.has_read_subscribers(0x0000, 0xCFFF)
+
+
+# read_block
+
+
+def test_read_block_copies_unobserved_memory():
+    subject = _make_subject()
+    mem = ObservableMemory(subject=subject)
+
+    subject[0xC000:0xC003] = [0x01, 0x02, 0x03]
+    assert [0x01, 0x02, 0x03] == list(mem.read_block(0xC000, 3))
+
+
+def test_read_block_calls_subscribers_only_for_observed_addresses():
+    subject = _make_subject()
+    mem = ObservableMemory(subject=subject)
+
+    calls = []
+
+    def read_subscriber(address):
+        calls.append(address)
+        return 0xAB
+
+    mem.subscribe_to_read([0xC001], read_subscriber)
+    mem.subscribe_to_read_range(0xC003, 0xC004, read_subscriber)
+
+    subject[0xC000:0xC006] = [0x01, 0x02, 0x03, 0x04, 0x05, 0x06]
+    block = mem.read_block(0xC000, 6)
+    assert [0x01, 0xAB, 0x03, 0xAB, 0xAB, 0x06] == list(block)
+    assert [0xC001, 0xC003, 0xC004] == calls
+    assert 0x02 == subject[0xC001]
+
+
+def test_read_block_wraps_around_top_of_memory():
+    subject = _make_subject()
+    mem = ObservableMemory(subject=subject)
+
+    subject[0xFFFF] = 0x01
+    subject[0x0000] = 0x02
+    assert [0x01, 0x02] == list(mem.read_block(0xFFFF, 2))
+
+
+def test___getitem__with_slice_returns_list():
+    subject = bytearray(0x10000)
+    mem = ObservableMemory(subject=subject)
+
+    subject[0xC000:0xC002] = [0x01, 0x02]
+    assert [0x01, 0x02] == mem[0xC000:0xC002]
+
+
+# write_block
+
+
+def test_write_block_copies_into_unobserved_memory():
+    subject = _make_subject()
+    mem = ObservableMemory(subject=subject)
+
+    mem.write_block(0xC000, [0x01, 0x02, 0x03])
+    assert [0x01, 0x02, 0x03] == subject[0xC000:0xC003]
+
+
+def test_write_block_calls_subscribers_only_for_observed_addresses():
+    subject = _make_subject()
+    mem = ObservableMemory(subject=subject)
+
+    calls = []
+
+    def write_subscriber(address, value):
+        calls.append((address, value))
+        return 0xFF
+
+    mem.subscribe_to_write([0xC001], write_subscriber)
+    mem.subscribe_to_write_range(0xC003, 0xC004, write_subscriber)
+
+    mem.write_block(0xC000, [0x01, 0x02, 0x03, 0x04, 0x05, 0x06])
+    assert [0x01, 0xFF, 0x03, 0xFF, 0xFF, 0x06] == subject[0xC000:0xC006]
+    assert [(0xC001, 0x02), (0xC003, 0x04), (0xC004, 0x05)] == calls
+
+
+def test_write_block_wraps_around_top_of_memory():
+    subject = _make_subject()
+    mem = ObservableMemory(subject=subject)
+
+    mem.write_block(0xFFFF, [0x01, 0x02])
+    assert 0x01 == subject[0xFFFF]
+    assert 0x02 == subject[0x0000]
+
+
+def test_write_block_converts_values_for_16_bit_subject():
+    mem = ObservableMemory(addrWidth=32)
+
+    mem.write_block(0x1000, [0x1234, 0xABCD])
+    assert [0x1234, 0xABCD] == mem[0x1000:0x1002]
+
+
+def test___setitem__with_slice_calls_subscribers():
+    subject = _make_subject()
+    mem = ObservableMemory(subject=subject)
+
+    calls = []
+
+    def write_subscriber(address, value):
+        calls.append((address, value))
+
+    mem.subscribe_to_write([0xC001], write_subscriber)
+
+    mem[0xC000:0xC003] = [0x01, 0x02, 0x03]
+    assert [0x01, 0x02, 0x03] == subject[0xC000:0xC003]
+    assert [(0xC001, 0x02)] == calls
+
+
 # write
 
 
@@ -158,6 +614,100 @@ def test_write_directly_writes_values_to_subject():
     assert 0x02 == subject[0xC001]
 
 
+def test_write_converts_values_for_16_bit_subject():
+    mem = ObservableMemory(addrWidth=32)
+    mem.write(0x1000, [0x1234, 0xABCD])
+    assert 0x1234 == mem[0x1000]
+    assert 0xABCD == mem[0x1001]
+
+
+# memory_pages
+
+
+def test_memory_pages_splits_bytearray_into_bytes_pages():
+    memory = make_memory(0x10000)
+    memory[0x1234] = 0x56
+    pages = memory_pages(memory)
+    assert 0x10000 // PAGE_SIZE == len(pages)
+    assert bytes(bytearray(PAGE_SIZE)) == pages[0]
+    assert 0x56 == bytearray(pages[0x12])[0x34]
+
+
+def test_memory_pages_shares_equal_pages():
+    memory = make_memory(0x10000)
+    pages = memory_pages(memory)
+    assert pages[0] is pages[0xFF]
+
+    memory[0x0000] = 0x01
+    later = memory_pages(memory, pages)
+    assert later[0] is not pages[0]
+    assert later[1] is pages[1]
+
+
+def test_memory_pages_reads_subject_without_subscribers():
+    mem = ObservableMemory()
+
+    def read_subscriber(address):
+        raise AssertionError("read subscriber called")
+
+    mem.subscribe_to_read([0xC000], read_subscriber)
+    mem.write(0xC000, [0xAB])
+    pages = memory_pages(mem)
+    assert 0xAB == bytearray(pages[0xC0])[0]
+
+
+# load_pages
+
+
+def test_load_pages_restores_bytearray_in_place():
+    memory = make_memory(0x10000)
+    memory[0x0200] = 0x42
+    pages = memory_pages(memory)
+    memory[0x0200] = 0x00
+    load_pages(memory, pages)
+    assert 0x42 == memory[0x0200]
+    assert 0x10000 == len(memory)
+
+
+def test_load_pages_restores_16_bit_array():
+    mem = ObservableMemory(addrWidth=32)
+    mem.write(0x3FFFF, [0xABCD])
+    pages = memory_pages(mem)
+    mem.write(0x3FFFF, [0x0000])
+    load_pages(mem, pages)
+    assert 0xABCD == mem[0x3FFFF]
+
+
+def test_load_pages_restores_list():
+    subject = _make_subject()
+    subject[0xFFFF] = 0x99
+    pages = memory_pages(subject)
+    subject[0xFFFF] = 0x00
+    load_pages(subject, pages)
+    assert 0x99 == subject[0xFFFF]
+    assert 0x10000 == len(subject)
+
+
+def test_load_pages_writes_subject_without_subscribers():
+    mem = ObservableMemory()
+    pages = memory_pages(mem)
+
+    def write_subscriber(address, value):
+        raise AssertionError("write subscriber called")
+
+    mem.subscribe_to_write([0xC000], write_subscriber)
+    mem.write(0xC000, [0xAB])
+    load_pages(mem, pages)
+    assert 0x00 == mem[0xC000]
+
+
+def test_load_pages_raises_for_memory_of_another_size():
+    pages = memory_pages(make_memory(0x10000))
+    with pytest.raises(ValueError) as exc:
+        load_pages(make_memory(0x8000), pages)
+    assert "do not fit" in str(exc.value)
+
+
 # Test Helpers
 
 
@@ -1,7 +1,8 @@
 import os
+import sys
 import tempfile
 
-from py65.monitor import Monitor
+from py65.monitor import Monitor, main
 
 try:
     from StringIO import StringIO  # type: ignore[import-error]
@@ -141,6 +142,15 @@ def test_help_add_label():
     assert out.startswith("add_label")
 
 
+def test_do_add_label_and_delete_label_update_label_for():
+    stdout = StringIO()
+    mon = Monitor(stdout=stdout)
+    mon.do_add_label("c000 foo")
+    assert "foo" == mon._address_parser.label_for(0xC000)
+    mon.do_delete_label("foo")
+    assert None == mon._address_parser.label_for(0xC000)
+
+
 # assemble
 
 
@@ -236,6 +246,149 @@ def test_help_assemble():
     assert "assemble <address>" in out
 
 
+# assemble_file
+
+
+def test_assemble_file_writes_memory_and_adds_labels():
+    stdout = StringIO()
+    mon = Monitor(stdout=stdout)
+
+    filename = tempfile.mktemp()
+    try:
+        with open(filename, "w") as f:
+            f.write("  *= $c000\nstart  jmp done\ndone   rts\n")
+        mon.do_assemble_file("'%s'" % filename)
+
+        out = stdout.getvalue()
+        assert "Assembled +4 bytes from $c000 to $c003\n" == out
+        assert [0x4C, 0x03, 0xC0, 0x60] == mon._mpu.memory[0xC000:0xC004]
+        assert "done" == mon._address_parser.label_for(0xC003)
+    finally:
+        os.unlink(filename)
+
+
+def test_assemble_file_saves_intel_hex():
+    stdout = StringIO()
+    mon = Monitor(stdout=stdout)
+
+    filename = tempfile.mktemp()
+    output = tempfile.mktemp() + ".hex"
+    try:
+        with open(filename, "w") as f:
+            f.write("  .org $0200\n  nop\n")
+        mon.do_assemble_file("'%s' '%s'" % (filename, output))
+
+        assert ("Saved %s\n" % output) in stdout.getvalue()
+        with open(output) as f:
+            assert ":01020000EA13\n:00000001FF\n" == f.read()
+    finally:
+        os.unlink(filename)
+        os.unlink(output)
+
+
+def test_assemble_file_shows_error_with_line_number():
+    stdout = StringIO()
+    mon = Monitor(stdout=stdout)
+
+    filename = tempfile.mktemp()
+    try:
+        with open(filename, "w") as f:
+            f.write("  nop\n  lda missing\n")
+        mon.do_assemble_file("'%s'" % filename)
+
+        out = stdout.getvalue()
+        assert "%s:2: Label not found: missing\n" % filename == out
+    finally:
+        os.unlink(filename)
+
+
+def test_assemble_file_with_missing_file_shows_error():
+    stdout = StringIO()
+    mon = Monitor(stdout=stdout)
+    mon.do_assemble_file("/non/existent/source.asm")
+
+    out = stdout.getvalue()
+    assert out.startswith("Cannot load file: [2] ")
+
+
+def test_help_assemble_file():
+    stdout = StringIO()
+    mon = Monitor(stdout=stdout)
+    mon.help_assemble_file()
+
+    out = stdout.getvalue()
+    assert out.startswith("assemble_file")
+
+
+# back
+
+
+def test_shortcut_for_back():
+    stdout = StringIO()
+    mon = Monitor(stdout=stdout)
+    mon.do_help("b")
+
+    out = stdout.getvalue()
+    assert out.startswith("back")
+
+
+def test_do_back_without_history_shows_error():
+    stdout = StringIO()
+    mon = Monitor(stdout=stdout)
+    mon.do_back("")
+
+    out = stdout.getvalue()
+    assert out.startswith("History is off")
+
+
+def test_do_back_rewinds_steps():
+    stdout = StringIO()
+    mon = Monitor(stdout=stdout)
+    mon.do_history("on")
+    mon._mpu.memory[0:3] = [0xE8, 0xE8, 0xE8]  # => INX INX INX
+    mon.do_step("")
+    mon.do_step("")
+    mon.do_step("")
+    mon.do_back("2")
+
+    out = stdout.getvalue()
+    assert "Rewound 2 instructions\n$0001  e8" in out
+    assert 0x0001 == mon._mpu.pc
+    assert 0x01 == mon._mpu.x
+
+
+def test_do_back_rewinds_goto():
+    stdout = StringIO()
+    mon = Monitor(stdout=stdout)
+    mon.do_history("on")
+    mon._mpu.memory[0x0200:0x0205] = [0xA9, 0x01, 0x85, 0x10, 0x00]
+    mon.do_goto("0200")  # => LDA #$01 STA $10 BRK
+    assert 0x01 == mon._mpu.memory[0x10]
+    mon.do_back("1")
+
+    assert 0x0202 == mon._mpu.pc
+    assert 0x00 == mon._mpu.memory[0x10]
+
+
+def test_do_back_with_bad_count_shows_error():
+    stdout = StringIO()
+    mon = Monitor(stdout=stdout)
+    mon.do_history("on")
+    mon.do_back("x")
+
+    out = stdout.getvalue()
+    assert "Illegal count: x" in out
+
+
+def test_help_back():
+    stdout = StringIO()
+    mon = Monitor(stdout=stdout)
+    mon.help_back()
+
+    out = stdout.getvalue()
+    assert out.startswith("back")
+
+
 # cd
 
 
@@ -609,6 +762,131 @@ def test_goto_without_breakpoints_stops_execution_at_brk():
     assert 0x02 == mon._mpu.pc
 
 
+def test_goto_reads_input_in_background_for_getc():
+    stdout = StringIO()
+    mon = Monitor(stdin=StringIO("hi"), stdout=stdout)
+    # $0200 LDA $F004
+    # $0203 BEQ $0200
+    # $0205 STA $1000
+    # $0208 BRK
+    program = [0xAD, 0x04, 0xF0, 0xF0, 0xFB, 0x8D, 0x00, 0x10, 0x00]
+    mon._mpu.memory[0x0200 : 0x0200 + len(program)] = program
+    mon.do_goto("0200")
+    assert ord("h") == mon._mpu.memory[0x1000]
+
+
+def test_goto_flushes_buffered_putc_output_when_stopped():
+    stdout = StringIO()
+    mon = Monitor(stdout=stdout)
+    mon.output.interval = 60
+    # $0200 LDA #$41
+    # $0202 STA $F001
+    # $0205 BRK
+    program = [0xA9, 0x41, 0x8D, 0x01, 0xF0, 0x00]
+    mon._mpu.memory[0x0200 : 0x0200 + len(program)] = program
+    mon.do_goto("0200")
+    assert "A" == stdout.getvalue()
+
+
+def test_putc_output_can_be_redirected():
+    stdout, redirected = StringIO(), StringIO()
+    mon = Monitor(stdout=stdout)
+    mon.output.redirect(redirected)
+    # $0200 LDA #$41
+    # $0202 STA $F001
+    # $0205 BRK
+    program = [0xA9, 0x41, 0x8D, 0x01, 0xF0, 0x00]
+    mon._mpu.memory[0x0200 : 0x0200 + len(program)] = program
+    mon.do_goto("0200")
+    assert "A" == redirected.getvalue()
+    assert "A" not in stdout.getvalue()
+
+
+# headless
+
+
+def test_headless_does_not_show_status_after_commands():
+    stdout = StringIO()
+    mon = Monitor(stdout=stdout, headless=True)
+    mon.onecmd("assemble 0200 lda #$41")
+    assert "$0200  a9 41     LDA #$41\n" == stdout.getvalue()
+
+
+def test_headless_registers_shows_status():
+    stdout = StringIO()
+    mon = Monitor(stdout=stdout, headless=True)
+    mon.onecmd("registers")
+    assert "PC  AC XR YR SP NV-BDIZC" in stdout.getvalue()
+
+
+def test_headless_does_not_switch_console_mode():
+    mon = Monitor(stdout=StringIO(), headless=True)
+    assert mon._input.noncanonical is False
+    assert mon.unbuffered_stdin is None
+
+
+def test_headless_script_reading_getc_leaves_terminal_mode_alone():
+    try:
+        import pty
+        import termios
+    except ImportError:  # Windows
+        return
+    master, slave = pty.openpty()
+    stdin = os.fdopen(slave, "rb", 0)
+    try:
+        before = termios.tcgetattr(slave)
+        mon = Monitor(stdin=stdin, stdout=StringIO(), headless=True)
+        mon.run_script(["mem f000:f00f\n", "quit\n"])
+        assert before == termios.tcgetattr(slave)
+    finally:
+        stdin.close()
+        os.close(master)
+
+
+def test_execute_returns_result_of_command():
+    stdout = StringIO()
+    mon = Monitor(stdout=stdout, headless=True)
+    # $0200 LDA #$41
+    # $0202 STA $F001
+    # $0205 BRK
+    program = [0xA9, 0x41, 0x8D, 0x01, 0xF0, 0x00]
+    mon._mpu.memory[0x0200 : 0x0200 + len(program)] = program
+    result = mon.execute("goto 0200")
+    assert "goto 0200" == result["command"]
+    assert "A" == result["output"]
+    assert result["error"] is None
+    assert 0x0205 == result["registers"]["pc"]
+    assert 0x41 == result["registers"]["a"]
+    assert 6 == result["cycles"]
+    assert result["quit"] is False
+    assert "" == stdout.getvalue()
+
+
+def test_execute_records_errors():
+    mon = Monitor(stdout=StringIO(), headless=True)
+    result = mon.execute("goto bogus_label")
+    assert "KeyError" in result["error"]
+    assert result["error"] in result["output"]
+
+    result = mon.execute("bogus_command")
+    assert "*** Unknown syntax: bogus_command" == result["error"]
+
+
+def test_run_script_skips_blank_lines_and_stops_at_quit():
+    mon = Monitor(stdout=StringIO(), headless=True)
+    lines = [
+        "; a comment\n",
+        "assemble 0200 inx\n",
+        "\n",
+        "quit\n",
+        "assemble 0201 inx\n",
+    ]
+    results = mon.run_script(lines)
+    assert ["assemble 0200 inx", "quit"] == [r["command"] for r in results]
+    assert results[-1]["quit"] is True
+    assert [0xE8, 0x00] == mon._mpu.memory[0x0200:0x0202]
+
+
 # help
 
 
@@ -678,6 +956,66 @@ def test_show_breakpoints_ignores_deleted_breakpoints():
     assert out.startswith("Breakpoint 1: $FFD2")
 
 
+# history
+
+
+def test_do_history_shows_off_initially():
+    stdout = StringIO()
+    mon = Monitor(stdout=stdout)
+    mon.do_history("")
+
+    out = stdout.getvalue()
+    assert out == "History is off\n"
+
+
+def test_do_history_on_with_limit():
+    stdout = StringIO()
+    mon = Monitor(stdout=stdout)
+    mon.do_history("on 2")
+
+    out = stdout.getvalue()
+    assert out.startswith("History is on: 0 instructions, 1 checkpoints")
+    assert out.endswith("of 2048 KB\n")
+    assert 2 * 1024 * 1024 == mon._history.limit
+
+
+def test_do_history_off_stops_recording():
+    stdout = StringIO()
+    mon = Monitor(stdout=stdout)
+    mon.do_history("on")
+    mon.do_history("off")
+
+    assert mon._history is None
+    assert [] == mon._mpu.memory._write_ranges
+    assert "History is off" in stdout.getvalue()
+
+
+def test_do_history_with_bad_args_shows_error():
+    stdout = StringIO()
+    mon = Monitor(stdout=stdout)
+    mon.do_history("sideways")
+
+    out = stdout.getvalue()
+    assert out.startswith("Syntax error: sideways\nhistory")
+
+
+def test_do_reset_turns_history_off():
+    stdout = StringIO()
+    mon = Monitor(stdout=stdout)
+    mon.do_history("on")
+    mon.do_reset("")
+    assert mon._history is None
+
+
+def test_help_history():
+    stdout = StringIO()
+    mon = Monitor(stdout=stdout)
+    mon.help_history()
+
+    out = stdout.getvalue()
+    assert out.startswith("history")
+
+
 # load
 
 
@@ -731,6 +1069,55 @@ def test_help_load():
     assert out.startswith("load")
 
 
+# load_labels
+
+
+def test_load_labels_adds_labels_from_file():
+    stdout = StringIO()
+    mon = Monitor(stdout=stdout)
+
+    filename = tempfile.mktemp()
+    try:
+        with open(filename, "w") as f:
+            f.write("al C:c000 .start\nchrout = $ffd2\nfar = $10000\n")
+        mon.do_load_labels("'%s'" % filename)
+
+        out = stdout.getvalue()
+        msg = "Loaded 2 labels from %s (1 skipped as too wide)\n" % filename
+        assert msg == out
+        assert 0xFFD2 == mon._address_parser.address_for("chrout")
+        assert "start" == mon._address_parser.label_for(0xC000)
+    finally:
+        os.unlink(filename)
+
+
+def test_load_labels_with_missing_file_shows_error():
+    stdout = StringIO()
+    mon = Monitor(stdout=stdout)
+    mon.do_load_labels("/non/existent/labels")
+
+    out = stdout.getvalue()
+    assert out.startswith("Cannot load file: [2] ")
+
+
+def test_load_labels_without_filename_shows_syntax_error():
+    stdout = StringIO()
+    mon = Monitor(stdout=stdout)
+    mon.do_load_labels("")
+
+    out = stdout.getvalue()
+    assert out.startswith("Syntax error")
+
+
+def test_help_load_labels():
+    stdout = StringIO()
+    mon = Monitor(stdout=stdout)
+    mon.help_load_labels()
+
+    out = stdout.getvalue()
+    assert out.startswith("load_labels")
+
+
 # mem
 
 
@@ -793,6 +1180,70 @@ def test_do_mem_wraps_at_terminal_width():
     assert "c000:  00  00\nc002:  00  00\n" == out
 
 
+# engine
+
+
+def test_engine_with_no_args_prints_current_lists_available_engines():
+    stdout = StringIO()
+    mon = Monitor(stdout=stdout)
+    mon.do_engine("")
+
+    lines = stdout.getvalue().splitlines()
+    assert "Current engine is interpreter" == lines[0]
+    assert "Available engines: fast, interpreter, translating" == lines[1]
+
+
+def test_engine_with_bad_arg_gives_error_lists_available_engines():
+    stdout = StringIO()
+    mon = Monitor(stdout=stdout)
+    mon.do_engine("jit")
+
+    lines = stdout.getvalue().splitlines()
+    assert "Unknown engine: jit" == lines[0]
+    assert lines[1].startswith("Available engines:")
+
+
+def test_engine_switches_without_resetting():
+    stdout = StringIO()
+    mon = Monitor(stdout=stdout)
+    mon.do_engine("translating")
+    mon.do_mpu("65C02")
+    mpu = mon._mpu
+    # $c000 INX
+    # $c001 BRK
+    mpu.memory[0xC000:0xC002] = [0xE8, 0x00]
+    mon.do_goto("c000")
+    assert mpu._blocks is not None
+
+    mon.do_engine("interpreter")
+    assert "Running on the interpreter engine" in stdout.getvalue()
+    assert mpu is mon._mpu
+    assert mpu.__class__ is mon.Microprocessors["65C02"]
+    assert (0xC001, 1) == (mpu.pc, mpu.x)
+    mon.do_goto("c000")
+    assert (0xC001, 2) == (mpu.pc, mpu.x)
+
+
+def test_engine_is_kept_when_the_mpu_changes():
+    mon = Monitor(stdout=StringIO())
+    mon.do_engine("fast")
+    mon.do_mpu("65C02")
+    mon.do_reset("")
+    assert "65C02" == mon._mpu.name
+    assert "fast" == mon.engine
+    assert mon._mpu.instruct is not mon.Microprocessors["65C02"].instruct
+
+
+def test_help_engine():
+    stdout = StringIO()
+    mon = Monitor(stdout=stdout)
+    mon.help_engine()
+
+    lines = stdout.getvalue().splitlines()
+    assert "engine\t\tPrint the current and available engines." == lines[0]
+    assert "engine <name>\tRun instructions on a new engine." == lines[1]
+
+
 # mpu
 
 
@@ -905,6 +1356,84 @@ def test_help_pwd():
     assert out.startswith("Show the current working")
 
 
+# profile
+
+
+def test_do_profile_without_profile_shows_error():
+    stdout = StringIO()
+    mon = Monitor(stdout=stdout)
+    mon.do_profile("")
+
+    out = stdout.getvalue()
+    assert out.startswith("No profile")
+
+
+def test_do_profile_flat_shows_hot_addresses_with_labels():
+    stdout = StringIO()
+    mon = Monitor(stdout=stdout)
+    mon.do_profile("on")
+    mon.do_add_label("0202 loop")
+    # $0200 LDX #$03
+    # $0202 DEX
+    # $0203 BNE $0202
+    # $0205 BRK
+    mon._mpu.memory[0x0200:0x0206] = [0xA2, 0x03, 0xCA, 0xD0, 0xFD, 0x00]
+    mon.do_goto("0200")
+    mon.do_profile("flat 2")
+
+    lines = stdout.getvalue().splitlines()
+    assert "Profiling on" == lines[0]
+    assert "      Cycles      %      Count  Address" == lines[1]
+    assert "           8  50.0%          3  $0203" == lines[2]
+    assert "           6  37.5%          3  $0202 loop" == lines[3]
+    assert 4 == len(lines)
+
+
+def test_do_profile_tree_shows_calls():
+    stdout = StringIO()
+    mon = Monitor(stdout=stdout)
+    mon.do_profile("on")
+    # $0200 JSR $0300
+    # $0203 BRK
+    # $0300 RTS
+    mon._mpu.memory[0x0200:0x0204] = [0x20, 0x00, 0x03, 0x00]
+    mon._mpu.memory[0x0300] = 0x60
+    mon.do_goto("0200")
+    mon.do_profile("tree")
+
+    lines = stdout.getvalue().splitlines()
+    assert "       Total         Self    Calls  Routine" == lines[1]
+    assert "          12            6        0  (top)" == lines[2]
+    assert "           6            6        1    $0300" == lines[3]
+
+
+def test_do_profile_off_stops_profiling():
+    stdout = StringIO()
+    mon = Monitor(stdout=stdout)
+    mon.do_profile("on")
+    mon.do_profile("off")
+    assert mon._mpu.tracer is None
+    assert "Profiling off" in stdout.getvalue()
+
+
+def test_do_profile_with_bad_args_shows_error():
+    stdout = StringIO()
+    mon = Monitor(stdout=stdout)
+    mon.do_profile("sideways")
+
+    out = stdout.getvalue()
+    assert out.startswith("Syntax error: sideways\nprofile")
+
+
+def test_help_profile():
+    stdout = StringIO()
+    mon = Monitor(stdout=stdout)
+    mon.help_profile()
+
+    out = stdout.getvalue()
+    assert out.startswith("profile")
+
+
 # radix
 
 
@@ -1078,6 +1607,43 @@ def test_shortcut_for_return():
     assert out.startswith("return")
 
 
+# rewind
+
+
+def test_do_rewind_goes_back_to_cycle():
+    stdout = StringIO()
+    mon = Monitor(stdout=stdout)
+    mon.do_history("on")
+    mon._mpu.memory[0:3] = [0xEA, 0xEA, 0xEA]  # => NOP NOP NOP
+    mon.do_step("")
+    mon.do_step("")
+    mon.do_step("")
+    mon.do_rewind("3")
+
+    out = stdout.getvalue()
+    assert "Rewound 2 instructions" in out
+    assert 2 == mon._mpu.processorCycles
+
+
+def test_do_rewind_with_bad_cycles_shows_error():
+    stdout = StringIO()
+    mon = Monitor(stdout=stdout)
+    mon.do_history("on")
+    mon.do_rewind("x")
+
+    out = stdout.getvalue()
+    assert "Illegal cycle count: x" in out
+
+
+def test_help_rewind():
+    stdout = StringIO()
+    mon = Monitor(stdout=stdout)
+    mon.help_rewind()
+
+    out = stdout.getvalue()
+    assert out.startswith("rewind")
+
+
 # reset
 
 
@@ -1137,6 +1703,24 @@ def test_save():
         os.unlink(filename)
 
 
+def test_save_65org16_writes_msb_first():
+    stdout = StringIO()
+    mon = Monitor(stdout=stdout)
+    mon.do_mpu("65Org16")
+    mon._mpu.memory[0:2] = [0xAABB, 0xCCDD]
+
+    filename = tempfile.mktemp()
+    try:
+        mon.do_save("'%s' 0 1" % filename)
+
+        f = open(filename, "rb")
+        contents = f.read()
+        f.close()
+        assert b"\xaa\xbb\xcc\xdd" == contents
+    finally:
+        os.unlink(filename)
+
+
 def test_help_save():
     stdout = StringIO()
     mon = Monitor(stdout=stdout)
@@ -1352,6 +1936,25 @@ def test_argv_mpu_invalid():
     assert "Fatal: no such MPU." in stdout.getvalue()
 
 
+def test_argv_engine():
+    argv = ["py65mon", "--engine", "translating"]
+    stdout = StringIO()
+    mon = Monitor(argv=argv, stdout=stdout)
+    assert "translating" == mon.engine
+    assert mon.Microprocessors["6502"] is not mon._mpu.__class__
+    assert hasattr(mon._mpu, "drop_blocks")
+
+
+def test_argv_engine_invalid():
+    argv = ["py65mon", "--engine", "bad"]
+    stdout = StringIO()
+    try:
+        Monitor(argv=argv, stdout=stdout)
+    except SystemExit as exc:
+        assert 1 == exc.code
+    assert "Fatal: no such engine." in stdout.getvalue()
+
+
 def test_argv_goto():
     argv = ["py65mon", "--goto", "c000"]
     stdout = StringIO()
@@ -1440,3 +2043,39 @@ def test_argv_combination_rom_mpu():
         assert 0xF002 == mon._mpu.pc
     finally:
         os.unlink(f.name)
+
+
+def test_argv_script_runs_headless():
+    argv = ["py65mon", "--script", "commands.txt"]
+    stdout = StringIO()
+    mon = Monitor(argv=argv, stdout=stdout)
+    assert mon.headless is True
+    assert mon.show_status is False
+    assert mon._input.noncanonical is False
+    assert "commands.txt" == mon.script
+
+
+def test_argv_status():
+    argv = ["py65mon", "--script", "commands.txt", "--status"]
+    stdout = StringIO()
+    mon = Monitor(argv=argv, stdout=stdout)
+    assert mon.show_status is True
+
+
+def test_main_runs_script_and_returns_status():
+    try:
+        with tempfile.NamedTemporaryFile("w", delete=False) as f:
+            f.write("assemble 0200 inx\nbogus_command\nquit\n")
+
+        argv, stdout = sys.argv, sys.stdout
+        sys.argv = ["py65mon", "--script", f.name]
+        sys.stdout = StringIO()
+        try:
+            status = main()
+            out = sys.stdout.getvalue()
+        finally:
+            sys.argv, sys.stdout = argv, stdout
+        assert 1 == status
+        assert "$0200  e8        INX\n*** Unknown syntax: bogus_command\n\n" == out
+    finally:
+        os.unlink(f.name)
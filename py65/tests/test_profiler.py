@@ -0,0 +1,163 @@
+import py65.devices.mpu6502
+from py65.memory import ObservableMemory
+from py65.profiler import Profiler
+
+# flat
+
+
+def test_flat_counts_instructions_and_cycles_per_address():
+    mpu, profiler = _make_profiled_mpu()
+    # $0200 LDX #$03
+    # $0202 DEX
+    # $0203 BNE $0202
+    # $0205 BRK
+    _write(mpu.memory, 0x0200, (0xA2, 0x03, 0xCA, 0xD0, 0xFD, 0x00))
+    mpu.run(stopcodes=[0x00])
+    assert [
+        (0x0203, 3, 8),  # BNE taken twice (3 cycles) and not once (2)
+        (0x0202, 3, 6),
+        (0x0200, 1, 2),
+    ] == profiler.flat()
+    assert [(0x0203, 3, 8)] == profiler.flat(1)
+
+
+def test_flat_includes_cycles_of_last_instruction():
+    mpu, profiler = _make_profiled_mpu()
+    # $0200 INC $10
+    # $0202 INC $10
+    _write(mpu.memory, 0x0200, (0xE6, 0x10, 0xE6, 0x10))
+    mpu.step()
+    assert [(0x0200, 1, 5)] == profiler.flat()
+    mpu.step()
+    assert 10 == sum(cycles for address, count, cycles in profiler.flat())
+
+
+def test_flat_uses_physical_addresses_of_observable_memory():
+    klass = py65.devices.mpu6502.MPU
+    mpu, profiler = _make_profiled_mpu(klass, ObservableMemory())
+    assert 0x10000 == len(profiler.counts)
+
+
+# tree
+
+
+def test_tree_attributes_cycles_to_subroutines():
+    mpu, profiler = _make_profiled_mpu()
+    # $0200 JSR $0300
+    # $0203 JSR $0300
+    # $0206 BRK
+    # $0300 JSR $0400
+    # $0303 RTS
+    # $0400 NOP
+    # $0401 RTS
+    _write(mpu.memory, 0x0200, (0x20, 0x00, 0x03, 0x20, 0x00, 0x03, 0x00))
+    _write(mpu.memory, 0x0300, (0x20, 0x00, 0x04, 0x60))
+    _write(mpu.memory, 0x0400, (0xEA, 0x60))
+    mpu.run(stopcodes=[0x00])
+
+    root = profiler.tree()
+    assert 12 == root.cycles  # the two JSRs to $0300
+    assert [0x0300] == list(root.children.keys())
+    outer = root.children[0x0300]
+    assert (2, 24) == (outer.calls, outer.cycles)  # JSR and RTS
+    inner = outer.children[0x0400]
+    assert (2, 16) == (inner.calls, inner.cycles)  # NOP and RTS
+    assert 40 == outer.total()
+    assert 52 == root.total() == mpu.processorCycles
+
+
+def test_tree_follows_brk_and_rti():
+    mpu, profiler = _make_profiled_mpu()
+    # $0200 BRK
+    # $0201 (signature byte)
+    # $0202 NOP
+    # $0300 RTI
+    _write(mpu.memory, 0x0200, (0x00, 0xEA, 0xEA))
+    _write(mpu.memory, 0x0300, (0x40,))
+    _write(mpu.memory, 0xFFFE, (0x00, 0x03))
+    mpu.run(max_instructions=3)
+
+    root = profiler.tree()
+    handler = root.children[0x0300]
+    assert (1, 6) == (handler.calls, handler.cycles)
+    assert 7 + 2 == root.cycles
+
+
+def test_tree_follows_hardware_interrupts():
+    mpu, profiler = _make_profiled_mpu()
+    # $0200 NOP
+    # $0201 NOP
+    # $0300 RTI
+    _write(mpu.memory, 0x0200, (0xEA, 0xEA))
+    _write(mpu.memory, 0x0300, (0x40,))
+    _write(mpu.memory, 0xFFFE, (0x00, 0x03))
+    mpu.p &= ~mpu.INTERRUPT
+    mpu.step()
+    mpu.irq()
+    mpu.run(max_instructions=2)
+
+    handler = profiler.tree().children[0x0300]
+    assert (1, 6) == (handler.calls, handler.cycles)
+
+
+def test_tree_follows_hardware_interrupts_when_stack_pointer_wraps():
+    mpu, profiler = _make_profiled_mpu()
+    # $0200 NOP
+    # $0300 PHA
+    # $0301 PLA
+    # $0302 RTI
+    _write(mpu.memory, 0x0200, (0xEA,))
+    _write(mpu.memory, 0x0300, (0x48, 0x68, 0x40))
+    _write(mpu.memory, 0xFFFE, (0x00, 0x03))
+    mpu.sp = 0x01
+    mpu.p &= ~mpu.INTERRUPT
+    mpu.step()
+    mpu.irq()
+    mpu.run(max_instructions=3)
+
+    handler = profiler.tree().children[0x0300]
+    assert (1, 3 + 4 + 6) == (handler.calls, handler.cycles)
+
+
+def test_tree_does_not_take_txs_for_a_call():
+    mpu, profiler = _make_profiled_mpu()
+    # $0200 LDX #$80
+    # $0202 TXS
+    # $0203 NOP
+    # $0204 BRK
+    _write(mpu.memory, 0x0200, (0xA2, 0x80, 0x9A, 0xEA, 0x00))
+    mpu.run(stopcodes=[0x00])
+
+    root = profiler.tree()
+    assert {} == root.children
+    assert 6 == root.cycles == mpu.processorCycles
+
+
+def test_tree_unwinds_when_return_address_is_discarded():
+    mpu, profiler = _make_profiled_mpu()
+    # $0200 JSR $0300
+    # $0203 NOP
+    # $0300 PLA
+    # $0301 PLA
+    # $0302 JMP $0203
+    _write(mpu.memory, 0x0200, (0x20, 0x00, 0x03, 0xEA))
+    _write(mpu.memory, 0x0300, (0x68, 0x68, 0x4C, 0x03, 0x02))
+    mpu.run(max_instructions=5)
+
+    root = profiler.tree()
+    assert (1, 4 + 4) == (root.children[0x0300].calls, root.children[0x0300].cycles)
+    assert 6 + 3 + 2 == root.cycles
+
+
+# Test Helpers
+
+
+def _write(memory, start_address, bytes):
+    memory[start_address : start_address + len(bytes)] = bytes
+
+
+def _make_profiled_mpu(klass=py65.devices.mpu6502.MPU, memory=None):
+    mpu = klass(memory=memory, pc=0x0200)
+    profiler = Profiler(mpu)
+    mpu.tracer = profiler
+    return mpu, profiler
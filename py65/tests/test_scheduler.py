@@ -0,0 +1,181 @@
+import py65.devices.mpu65c02
+import py65.devices.mpu6502
+from py65.devices import fastcore
+from py65.memory import ObservableMemory
+from py65.scheduler import NEVER, Scheduler
+
+# at / after
+
+
+def test_events_fire_at_instruction_boundary_after_their_cycle():
+    mpu, scheduler = _make_scheduled_mpu()
+    _write(mpu.memory, 0x0200, [0xEA] * 10)  # NOPs, 2 cycles each
+    fired = []
+    scheduler.at(5, lambda cycle: fired.append((cycle, mpu.processorCycles)))
+    scheduler.after(2, lambda cycle: fired.append((cycle, mpu.processorCycles)))
+    mpu.run(max_instructions=10)
+    assert [(2, 2), (5, 6)] == fired
+    assert NEVER == scheduler.deadline
+    assert 0 == len(scheduler)
+
+
+def test_events_due_at_the_same_cycle_fire_in_order():
+    mpu, scheduler = _make_scheduled_mpu()
+    _write(mpu.memory, 0x0200, [0xEA])
+    fired = []
+    for name in "abc":
+        scheduler.at(2, lambda cycle, name=name: fired.append(name))
+    mpu.step()
+    assert ["a", "b", "c"] == fired
+
+
+def test_cancelled_events_do_not_fire():
+    mpu, scheduler = _make_scheduled_mpu()
+    _write(mpu.memory, 0x0200, [0xEA] * 4)
+    fired = []
+    early = scheduler.at(2, fired.append)
+    scheduler.at(6, fired.append)
+    scheduler.cancel(early)
+    assert 6 == scheduler.deadline
+    assert 1 == len(scheduler)
+    mpu.run(max_instructions=4)
+    assert [6] == fired
+
+
+def test_periodic_event_does_not_drift():
+    mpu, scheduler = _make_scheduled_mpu()
+    _write(mpu.memory, 0x0200, [0xAD, 0x00, 0x10] * 20)  # LDA $1000, 4 cycles
+    fired = []
+
+    def tick(cycle):
+        fired.append(cycle)
+        scheduler.at(cycle + 10, tick)
+
+    scheduler.at(10, tick)
+    mpu.run(max_instructions=20)
+    assert [10, 20, 30, 40, 50, 60, 70, 80] == fired
+
+
+def test_event_scheduled_in_the_past_fires_in_the_same_pass():
+    mpu, scheduler = _make_scheduled_mpu()
+    _write(mpu.memory, 0x0200, [0xEA])
+    fired = []
+    scheduler.at(2, lambda cycle: scheduler.at(1, fired.append))
+    mpu.step()
+    assert [1] == fired
+
+
+# run
+
+
+def test_run_checks_stop_conditions_after_events_fire():
+    mpu, scheduler = _make_scheduled_mpu()
+    # $0200 NOP (loops forever)
+    # $0201 JMP $0200
+    # $0300 RTI
+    _write(mpu.memory, 0x0200, (0xEA, 0x4C, 0x00, 0x02))
+    _write(mpu.memory, 0x0300, (0x40,))
+    _write(mpu.memory, 0xFFFE, (0x00, 0x03))
+    mpu.p &= ~mpu.INTERRUPT
+    scheduler.at(100, lambda cycle: mpu.irq())
+    mpu.run(breakpoints=[0x0300])
+    assert 0x0300 == mpu.pc
+
+
+def test_run_fires_events_due_before_the_first_instruction():
+    mpu, scheduler = _make_scheduled_mpu()
+    _write(mpu.memory, 0x0200, (0xEA, 0xEA))
+    fired = []
+    scheduler.at(0, lambda cycle: fired.append(mpu.processorCycles))
+    mpu.run(stopcodes=[0xEA])
+    assert [0] == fired
+
+
+def test_waiting_mpu_fires_events_within_its_budget():
+    klass = py65.devices.mpu65c02.MPU
+    mpu, scheduler = _make_scheduled_mpu(klass)
+    mpu.waiting = True
+    fired = []
+    scheduler.at(50, fired.append)
+    scheduler.at(150, fired.append)
+    mpu.run(max_cycles=100)
+    assert [50] == fired
+    assert 100 == mpu.processorCycles
+
+
+# translating core
+
+
+def test_translated_blocks_do_not_run_past_events():
+    for klass in (py65.devices.mpu6502.MPU, _translating_mpu_class()):
+        mpu, scheduler = _make_scheduled_mpu(klass, ObservableMemory())
+        # $0200 INX ... (16 times)
+        # $0210 JMP $0200
+        _write(mpu.memory, 0x0200, [0xE8] * 16 + [0x4C, 0x00, 0x02])
+        fired = []
+        scheduler.at(37, lambda cycle: fired.append((mpu.processorCycles, mpu.x)))
+        scheduler.at(101, lambda cycle: fired.append((mpu.processorCycles, mpu.x)))
+        mpu.run(max_cycles=200)
+        assert [(37, 17), (102, 48)] == fired, klass
+
+
+def test_translated_blocks_stop_when_a_write_schedules_an_event():
+    for klass in (py65.devices.mpu6502.MPU, _translating_mpu_class()):
+        mpu, scheduler = _make_scheduled_mpu(klass, ObservableMemory())
+        # $0200 STA $D000
+        # $0203 INX ... (8 times)
+        # $020B JMP $020B
+        _write(mpu.memory, 0x0200, [0x8D, 0x00, 0xD0] + [0xE8] * 8)
+        _write(mpu.memory, 0x020B, (0x4C, 0x0B, 0x02))
+        fired = []
+
+        def start_timer(address, value):
+            scheduler.after(7, lambda cycle: fired.append(mpu.x))
+
+        mpu.memory.subscribe_to_write([0xD000], start_timer)
+        mpu.run(max_cycles=100)
+        assert [2] == fired, klass
+
+
+def test_writes_inside_translated_blocks_see_the_interpreter_cycle_count():
+    results = []
+    for klass in (py65.devices.mpu6502.MPU, _translating_mpu_class()):
+        mpu, scheduler = _make_scheduled_mpu(klass, ObservableMemory())
+        # $0200 LDX #$10
+        # $0202 LDA $1000,X (page crossing)
+        # $0205 INY
+        # $0206 STA $D000
+        # $0209 NOP
+        # $020A STA $D000
+        # $020D JMP $0200
+        program = [0xA2, 0xF0, 0xBD, 0x20, 0x10, 0xC8, 0x8D, 0x00, 0xD0, 0xEA]
+        program += [0x8D, 0x00, 0xD0, 0x4C, 0x00, 0x02]
+        _write(mpu.memory, 0x0200, program)
+        seen = []
+
+        def start_timer(address, value):
+            seen.append(("write", mpu.processorCycles))
+            scheduler.after(3, lambda cycle: seen.append(("fire", cycle, mpu.y)))
+
+        mpu.memory.subscribe_to_write([0xD000], start_timer)
+        mpu.run(max_cycles=200)
+        results.append(seen)
+    assert results[0] == results[1]
+
+
+# Test Helpers
+
+
+def _write(memory, start_address, bytes):
+    memory[start_address : start_address + len(bytes)] = bytes
+
+
+def _make_scheduled_mpu(klass=py65.devices.mpu6502.MPU, memory=None):
+    mpu = klass(memory=memory, pc=0x0200)
+    scheduler = Scheduler(mpu)
+    mpu.scheduler = scheduler
+    return mpu, scheduler
+
+
+def _translating_mpu_class():
+    return fastcore.make_translating_mpu(py65.devices.mpu6502.MPU)
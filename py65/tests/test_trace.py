@@ -0,0 +1,166 @@
+import io
+import os
+import tempfile
+
+import pytest
+
+import py65.devices.mpu65org16
+import py65.devices.mpu6502
+import py65.trace
+from py65.devices import fastcore
+from py65.memory import ObservableMemory
+from py65.trace import TraceReader, TraceWriter, main
+
+try:
+    from StringIO import StringIO  # type: ignore[import-error]
+except ImportError:  # Python 3
+    from io import StringIO
+
+# TraceWriter
+
+
+def test_step_records_state_before_each_instruction():
+    mpu, trace = _make_traced_mpu()
+    # $0200 LDA #$01
+    # $0202 INX
+    _write(mpu.memory, 0x0200, (0xA9, 0x01, 0xE8))
+    mpu.step()
+    mpu.step()
+    mpu.tracer.close()
+
+    records = TraceReader(trace).records()
+    assert [
+        (0x0200, 0xA9, 0x00, 0x00, 0x00, 0xFF, 0x30, 0),
+        (0x0202, 0xE8, 0x01, 0x00, 0x00, 0xFF, 0x30, 2),
+    ] == records
+
+
+def test_run_records_each_instruction():
+    mpu, trace = _make_traced_mpu()
+    # $0200 INX
+    # $0201 BNE $0200
+    _write(mpu.memory, 0x0200, (0xE8, 0xD0, 0xFD))
+    mpu.run(max_instructions=100)
+    mpu.tracer.close()
+
+    reader = TraceReader(trace)
+    assert 100 == len(reader)
+    assert (0x0201, 0xD0, 0x00, 0x32, 0x00, 0xFF, 0x30, 247) == reader.records(99)[0]
+
+
+def test_translating_mpu_records_each_instruction():
+    klass = fastcore.make_translating_mpu(py65.devices.mpu6502.MPU)
+    mpu, trace = _make_traced_mpu(klass, ObservableMemory())
+    # $0200 INX
+    # $0201 JMP $0200
+    _write(mpu.memory, 0x0200, (0xE8, 0x4C, 0x00, 0x02))
+    mpu.run(max_instructions=10)
+    mpu.tracer.close()
+    assert 10 == len(TraceReader(trace))
+
+
+def test_writer_hands_full_chunks_to_thread(monkeypatch):
+    monkeypatch.setattr(py65.trace, "CHUNK_SIZE", 100)
+    trace = io.BytesIO()
+    writer = TraceWriter(trace)
+    for cycles in range(50):
+        writer.record(0x0200, 0xEA, 0, 0, 0, 0xFF, 0x30, cycles)
+    writer.close()
+
+    records = TraceReader(trace).records()
+    assert list(range(50)) == [record[-1] for record in records]
+
+
+def test_writer_records_16_bit_registers():
+    klass = py65.devices.mpu65org16.MPU
+    mpu, trace = _make_traced_mpu(klass, ObservableMemory(addrWidth=32))
+    mpu.pc = 0x12345
+    mpu.a = 0xABCD
+    # $12345 NOP
+    mpu.memory[0x12345] = 0xEA
+    mpu.step()
+    mpu.tracer.close()
+
+    reader = TraceReader(trace)
+    assert "65Org16" == reader.name
+    assert (0x12345, 0xEA, 0xABCD) == reader.records()[0][:3]
+
+
+# TraceReader
+
+
+def test_reader_raises_for_other_files():
+    with pytest.raises(ValueError) as exc:
+        TraceReader(io.BytesIO(b"not a trace file"))
+    assert "Not a py65 trace" in str(exc.value)
+
+
+def test_records_returns_slices():
+    trace = io.BytesIO()
+    writer = TraceWriter(trace)
+    for cycles in range(10):
+        writer.record(0x0200, 0xEA, 0, 0, 0, 0xFF, 0x30, cycles)
+    writer.close()
+
+    reader = TraceReader(trace)
+    assert [2, 3, 4] == [record[-1] for record in reader.records(2, 5)]
+    assert [8, 9] == [record[-1] for record in reader.records(-2)]
+    assert [] == reader.records(5, 2)
+
+
+def test_format_disassembles_with_operands_from_image():
+    mpu, trace = _make_traced_mpu()
+    # $0200 LDA #$42
+    # $0202 STA $1234
+    _write(mpu.memory, 0x0200, (0xA9, 0x42, 0x8D, 0x34, 0x12))
+    mpu.run(max_instructions=2)
+    mpu.tracer.close()
+
+    image = mpu.memory[0x0200:0x0205]
+    lines = TraceReader(trace).format(image=image, address=0x0200)
+    assert [
+        "         0  $0200  LDA #$42        00 00 00 ff 00110000",
+        "         2  $0202  STA $1234       42 00 00 ff 00110000",
+    ] == lines
+
+
+# main
+
+
+def test_main_prints_requested_records():
+    mpu, trace = _make_traced_mpu()
+    # $0200 INX ...
+    _write(mpu.memory, 0x0200, [0xE8] * 10)
+    mpu.run(max_instructions=10)
+    mpu.tracer.close()
+
+    filename = tempfile.mktemp()
+    try:
+        with open(filename, "wb") as f:
+            f.write(trace.getvalue())
+        stdout = StringIO()
+        assert 0 == main(["py65trace", "-s", "-2", "-n", "1", filename], stdout)
+        assert "        16  $0208  INX" in stdout.getvalue()
+        assert 1 == len(stdout.getvalue().splitlines())
+    finally:
+        os.unlink(filename)
+
+
+def test_main_shows_usage_without_file():
+    stdout = StringIO()
+    assert 1 == main(["py65trace"], stdout)
+    assert stdout.getvalue().startswith("Usage")
+
+
+# Test Helpers
+
+
+def _write(memory, start_address, bytes):
+    memory[start_address : start_address + len(bytes)] = bytes
+
+
+def _make_traced_mpu(klass=py65.devices.mpu6502.MPU, memory=None):
+    mpu = klass(memory=memory, pc=0x0200)
+    trace = io.BytesIO()
+    mpu.tracer = TraceWriter(trace, mpu.name)
+    return mpu, trace
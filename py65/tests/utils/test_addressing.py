@@ -1,3 +1,5 @@
+import pickle
+
 import pytest
 
 from py65.utils.addressing import AddressParser
@@ -181,6 +183,69 @@ def test_label_for_returns_alternate_default():
     assert "foo" == parser.label_for(0xFFD2, "foo")
 
 
+def test_label_for_returns_first_label_at_address():
+    parser = AddressParser(labels={"a": 0xC000, "b": 0xC000})
+    assert "a" == parser.label_for(0xC000)
+    del parser.labels["a"]
+    assert "b" == parser.label_for(0xC000)
+
+
+def test_label_for_follows_assigned_labels():
+    parser = AddressParser()
+    parser.labels = {"foo": 0xC000}
+    assert "foo" == parser.label_for(0xC000)
+    parser.labels["foo"] = 0xD000
+    assert None == parser.label_for(0xC000)
+    assert "foo" == parser.label_for(0xD000)
+
+
+# labels
+
+
+def test_labels_index_follows_every_change():
+    parser = AddressParser()
+    labels = parser.labels
+    labels.update({"a": 0x10, "b": 0x20}, c=0x30)
+    labels.setdefault("d", 0x40)
+    assert 0x20 == labels.pop("b")
+    assert None == labels.pop("b", None)
+    labels["a"] = 0x50
+    assert [None, None, "c", "d", "a"] == [
+        parser.label_for(address) for address in (0x10, 0x20, 0x30, 0x40, 0x50)
+    ]
+
+    labels.popitem()
+    labels |= {"e": 0x60}
+    assert "e" == parser.label_for(0x60)
+    labels.clear()
+    assert None == parser.label_for(0x30)
+
+
+def test_labels_keep_dictionary_order_at_same_address():
+    parser = AddressParser(labels={"a": 0x10, "b": 0x20})
+    parser.labels["a"] = 0x20
+    assert "a" == parser.label_for(0x20)
+
+
+def test_labels_moved_between_shared_addresses_keep_dictionary_order():
+    parser = AddressParser(labels={"a": 0x10, "b": 0x20, "c": 0x10, "d": 0x20})
+    labels = parser.labels
+    labels["c"] = 0x20
+    assert "b" == parser.label_for(0x20)
+    labels["b"] = 0x10
+    assert "a" == parser.label_for(0x10)
+    assert "c" == parser.label_for(0x20)
+    del labels["a"]
+    assert "b" == parser.label_for(0x10)
+
+
+def test_labels_can_be_pickled():
+    parser = AddressParser(labels={"chrout": 0xFFD2})
+    labels = pickle.loads(pickle.dumps(parser.labels))
+    assert {"chrout": 0xFFD2} == labels
+    assert "chrout" == labels.label_for(0xFFD2)
+
+
 # range
 
 
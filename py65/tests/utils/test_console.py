@@ -1 +1,147 @@
-# this file is a stub
+import os
+import sys
+import time
+
+import pytest
+
+from py65.utils.console import BufferedOutput, InputReader
+
+try:
+    from StringIO import StringIO  # type: ignore[import-error]
+except ImportError:  # Python 3
+    from io import StringIO
+
+posix_only = pytest.mark.skipif(
+    sys.platform[:3] == "win", reason="console input is read with msvcrt on win32"
+)
+
+# InputReader
+
+
+@posix_only
+def test_input_reader_reads_in_background():
+    reader = InputReader(StringIO("ab\n"))
+    reader.start()
+    try:
+        assert ["a", "b", "\r"] == _read_chars(reader, 3)
+        assert "" == reader.getch_noblock()
+    finally:
+        reader.stop()
+
+
+@posix_only
+def test_input_reader_returns_empty_string_without_waiting():
+    r, w = os.pipe()
+    stdin = os.fdopen(r, "rb", 0)
+    reader = InputReader(stdin)
+    reader.start()
+    try:
+        start = time.time()
+        assert "" == reader.getch_noblock()
+        assert time.time() - start < InputReader.TIMEOUT
+
+        os.write(w, b"x")
+        assert ["x"] == _read_chars(reader, 1)
+    finally:
+        reader.stop()
+        stdin.close()
+        os.close(w)
+
+
+@posix_only
+def test_input_reader_keeps_unread_characters_after_stop():
+    reader = InputReader(StringIO("xy"))
+    reader.start()
+    assert ["x"] == _read_chars(reader, 1)
+    _wait_for_buffered(reader)
+    reader.stop()
+    assert "y" == reader.getch_noblock()
+
+
+def test_input_reader_stop_without_start_does_nothing():
+    reader = InputReader(StringIO())
+    reader.stop()
+
+
+# BufferedOutput
+
+
+def test_buffered_output_writes_at_linefeed():
+    stream = StringIO()
+    output = BufferedOutput(stream, interval=60)
+    for char in "hi":
+        output.write(ord(char))
+    assert "" == stream.getvalue()
+    output.write(10)
+    assert "hi\n" == stream.getvalue()
+
+
+def test_buffered_output_writes_when_full():
+    stream = StringIO()
+    output = BufferedOutput(stream, size=3, interval=60)
+    for char in "abcd":
+        output.write(ord(char))
+    assert "abc" == stream.getvalue()
+    output.flush()
+    assert "abcd" == stream.getvalue()
+
+
+def test_buffered_output_writes_after_interval_without_another_write():
+    stream = StringIO()
+    output = BufferedOutput(stream, interval=0.01)
+    output.write(ord("a"))
+    assert "" == stream.getvalue()
+    deadline = time.time() + 5
+    while not stream.getvalue() and time.time() < deadline:
+        time.sleep(0.001)
+    assert "a" == stream.getvalue()
+    output.write(ord("b"))
+    output.flush()
+    assert "ab" == stream.getvalue()
+
+
+def test_buffered_output_redirect_flushes_to_old_stream():
+    old, new = StringIO(), StringIO()
+    output = BufferedOutput(old, interval=60)
+    output.write(ord("a"))
+    output.redirect(new)
+    output.write(ord("b"))
+    output.flush()
+    assert ("a", "b") == (old.getvalue(), new.getvalue())
+
+
+def test_buffered_output_replaces_unencodable_characters():
+    stream = _AsciiStream()
+    output = BufferedOutput(stream, interval=60)
+    for value in (ord("a"), 0xE9, ord("b")):
+        output.write(value)
+    output.flush()
+    assert "a?b" == "".join(stream.written)
+
+
+# Test Helpers
+
+
+def _read_chars(reader, count, timeout=5):
+    chars = []
+    deadline = time.time() + timeout
+    while len(chars) < count and time.time() < deadline:
+        char = reader.getch_noblock()
+        if char:
+            chars.append(char)
+    return chars
+
+
+def _wait_for_buffered(reader, timeout=5):
+    deadline = time.time() + timeout
+    while not reader._chars and time.time() < deadline:
+        time.sleep(0.001)
+
+
+class _AsciiStream:
+    def __init__(self):
+        self.written = []
+
+    def write(self, text):
+        text.encode("ascii")  # raises UnicodeEncodeError on Python 3
+        self.written.append(text)
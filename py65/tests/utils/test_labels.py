@@ -0,0 +1,82 @@
+from py65.utils.addressing import AddressParser
+from py65.utils.labels import load_labels, read_labels
+
+# read_labels
+
+
+def test_read_labels_reads_vice_labels():
+    lines = [
+        "al C:c000 .start\n",
+        "al 00FFD2 .chrout\n",
+        "al C:0010 loop\n",
+    ]
+    assert [("start", 0xC000), ("chrout", 0xFFD2), ("loop", 0x10)] == list(
+        read_labels(lines)
+    )
+
+
+def test_read_labels_reads_ca65_debug_file_labels():
+    lines = [
+        "version\tmajor=2,minor=0\n",
+        'seg\tid=0,name="CODE",start=0x00C000,size=0x0010,addrsize=absolute\n',
+        'sym\tid=0,name="start",addrsize=absolute,scope=0,def=1,val=0xC000,'
+        "seg=0,type=lab\n",
+        'sym\tid=1,name="COUNT",addrsize=zeropage,scope=0,def=2,val=0x10,' "type=equ\n",
+        'sym\tid=2,name="imported",addrsize=absolute,scope=0,ref=3,type=imp\n',
+    ]
+    assert [("start", 0xC000)] == list(read_labels(lines))
+
+
+def test_read_labels_reads_acme_and_64tass_symbol_lists():
+    lines = [
+        "\tstart\t= $c000\n",
+        "\tunused\t= $c010\t; ?\n",
+        "count           = 16\n",
+        "vector = 0xFFFE\n",
+        "; comment\n",
+        "\n",
+    ]
+    assert [
+        ("start", 0xC000),
+        ("unused", 0xC010),
+        ("count", 16),
+        ("vector", 0xFFFE),
+    ] == list(read_labels(lines))
+
+
+def test_read_labels_is_lazy():
+    def lines():
+        yield "al C:c000 .start\n"
+        raise AssertionError("read too far")
+
+    assert ("start", 0xC000) == next(read_labels(lines()))
+
+
+# load_labels
+
+
+def test_load_labels_adds_labels_to_parser():
+    parser = AddressParser()
+    added, skipped = load_labels(parser, ["al C:ffd2 .chrout\n"])
+    assert (1, 0) == (added, skipped)
+    assert 0xFFD2 == parser.address_for("chrout")
+    assert "chrout" == parser.label_for(0xFFD2)
+
+
+def test_load_labels_skips_addresses_wider_than_parser():
+    parser = AddressParser(maxwidth=16)
+    added, skipped = load_labels(parser, ["far = $10000\n", "near = $ffff\n"])
+    assert (1, 1) == (added, skipped)
+    assert None == parser.address_for("far")
+
+
+def test_load_labels_reloads_a_large_file_with_aliases():
+    parser = AddressParser()
+    lines = []
+    for address in range(0x1000, 0x1000 + 10000):
+        lines.append("al C:%04x .main%d\n" % (address, address))
+        lines.append("al C:%04x .alias%d\n" % (address, address))
+    for i in range(2):
+        assert (20000, 0) == load_labels(parser, lines)
+    assert "main4096" == parser.label_for(0x1000)
+    assert "main14095" == parser.label_for(0x1000 + 9999)
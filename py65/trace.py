@@ -0,0 +1,191 @@
+"""Usage: python -m py65.trace [options] <trace file>
+
+Print records of an instruction trace written by py65.trace.TraceWriter,
+with each instruction disassembled.
+
+Options:
+-h, --help             : Show this message
+-s, --start <n>        : First record to print, negative counts from the
+                         end (default is 0)
+-n, --count <n>        : Number of records to print (default is all)
+-l, --load <file>      : Read instruction operands from this image
+-a, --address <addr>   : Hex address the image is loaded at (default 0)
+"""
+
+import getopt
+import struct
+import sys
+import threading
+
+from py65.devices.mpu65c02 import MPU as CMOS65C02
+from py65.devices.mpu65org16 import MPU as V65Org16
+from py65.devices.mpu6502 import MPU as NMOS6502
+from py65.disassembler import Disassembler
+from py65.memory import ObservableMemory
+from py65.utils.conversions import itoa
+
+try:
+    from Queue import Queue  # type: ignore[import-not-found]
+except ImportError:  # Python 3
+    from queue import Queue
+
+MPUS = {"6502": NMOS6502, "65C02": CMOS65C02, "65Org16": V65Org16}
+
+# a trace is a header followed by fixed-width records of the state before
+# each instruction: pc, opcode, a, x, y, sp, p, processorCycles
+MAGIC = b"py65trc1"
+HEADER = struct.Struct("<8s8s")
+RECORD = struct.Struct("<IHHHHHHQ")
+
+# bytes of records buffered before they are handed to the writer thread
+CHUNK_SIZE = 1 << 20
+
+
+class TraceWriter:
+    """Write a trace to a binary file object.  Set an MPU's tracer to the
+    writer to record every instruction that it runs.  Records are packed
+    into a buffer by record() and written to the file in chunks by a
+    background thread.  close() must be called to write the last records;
+    it does not close the file.
+    """
+
+    def __init__(self, file, name="6502"):
+        self.file = file
+        file.write(HEADER.pack(MAGIC, name.encode("ascii")))
+        self._buffer = bytearray()
+        self._chunks = Queue(8)
+        self._thread = threading.Thread(target=self._write_chunks)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def record(self, pc, opcode, a, x, y, sp, p, cycles):
+        buffer = self._buffer
+        buffer += RECORD.pack(pc, opcode, a, x, y, sp, p, cycles)
+        if len(buffer) >= CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        """Hand the buffered records to the writer thread."""
+        if self._buffer:
+            self._chunks.put(self._buffer)
+            self._buffer = bytearray()
+
+    def close(self):
+        """Write all records and stop the writer thread."""
+        self.flush()
+        self._chunks.put(None)
+        self._thread.join()
+        self.file.flush()
+
+    def _write_chunks(self):
+        while True:
+            chunk = self._chunks.get()
+            if chunk is None:
+                break
+            self.file.write(chunk)
+
+
+class TraceReader:
+    """Read a trace written by TraceWriter from a binary file object.
+    Records are read on demand, so slices of very long traces are cheap.
+    """
+
+    def __init__(self, file):
+        self.file = file
+        file.seek(0)
+        magic, name = HEADER.unpack(file.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError("Not a py65 trace")
+        self.name = name.rstrip(b"\0").decode("ascii")
+
+    def __len__(self):
+        self.file.seek(0, 2)
+        return (self.file.tell() - HEADER.size) // RECORD.size
+
+    def records(self, start=0, stop=None):
+        """Return the records from index start up to stop as a list of
+        (pc, opcode, a, x, y, sp, p, cycles) tuples.  The indexes work like
+        those of a slice.
+        """
+        start, stop, step = slice(start, stop).indices(len(self))
+        if stop <= start:
+            return []
+        self.file.seek(HEADER.size + start * RECORD.size)
+        data = self.file.read((stop - start) * RECORD.size)
+        return [
+            RECORD.unpack_from(data, offset)
+            for offset in range(0, len(data), RECORD.size)
+        ]
+
+    def format(self, start=0, stop=None, image=(), address=0):
+        """Return a line for each record from index start up to stop with
+        its cycle count, disassembled instruction and registers.  The trace
+        holds only opcodes, so operands are read from image, a sequence of
+        values loaded at address, such as the program that was traced.
+        """
+        klass = MPUS[self.name]
+        memory = ObservableMemory(addrWidth=klass.ADDR_WIDTH)
+        memory.write(address, image)
+        mpu = klass(memory=memory)
+        disassembler = Disassembler(mpu)
+
+        lines = []
+        for pc, opcode, a, x, y, sp, p, cycles in self.records(start, stop):
+            memory.write(pc, [opcode])
+            length, disasm = disassembler.instruction_at(pc)
+            registers = [mpu.BYTE_FORMAT % value for value in (a, x, y, sp)]
+            flags = itoa(p, 2).rjust(mpu.BYTE_WIDTH, "0")
+            line = "%10d  $" + mpu.ADDR_FORMAT + "  %-15s %s %s"
+            lines.append(line % (cycles, pc, disasm, " ".join(registers), flags))
+        return lines
+
+
+def main(argv=None, stdout=None):
+    if argv is None:
+        argv = sys.argv
+    if stdout is None:
+        stdout = sys.stdout
+
+    try:
+        shortopts = "hs:n:l:a:"
+        longopts = ["help", "start=", "count=", "load=", "address="]
+        options, args = getopt.getopt(argv[1:], shortopts, longopts)
+    except getopt.GetoptError as exc:
+        stdout.write("%s\n%s" % (exc.args[0], __doc__))
+        return 1
+
+    start, count, load, address = 0, None, None, 0
+    for opt, value in options:
+        if opt in ("-h", "--help"):
+            stdout.write(__doc__)
+            return 0
+        if opt in ("-s", "--start"):
+            start = int(value)
+        if opt in ("-n", "--count"):
+            count = int(value)
+        if opt in ("-l", "--load"):
+            load = value
+        if opt in ("-a", "--address"):
+            address = int(value, 16)
+
+    if len(args) != 1:
+        stdout.write(__doc__)
+        return 1
+
+    image = ()
+    if load is not None:
+        with open(load, "rb") as f:
+            image = bytearray(f.read())
+
+    with open(args[0], "rb") as f:
+        reader = TraceReader(f)
+        if start < 0:
+            start = max(len(reader) + start, 0)
+        stop = None if count is None else start + count
+        for line in reader.format(start, stop, image, address):
+            stdout.write(line + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,98 @@
 import re
 
 
+class Labels(dict):
+    """A dictionary of label names to addresses that also keeps an index
+    of the labels at each address, so that looking up the label for an
+    address does not search every label.  All of the ways of changing the
+    dictionary keep the index in sync.
+    """
+
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self)
+        self._by_address = {}
+        self._order = {}  # label -> its place in the dictionary
+        self._count = 0
+        self.update(*args, **kwargs)
+
+    def __reduce__(self):
+        return (self.__class__, (dict(self),))
+
+    def __setitem__(self, label, address):
+        if label in self:
+            previous = dict.__getitem__(self, label)
+            dict.__setitem__(self, label, address)
+            if previous == address:
+                return
+            self._unindex(label, previous)
+        else:
+            dict.__setitem__(self, label, address)
+            self._order[label] = self._count
+            self._count += 1
+
+        # the label keeps its place in the dictionary, which may be ahead
+        # of the others at this address
+        labels = self._by_address.setdefault(address, [])
+        order = self._order
+        place = order[label]
+        index = len(labels)
+        while index and order[labels[index - 1]] > place:
+            index -= 1
+        labels.insert(index, label)
+
+    def __delitem__(self, label):
+        address = dict.__getitem__(self, label)
+        dict.__delitem__(self, label)
+        self._unindex(label, address)
+        del self._order[label]
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def update(self, *args, **kwargs):
+        for label, address in dict(*args, **kwargs).items():
+            self[label] = address
+
+    def setdefault(self, label, address=None):
+        if label not in self:
+            self[label] = address
+        return dict.__getitem__(self, label)
+
+    def pop(self, label, *default):
+        if label not in self:
+            if default:
+                return default[0]
+            raise KeyError(label)
+        address = dict.__getitem__(self, label)
+        del self[label]
+        return address
+
+    def popitem(self):
+        label, address = dict.popitem(self)
+        self._unindex(label, address)
+        del self._order[label]
+        return label, address
+
+    def clear(self):
+        dict.clear(self)
+        self._by_address.clear()
+        self._order.clear()
+
+    def label_for(self, address, default=None):
+        """Return the first label at address or a default."""
+        labels = self._by_address.get(address)
+        if labels:
+            return labels[0]
+        return default
+
+    def _unindex(self, label, address):
+        labels = self._by_address[address]
+        labels.remove(label)
+        if not labels:
+            del self._by_address[address]
+
+
 class AddressParser(object):
     """Parse user input into addresses or ranges of addresses."""
 
@@ -13,7 +105,7 @@ class AddressParser(object):
         self.radix = radix
         self.maxwidth = maxwidth
 
-        self.labels = {}
+        self.labels = Labels()
         for k, v in labels.items():
             self.labels[k] = self._constrain(v)
 
@@ -26,16 +118,25 @@ class AddressParser(object):
 
     maxwidth = property(_get_maxwidth, _set_maxwidth)
 
+    def _get_labels(self):
+        return self._labels
+
+    def _set_labels(self, labels):
+        # any mapping may be assigned; it is copied into a Labels unless
+        # it is one already
+        if not isinstance(labels, Labels):
+            labels = Labels(labels)
+        self._labels = labels
+
+    labels = property(_get_labels, _set_labels)
+
     def address_for(self, label, default=None):
         """Given a label, return the corresponding address or a default."""
         return self.labels.get(label, default)
 
     def label_for(self, address, default=None):
         """Given an address, return the corresponding label or a default."""
-        for label, label_address in self.labels.items():
-            if label_address == address:
-                return label
-        return default
+        return self._labels.label_for(address, default)
 
     def number(self, num):
         """Parse a string containing a label or number into an address."""
@@ -1,4 +1,7 @@
 import sys
+import threading
+import time
+from collections import deque
 
 from py65.compat import as_string
 
@@ -38,6 +41,18 @@ if sys.platform[:3] == "win":
             return as_string(getch(stdin))
         return ""
 
+    def getch_timeout(stdin, timeout):
+        """Read one character from the Windows console, waiting at most
+        timeout seconds for one.  Does not echo the character.  The stdin
+        argument is for function signature compatibility and is ignored.
+        If no character is available, an empty string is returned.
+        """
+        if not msvcrt.kbhit():
+            time.sleep(timeout)
+            if not msvcrt.kbhit():
+                return ""
+        return as_string(getch(stdin))
+
 else:
     import os
     import termios
@@ -191,6 +206,165 @@ else:
             char = "\r"
         return char
 
+    def getch_timeout(stdin, timeout):
+        """Read one character from stdin, waiting at most timeout seconds
+        for one.  Does not echo the character or change the input mode.
+        If no character is available, an empty string is returned, and at
+        the end of the input None is returned.
+        """
+        try:
+            stdin.fileno()
+        except Exception:
+            # not a file, such as a StringIO, so reads do not block
+            return as_string(stdin.read(1)) or None
+
+        rd, wr, er = select([stdin], [], [], timeout)
+        if rd == []:
+            return ""
+        return as_string(stdin.read(1)) or None
+
+
+class InputReader:
+    """Read characters from stdin on a background thread into a buffer,
+    so that a program polling for input gets a character or nothing at
+    once instead of waiting on the terminal for every poll.
+
+    Characters are read only between start() and stop(), which should
+    bracket the running of a program so that input meant for the monitor
+    is left alone.  Characters read but not taken by getch_noblock() are
+    kept for the next run.  With noncanonical false, start() leaves the
+    terminal mode alone.
+    """
+
+    # seconds the reader waits for input before checking for stop()
+    TIMEOUT = 0.01
+
+    def __init__(self, stdin, noncanonical=True):
+        self.stdin = stdin
+        self.noncanonical = noncanonical
+        self._chars = deque()
+        self._thread = None
+        self._stopping = None
+
+    def start(self):
+        """Switch to noncanonical mode and start reading."""
+        if self._thread is not None:
+            return
+        if self.noncanonical:
+            noncanonical_mode(self.stdin)
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._read, args=(self._stopping,))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop reading.  Does not restore the input mode."""
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+
+    def getch_noblock(self):
+        """Return the next character read, or an empty string if there is
+        none.  Linefeeds are converted to carriage returns.  When the
+        reader is stopped and its buffer is empty, stdin is polled
+        directly, with getch_noblock() or, if noncanonical is false, with
+        getch_timeout() so that the terminal mode is left alone.
+        """
+        if self._chars:
+            char = self._chars.popleft()
+        elif self._thread is None:
+            if self.noncanonical:
+                return getch_noblock(self.stdin)
+            try:
+                char = getch_timeout(self.stdin, 0)
+            except Exception:
+                char = None
+            if not char:
+                return ""
+        else:
+            return ""
+        if char == "\n":
+            char = "\r"
+        return char
+
+    def _read(self, stopping):
+        while not stopping.is_set():
+            try:
+                char = getch_timeout(self.stdin, self.TIMEOUT)
+            except Exception:
+                break
+            if char is None:
+                break
+            if char:
+                self._chars.append(char)
+
+
+class BufferedOutput:
+    """Collect the characters a program writes and pass them to a stream
+    in batches instead of one write and flush per character.  The stream
+    is any object with a write() method that takes a string, such as
+    sys.stdout, a file opened for text or a StringIO.
+
+    The buffer is flushed on a linefeed, when it holds size characters,
+    at most interval seconds after a character is buffered, by a timer
+    thread, so that a prompt is shown even while the program computes
+    without writing, and on flush().  Call flush() whenever the program
+    stops or waits for input so that everything it wrote is shown.
+    """
+
+    def __init__(self, stream, size=4096, interval=0.1):
+        self.stream = stream
+        self.size = size
+        self.interval = interval
+        self._chars = []
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def write(self, value):
+        """Buffer the character with the code value."""
+        with self._lock:
+            chars = self._chars
+            chars.append(chr(value))
+            if value == 10 or len(chars) >= self.size:
+                self._flush()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.interval, self._expire)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Write the buffered characters to the stream and flush it."""
+        with self._lock:
+            self._flush()
+
+    def redirect(self, stream):
+        """Flush the buffer and send further output to stream."""
+        with self._lock:
+            self._flush()
+            self.stream = stream
+
+    def _expire(self):
+        with self._lock:
+            self._timer = None
+            self._flush()
+
+    def _flush(self):
+        if self._chars:
+            text = "".join(self._chars)
+            self._chars = []
+            try:
+                self.stream.write(text)
+            except UnicodeEncodeError:  # Python 3
+                for char in text:
+                    try:
+                        self.stream.write(char)
+                    except UnicodeEncodeError:
+                        self.stream.write("?")
+            if hasattr(self.stream, "flush"):
+                self.stream.flush()
+
 
 def line_input(prompt="", stdin=sys.stdin, stdout=sys.stdout):
     """Read a line from stdin, printing each character as it is typed.
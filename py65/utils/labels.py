@@ -0,0 +1,61 @@
+import re
+
+# al C:c000 .start                    VICE, ld65 -Ln, 64tass --vice-labels
+_VICE = re.compile(r"^al\s+(?:[A-Za-z]+:)?([0-9A-Fa-f]+)\s+\.?(\S+)")
+
+# sym id=0,name="start",...,val=0xC000,...,type=lab    ca65/ld65 --dbgfile
+_DBG_FIELD = re.compile(r'(\w+)=("[^"]*"|[^,]*)')
+
+# start = $c000                       ACME --symbollist, 64tass --labels
+_ASSIGNMENT = re.compile(
+    r"^\s*([A-Za-z_.@][\w.@]*)\s*=\s*(\$[0-9A-Fa-f]+|0[xX][0-9A-Fa-f]+|\d+)\b"
+)
+
+
+def read_labels(lines):
+    """Read (label, address) pairs from the lines of a symbol file.  VICE
+    label files, ca65 debug files and the "label = value" symbol lists of
+    ACME and 64tass are recognized line by line, so files may be read
+    lazily and the formats may be mixed.  Lines in other forms, such as
+    the other records of a debug file, are skipped.
+    """
+    for line in lines:
+        if line.startswith("al"):
+            match = _VICE.match(line)
+            if match:
+                address, label = match.groups()
+                yield label, int(address, 16)
+
+        elif line.startswith("sym\t"):
+            fields = dict(_DBG_FIELD.findall(line[4:].rstrip()))
+            if fields.get("type") == "lab" and "val" in fields:
+                yield fields["name"].strip('"'), int(fields["val"], 0)
+
+        else:
+            match = _ASSIGNMENT.match(line)
+            if match:
+                label, value = match.groups()
+                if value.startswith("$"):
+                    yield label, int(value[1:], 16)
+                elif value[:2] in ("0x", "0X"):
+                    yield label, int(value[2:], 16)
+                else:
+                    yield label, int(value)
+
+
+def load_labels(parser, lines):
+    """Add the labels read from lines by read_labels() to the labels of
+    an AddressParser.  Returns a tuple of the number of labels added and
+    the number skipped because their addresses are wider than the
+    parser's maxwidth.
+    """
+    labels = parser.labels
+    maxaddr = (1 << parser.maxwidth) - 1
+    added = skipped = 0
+    for label, address in read_labels(lines):
+        if address > maxaddr:
+            skipped += 1
+        else:
+            labels[label] = address
+            added += 1
+    return added, skipped